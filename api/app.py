@@ -1,78 +1,283 @@
-from flask import Flask, render_template, request, jsonify, make_response, redirect, url_for
+from flask import Flask, render_template, request, jsonify, make_response, redirect, url_for, Response, g
+from markupsafe import Markup
 import os
 import hashlib
+import hmac
 import json
+import csv
+import gzip
+import io
+import queue
+import time
 from datetime import datetime
+from functools import wraps
+from urllib.parse import quote
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 import db
+import events
+import grading
+import passwords
+import sessions
+import rating
+import search
+from cache import LRUCache, VersionedCache
 
 app = Flask(__name__)
+# Vercel terminates TLS in front of the function: trust its X-Forwarded-Proto so
+# request.is_secure (and the session cookie's Secure flag) reflect the client's scheme
+app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1)
 app.config['JSON_SORT_KEYS'] = False
 
 # Database access is provided by `api/db.py` (SQLAlchemy).
 
-# Helper function to hash password
+# Helper function to hash password into the client credential (the same SHA-256
+# auth.js computes); what is stored in "user".pwhash comes from `passwords`
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
-# Helper function to check authentication
-def check_auth(uid, pw_hash):
-    print(uid,pw_hash)
+# Cache of uid -> auth info (id, username, type, pwhash) for active (non-deleted)
+# users, plus the last credential that verified against pwhash so the KDF only
+# runs on a cache miss. Entries are dropped by every route that changes a
+# password or the deleted flag; the TTL bounds how long other instances can
+# keep a stale entry.
+auth_cache = LRUCache(
+    maxsize=int(os.getenv('AUTH_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('AUTH_CACHE_TTL', '60'))
+)
+
+def invalidate_auth(uid):
+    auth_cache.delete(int(uid))
+
+# Ranks come from the `leaderboard` materialized view (see SUPABASE_MIGRATION.md),
+# refreshed whenever ratings or the set of active users change. The rendered
+# top-100 table is cached per process on top of it.
+LEADERBOARD_SIZE = 100
+leaderboard_cache = LRUCache(maxsize=1, ttl=float(os.getenv('LEADERBOARD_CACHE_TTL', '30')))
+
+# The leaderboard view is refreshed lazily: writes that change ratings or the
+# set of ranked users only mark it dirty (in their own transaction), and the
+# pages that read it refresh it when it is dirty, at most once every
+# LEADERBOARD_REFRESH_SECONDS across all instances. Each process checks the
+# flag at most that often too.
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv('LEADERBOARD_REFRESH_SECONDS', '10'))
+_leaderboard_checked = 0.0
+
+def mark_leaderboard_dirty(tx):
+    tx.execute('UPDATE leaderboard_state SET dirty = true WHERE id = 1 AND NOT dirty')
+
+def refresh_leaderboard():
+    global _leaderboard_checked
+    now = time.monotonic()
+    if now - _leaderboard_checked < LEADERBOARD_REFRESH_SECONDS:
+        return
+    _leaderboard_checked = now
     try:
-        user = db.fetchone('SELECT * FROM "user" WHERE id = :id AND pwhash = :pwhash AND deleted = 0', {'id': uid, 'pwhash': pw_hash})
-        return user is not None
+        # Only one instance claims each refresh; writes after the claim mark it dirty again
+        claimed = db.execute("""
+            UPDATE leaderboard_state SET dirty = false, refreshed_at = now()
+            WHERE id = 1 AND dirty AND refreshed_at <= now() - make_interval(secs => :seconds)
+        """, {'seconds': LEADERBOARD_REFRESH_SECONDS})
+        if not claimed:
+            return
+        try:
+            db.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY leaderboard')
+        except Exception:
+            db.execute('UPDATE leaderboard_state SET dirty = true WHERE id = 1')
+            raise
+        leaderboard_cache.clear()
+    except Exception as e:
+        print(f"Leaderboard refresh error: {e}")
+
+# Helper function to authenticate a uid/pwhash pair; returns the user (id, username, type) or None.
+# passwords.Busy propagates: the credentials were not rejected, so callers answer 503.
+def authenticate(uid, pw_hash):
+    try:
+        uid = int(uid)
+        user = auth_cache.get(uid)
+        if user is None:
+            user = db.fetchone('SELECT id, username, type, pwhash, token_version FROM "user" WHERE id = :id AND deleted = false', {'id': uid})
+            if user is None:
+                return None
+            auth_cache.set(uid, user)
+        verified = user.get('verified')
+        if not (verified and hmac.compare_digest(verified, pw_hash)):
+            if not passwords.verify(pw_hash, user['pwhash']):
+                return None
+            auth_cache.set(uid, dict(user, verified=pw_hash))
+        return {'id': user['id'], 'username': user['username'], 'type': user['type'], 'token_version': user['token_version']}
+    except passwords.Busy:
+        print(f"Authentication busy for uid {uid}")
+        raise
     except Exception as e:
         print(f"Database error: {e}")
-        return False
+        return None
 
+# Helper function to check authentication
+def check_auth(uid, pw_hash):
+    return authenticate(uid, pw_hash) is not None
+
+def request_credentials():
+    """uid/pwhash of the current request, from the JSON body, query string, URL or cookies."""
+    data = request.get_json(silent=True) if request.is_json else None
+    if not isinstance(data, dict):
+        data = {}
+    uid = (data.get('uid') or request.args.get('uid') or (request.view_args or {}).get('uid')
+           or request.cookies.get('uid'))
+    pw_hash = data.get('pwhash') or request.args.get('pwhash') or request.cookies.get('pwhash')
+    return uid, (pw_hash or '').strip()
+
+def get_current_user():
+    """The authenticated user of this request (or None), loaded at most once per request.
+
+    A valid session token is enough (no database access); otherwise the legacy
+    uid/pwhash pair is checked and a session cookie is issued with the response.
+    Raises passwords.Busy if that check could not run.
+    """
+    if 'current_user' not in g:
+        user = sessions.verify(request.cookies.get(sessions.COOKIE_NAME))
+        if user is None:
+            uid, pw_hash = request_credentials()
+            user = authenticate(uid, pw_hash) if uid and pw_hash else None
+            g.issue_session = user is not None
+        g.current_user = user
+    return g.current_user
+
+def set_session_cookie(response, user):
+    response.set_cookie(
+        sessions.COOKIE_NAME, sessions.issue(user), max_age=sessions.TTL,
+        httponly=True, secure=request.is_secure, samesite='Lax'
+    )
+    return response
+
+@app.after_request
+def issue_session_cookie(response):
+    if g.get('issue_session') and g.get('current_user'):
+        set_session_cookie(response, g.current_user)
+    return response
+
+# JSON responses at least this large are gzipped for clients that accept it
+GZIP_MIN_SIZE = int(os.getenv('GZIP_MIN_SIZE', '4096'))
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.mimetype != 'application/json'
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return response
+    body = response.get_data()
+    if len(body) < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def login_required(view):
+    """API routes: 400 without credentials, 401 if they are invalid, 503 if they could not be
+    checked (password hashing busy). The user is in g.current_user."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            user = get_current_user()
+        except passwords.Busy:
+            return jsonify({'success': False, 'message': 'Server busy, please retry'}), 503
+        if not user:
+            uid, pw_hash = request_credentials()
+            if not request.cookies.get(sessions.COOKIE_NAME) and (not uid or not pw_hash):
+                return jsonify({'success': False, 'message': 'Missing parameters'}), 400
+            return jsonify({'success': False, 'message': 'Authentication failed'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def root_required(view):
+    """API routes restricted to root users (403 for everyone else)."""
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if g.current_user['type'] != 'root':
+            return jsonify({'success': False}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def page_login_required(view):
+    """Pages: redirect to the login page unless the cookies authenticate (503 if busy)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            user = get_current_user()
+        except passwords.Busy:
+            return 'Server busy, please retry', 503
+        if not user:
+            return redirect(url_for('login'))
+        return view(*args, **kwargs)
+    return wrapper
+
+# Helper function to load basic info (id, username) for many users in one query
+def fetch_users_map(user_ids):
+    ids = list({int(i) for i in user_ids if i is not None})
+    if not ids:
+        return {}
+    users = db.fetchall('SELECT id, username FROM "user" WHERE id = ANY(:ids)', {'ids': ids})
+    return {u['id']: u for u in users}
+
+# Per-process cache of each dictionary's words (including deleted ones, which
+# finished games still show). Every route that writes words or deletes a dict
+# calls `invalidate_dict` after committing; the TTL bounds how long other
+# instances can serve a stale copy. Memory is bounded by evicting whole dicts.
+word_cache = VersionedCache(
+    maxsize=int(os.getenv('WORD_CACHE_DICTS', '64')),
+    ttl=float(os.getenv('WORD_CACHE_TTL', '300'))
+)
+
+def _load_dict_words(dict_id):
+    dict_obj = db.fetchone('SELECT id FROM "dict" WHERE id = :id AND deleted = false', {'id': dict_id})
+    words = db.fetchall('SELECT id, dictid, english, chinese, deleted FROM "word" WHERE dictid = :dictid ORDER BY id ASC', {'dictid': dict_id})
+    return {
+        'exists': dict_obj is not None,
+        'words': {w['id']: w for w in words},
+        'active': [w for w in words if not w['deleted']]
+    }
+
+# Helper function to get a dict's words: {'exists', 'words': {id: word}, 'active': [word, ...]}
+def get_dict_words(dict_id):
+    return word_cache.get_or_load(int(dict_id), _load_dict_words)
+
+def invalidate_dict(dict_id):
+    word_cache.bump(int(dict_id))
+
+def lock_dict(tx, dict_id):
+    """Lock an active dict's row for the rest of `tx`; None if it does not exist.
+
+    Every transaction that writes words takes this lock before the words get new
+    versions, so the versions within one dict are assigned in commit order and
+    `since` deltas (api_get_words) cannot skip a write that commits late.
+    """
+    return tx.fetchone('SELECT id FROM "dict" WHERE id = :id AND deleted = false FOR UPDATE', {'id': dict_id})
+
+word_search = search.get_backend(get_dict_words)
 
 @app.context_processor
 def inject_auth_context():
     """Inject authentication status and current user into all templates."""
     try:
-        uid = request.cookies.get('uid')
-        pwhash = request.cookies.get('pwhash')
-        if not uid or not pwhash:
-            return {'is_authenticated': False, 'current_user': None}
-
-        try:
-            uid_int = int(uid)
-        except ValueError:
-            return {'is_authenticated': False, 'current_user': None}
-
-        if not check_auth(uid_int, pwhash):
-            return {'is_authenticated': False, 'current_user': None}
-
-        # fetch minimal user info
-        user = db.fetchone('SELECT id, username FROM "user" WHERE id = :id AND deleted = 0', {'id': uid_int})
-
-        return {'is_authenticated': True, 'current_user': user}
-    except Exception as e:
-        print(f"inject_auth_context error: {e}")
+        user = get_current_user()
+    except passwords.Busy:
+        user = None  # rendered signed out; nothing is cleared
+    if not user:
         return {'is_authenticated': False, 'current_user': None}
+    return {'is_authenticated': True, 'current_user': {'id': user['id'], 'username': user['username']}}
 
 # Routes - Pages
 @app.route('/')
 def home():
-    # Determine whether to show admin link based on cookies and user type
-    show_admin_link = False
+    # Show the admin link to root users only
     try:
-        uid = request.cookies.get('uid')
-        pwhash = request.cookies.get('pwhash')
-        if uid and pwhash:
-            try:
-                uid_int = int(uid)
-                # quick auth check
-                if check_auth(uid_int, pwhash):
-                    user = db.fetchone('SELECT type FROM "user" WHERE id = :id', {'id': uid_int})
-                    if user and user.get('type') == 'root':
-                        show_admin_link = True
-            except ValueError:
-                pass
-    except Exception:
-        # ignore errors and render page without admin link
-        show_admin_link = False
-
+        user = get_current_user()
+    except passwords.Busy:
+        user = None
+    show_admin_link = bool(user and user['type'] == 'root')
     return render_template('home.html', show_admin_link=show_admin_link)
 
 @app.route('/login/')
@@ -88,32 +293,15 @@ def changepw():
     return render_template('changepw.html')
 
 @app.route('/admin/')
+@page_login_required
 def admin():
     # Try to render admin page server-side when possible to avoid client-side
     # failures caused by browser extensions (some extensions inject scripts
-    # that can break our client JS). We check cookies for uid/pwhash and
-    # only render the full users table for root users.
+    # that can break our client JS). Only root users get the full users table.
     try:
-        uid = request.cookies.get('uid')
-        pwhash = request.cookies.get('pwhash')
-        if not uid or not pwhash:
-            return redirect(url_for('login'))
-
-        # validate auth and role
-        try:
-            uid_int = int(uid)
-        except ValueError:
-            return redirect(url_for('login'))
-
-        if not check_auth(uid_int, pwhash):
-            return redirect(url_for('login'))
-
-        # check role
-        user = db.fetchone('SELECT type FROM "user" WHERE id = :id', {'id': uid_int})
         users = None
-        if user and user.get('type') == 'root':
-            # fetch non-deleted users by default
-            users = db.fetchall('SELECT id, username, introduction, rating, type, deleted FROM "user" ORDER BY id DESC')
+        if g.current_user['type'] == 'root':
+            users = db.fetchall('SELECT id, username, introduction, round(rating)::integer AS rating, type, deleted FROM "user" ORDER BY id DESC')
 
         return render_template('admin.html', users=users)
     except Exception as e:
@@ -124,7 +312,13 @@ def admin():
 @app.route('/user/<int:profile_id>/')
 def user_profile(profile_id):
     try:
-        user = db.fetchone('SELECT id, username, introduction, rating, type FROM "user" WHERE id = :id AND deleted = 0', {'id': profile_id})
+        refresh_leaderboard()
+        user = db.fetchone("""
+            SELECT u.id, u.username, u.introduction, round(u.rating)::integer AS rating, u.type, l.rank
+            FROM "user" u
+            LEFT JOIN leaderboard l ON l.id = u.id
+            WHERE u.id = :id AND u.deleted = false
+        """, {'id': profile_id})
 
         if not user:
             return redirect(url_for('home'))
@@ -139,55 +333,34 @@ def user_profile(profile_id):
 @app.route('/leaderboard/')
 def leaderboard():
     try:
-        users = db.fetchall('SELECT id, username, introduction, rating FROM "user" WHERE deleted = 0 ORDER BY rating DESC, id ASC LIMIT 100')
-
-        return render_template('leaderboard.html', users=users)
+        refresh_leaderboard()
+        table = leaderboard_cache.get('top')
+        if table is None:
+            users = db.fetchall("""
+                SELECT u.id, u.username, u.introduction, round(l.rating)::integer AS rating, l.rank
+                FROM leaderboard l
+                JOIN "user" u ON u.id = l.id
+                WHERE l.rank <= :size
+                ORDER BY l.rank
+            """, {'size': LEADERBOARD_SIZE})
+            table = render_template('_leaderboard_table.html', users=users)
+            leaderboard_cache.set('top', table)
+
+        return render_template('leaderboard.html', table=Markup(table))
     except Exception as e:
         print(f"Leaderboard error: {e}")
         return redirect(url_for('home'))
 
 # Game page - game detail
 @app.route('/game/<int:game_id>/detail/')
+@page_login_required
 def game_detail(game_id):
-    try:
-        uid = request.cookies.get('uid')
-        pwhash = request.cookies.get('pwhash')
-        if not uid or not pwhash:
-            return redirect(url_for('login'))
-
-        try:
-            uid_int = int(uid)
-        except ValueError:
-            return redirect(url_for('login'))
-
-        if not check_auth(uid_int, pwhash):
-            return redirect(url_for('login'))
-
-        return render_template('game_detail.html')
-    except Exception as e:
-        print(f"Game detail error: {e}")
-        return redirect(url_for('home'))
+    return render_template('game_detail.html')
 
 @app.route('/game/<int:game_id>/')
+@page_login_required
 def game_playing(game_id):
-    try:
-        uid = request.cookies.get('uid')
-        pwhash = request.cookies.get('pwhash')
-        if not uid or not pwhash:
-            return redirect(url_for('login'))
-
-        try:
-            uid_int = int(uid)
-        except ValueError:
-            return redirect(url_for('login'))
-
-        if not check_auth(uid_int, pwhash):
-            return redirect(url_for('login'))
-
-        return render_template('game_playing.html')
-    except Exception as e:
-        print(f"Game playing error: {e}")
-        return redirect(url_for('home'))
+    return render_template('game_playing.html')
 
 # API Routes - User Management
 @app.route('/api/register', methods=['POST'])
@@ -210,14 +383,16 @@ def api_register():
             return jsonify({'success': False, 'message': 'Username already exists'}), 409
 
         # Insert new user (RETURNING id)
-        pw_hash = hash_password(password)
-        print(f"[register] creating user: {username} pw={password} pw_hash={pw_hash}")
+        stored_hash = passwords.make_hash(hash_password(password))
+        print(f"[register] creating user: {username}")
         uid = db.insert_returning_id(
             'INSERT INTO "user" (username, pwhash, introduction, rating, type, deleted) VALUES (:username, :pwhash, :introduction, :rating, :type, :deleted) RETURNING id',
-            {'username': username, 'pwhash': pw_hash, 'introduction': introduction, 'rating': 0, 'type': 'normal', 'deleted': False}
+            {'username': username, 'pwhash': stored_hash, 'introduction': introduction, 'rating': 0, 'type': 'normal', 'deleted': False}
         )
 
         return jsonify({'success': True, 'uid': uid, 'message': 'Registration successful'}), 201
+    except passwords.Busy:
+        return jsonify({'success': False, 'message': 'Server busy, please retry'}), 503
     except Exception as e:
         print(f"Register error: {e}")
         return jsonify({'success': False, 'message': 'Server error'}), 500
@@ -233,47 +408,54 @@ def api_login():
             return jsonify({'success': False, 'message': 'Username and password required'}), 400
         
         # Find user by username
-        user = db.fetchone('SELECT id, pwhash FROM "user" WHERE username = :username AND deleted = 0', {'username': username})
+        user = db.fetchone('SELECT id, username, type, pwhash, token_version FROM "user" WHERE username = :username AND deleted = false', {'username': username})
         
         if not user:
             print(f"[login] user not found: {username}")
             return jsonify({'success': False, 'message': 'Invalid username or password'}), 401
 
-        # Verify password
+        # Verify password (KDF work runs on the bounded pool in `passwords`)
         pw_hash = hash_password(password)
-        print(password,pw_hash)
-        match = (user['pwhash'] == pw_hash)
+        match = passwords.verify(pw_hash, user['pwhash'])
         print(f"[login] username={username} id={user['id']} match={match}")
         if not match:
             return jsonify({'success': False, 'message': 'Invalid username or password'}), 401
         
-        return jsonify({'success': True, 'uid': user['id'], 'pwhash': pw_hash}), 200
+        # Upgrade legacy/outdated stored hashes now that we know the credential.
+        # Only replaces the hash we verified, so a concurrent password change wins.
+        if passwords.needs_rehash(user['pwhash']):
+            try:
+                db.execute(
+                    'UPDATE "user" SET pwhash = :new WHERE id = :id AND pwhash = :old',
+                    {'new': passwords.make_hash(pw_hash), 'id': user['id'], 'old': user['pwhash']}
+                )
+                invalidate_auth(user['id'])
+            except passwords.Busy:
+                pass  # upgraded on a later login
+        
+        response = jsonify({'success': True, 'uid': user['id'], 'pwhash': pw_hash})
+        return set_session_cookie(response, user), 200
+    except passwords.Busy:
+        return jsonify({'success': False, 'message': 'Server busy, please retry'}), 503
     except Exception as e:
         print(f"Login error: {e}")
         return jsonify({'success': False, 'message': 'Server error'}), 500
 
+@app.route('/api/logout', methods=['POST'])
+def api_logout():
+    response = jsonify({'success': True})
+    response.delete_cookie(sessions.COOKIE_NAME)
+    return response, 200
+
 @app.route('/api/verify', methods=['POST'])
+@login_required
 def api_verify():
-    try:
-        data = request.get_json()
-        uid = data.get('uid')
-        pw_hash = data.get('pwhash', '').strip()
-        
-        if not uid or not pw_hash:
-            return jsonify({'success': False}), 400
-        
-        if check_auth(uid, pw_hash):
-            return jsonify({'success': True}), 200
-        else:
-            return jsonify({'success': False}), 401
-    except Exception as e:
-        print(f"Verify error: {e}")
-        return jsonify({'success': False}), 500
+    return jsonify({'success': True}), 200
 
 @app.route('/api/user/<int:uid>', methods=['GET'])
 def api_get_user(uid):
     try:
-        user = db.fetchone('SELECT id, username, introduction, rating, type FROM "user" WHERE id = :id AND deleted = 0', {'id': uid})
+        user = db.fetchone('SELECT id, username, introduction, round(rating)::integer AS rating, type FROM "user" WHERE id = :id AND deleted = false', {'id': uid})
 
         if user:
             return jsonify({'success': True, 'user': user}), 200
@@ -284,8 +466,13 @@ def api_get_user(uid):
         return jsonify({'success': False, 'message': 'Server error'}), 500
 
 @app.route('/api/user/<int:uid>/update', methods=['POST'])
+@login_required
 def api_update_user(uid):
     try:
+        # Users can only update themselves
+        if g.current_user['id'] != uid:
+            return jsonify({'success': False, 'message': 'Authentication failed'}), 401
+
         data = request.get_json()
         # Extract fields; introduction may be omitted (None) to indicate no change
         current_password = data.get('current_password')
@@ -297,11 +484,6 @@ def api_update_user(uid):
         introduction = data.get('introduction')
         if introduction is not None:
             introduction = introduction.strip()
-        pw_hash = data.get('pwhash', '').strip()
-
-        # Verify authentication via pw_hash cookie/header
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False, 'message': 'Authentication failed'}), 401
 
         # Build updates. If changing password, require current_password to be provided and correct.
         updates = []
@@ -309,15 +491,15 @@ def api_update_user(uid):
 
         if new_password is not None and new_password != '':
             # Changing password requires verifying current password
-            user = db.fetchone('SELECT pwhash FROM "user" WHERE id = :id', {'id': uid})
-            if not user or current_password is None or user['pwhash'] != hash_password(current_password):
+            stored = db.fetchone('SELECT pwhash FROM "user" WHERE id = :id', {'id': uid})
+            if current_password is None or not passwords.verify(hash_password(current_password), stored['pwhash']):
                 return jsonify({'success': False, 'message': 'Current password incorrect'}), 401
 
             if len(new_password) < 6:
                 return jsonify({'success': False, 'message': 'New password must be at least 6 characters'}), 400
 
             updates.append('pwhash = :pwhash')
-            params['pwhash'] = hash_password(new_password)
+            params['pwhash'] = passwords.make_hash(hash_password(new_password))
 
         # Introduction update is allowed without re-entering current password
         if introduction is not None:
@@ -330,93 +512,70 @@ def api_update_user(uid):
         params['id'] = uid
         query = 'UPDATE "user" SET ' + ', '.join(updates) + ' WHERE id = :id'
         db.execute(query, params)
+        invalidate_auth(uid)
+        leaderboard_cache.clear()
+
+        if 'pwhash' in params:
+            # Sign out every other session; this one continues with a fresh token
+            g.current_user = dict(g.current_user, token_version=sessions.revoke(uid))
+            g.issue_session = True
 
         return jsonify({'success': True, 'message': 'User updated successfully'}), 200
+    except passwords.Busy:
+        return jsonify({'success': False, 'message': 'Server busy, please retry'}), 503
     except Exception as e:
         print(f"Update user error: {e}")
         return jsonify({'success': False, 'message': 'Server error'}), 500
 
 # Admin API Routes
 @app.route('/api/admin/check', methods=['POST'])
+@login_required
 def api_admin_check():
-    try:
-        data = request.get_json()
-        uid = data.get('uid')
-        pw_hash = data.get('pwhash', '').strip()
-        
-        if not uid or not pw_hash:
-            return jsonify({'success': False}), 400
-        
-        # Verify authentication
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False, 'message': 'Authentication failed'}), 401
-        
-        # Get user info (return type for all authenticated users)
-        user = db.fetchone('SELECT type FROM "user" WHERE id = :id', {'id': uid})
-
-        if user:
-            return jsonify({'success': True, 'type': user['type']}), 200
-        else:
-            return jsonify({'success': False, 'message': 'User not found'}), 404
-    except Exception as e:
-        print(f"Admin check error: {e}")
-        return jsonify({'success': False}), 500
+    # Return type for all authenticated users
+    return jsonify({'success': True, 'type': g.current_user['type']}), 200
 
 @app.route('/api/admin/users', methods=['GET'])
+@root_required
 def api_admin_users():
     try:
-        uid = request.args.get('uid', type=int)
-        pw_hash = request.args.get('pwhash', '').strip()
         include_deleted = request.args.get('include_deleted', 'false').lower() == 'true'
-        
-        if not uid or not pw_hash:
-            return jsonify({'success': False}), 400
-        
-        # Verify authentication and admin access
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-        
-        user = db.fetchone('SELECT type FROM "user" WHERE id = :id', {'id': uid})
-
-        if not user or user['type'] != 'root':
-            return jsonify({'success': False}), 403
 
         # Get users
         if include_deleted:
-            users = db.fetchall('SELECT id, username, introduction, rating, type, deleted FROM "user" ORDER BY id DESC')
+            users = db.fetchall('SELECT id, username, introduction, round(rating)::integer AS rating, type, deleted FROM "user" ORDER BY id DESC')
         else:
-            users = db.fetchall('SELECT id, username, introduction, rating, type, deleted FROM "user" WHERE deleted = 0 ORDER BY id DESC')
+            users = db.fetchall('SELECT id, username, introduction, round(rating)::integer AS rating, type, deleted FROM "user" WHERE deleted = false ORDER BY id DESC')
 
         return jsonify({'success': True, 'users': users}), 200
     except Exception as e:
         print(f"Get users error: {e}")
         return jsonify({'success': False}), 500
 
+@app.route('/api/admin/stats', methods=['GET'])
+@root_required
+def api_admin_stats():
+    return jsonify({
+        'success': True,
+        'caches': {'auth': auth_cache.stats(), 'leaderboard': leaderboard_cache.stats(), 'words': word_cache.stats(), 'answers': grader.cache.stats()},
+        'session_revocations': sessions.revocations.size(),
+        'db_pool': db.pool_stats()
+    }), 200
+
 @app.route('/api/admin/user/<int:target_uid>/reset-password', methods=['POST'])
+@root_required
 def api_admin_reset_password(target_uid):
     try:
         data = request.get_json()
-        uid = data.get('uid')
-        pw_hash = data.get('pwhash', '').strip()
         new_password = data.get('new_password', '').strip()
         
-        if not uid or not pw_hash or not new_password:
+        if not new_password:
             return jsonify({'success': False, 'message': 'Missing required fields'}), 400
         
         if len(new_password) < 6:
             return jsonify({'success': False, 'message': 'Password must be at least 6 characters'}), 400
         
-        # Verify authentication and admin access
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-        
-        user = db.fetchone('SELECT type FROM "user" WHERE id = :id', {'id': uid})
-        
-        if not user or user['type'] != 'root':
-            return jsonify({'success': False}), 403
-        
         # Cannot reset own password via admin
-        if uid == target_uid:
+        if g.current_user['id'] == target_uid:
             return jsonify({'success': False, 'message': 'Cannot reset own password via admin'}), 400
         
         # Check target user exists
@@ -425,35 +584,24 @@ def api_admin_reset_password(target_uid):
             return jsonify({'success': False, 'message': 'Target user not found'}), 404
         
         # Reset password
-        new_pw_hash = hash_password(new_password)
+        new_pw_hash = passwords.make_hash(hash_password(new_password))
         db.execute('UPDATE "user" SET pwhash = :pwhash WHERE id = :id', {'pwhash': new_pw_hash, 'id': target_uid})
+        invalidate_auth(target_uid)
+        sessions.revoke(target_uid)
         
         return jsonify({'success': True, 'message': 'Password reset successfully'}), 200
+    except passwords.Busy:
+        return jsonify({'success': False, 'message': 'Server busy, please retry'}), 503
     except Exception as e:
         print(f"Reset password error: {e}")
         return jsonify({'success': False}), 500
 
 @app.route('/api/admin/user/<int:target_uid>/delete', methods=['POST'])
+@root_required
 def api_admin_delete_user(target_uid):
     try:
-        data = request.get_json()
-        uid = data.get('uid')
-        pw_hash = data.get('pwhash', '').strip()
-        
-        if not uid or not pw_hash:
-            return jsonify({'success': False}), 400
-        
-        # Verify authentication and admin access
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-        
-        user = db.fetchone('SELECT type FROM "user" WHERE id = :id', {'id': uid})
-        
-        if not user or user['type'] != 'root':
-            return jsonify({'success': False}), 403
-        
         # Cannot delete own account
-        if uid == target_uid:
+        if g.current_user['id'] == target_uid:
             return jsonify({'success': False, 'message': 'Cannot delete own account'}), 400
         
         # Check target user exists
@@ -462,7 +610,11 @@ def api_admin_delete_user(target_uid):
             return jsonify({'success': False, 'message': 'Target user not found'}), 404
         
         # Soft delete user
-        db.execute('UPDATE "user" SET deleted = 1 WHERE id = :id', {'id': target_uid})
+        with db.transaction() as tx:
+            tx.execute('UPDATE "user" SET deleted = true WHERE id = :id', {'id': target_uid})
+            mark_leaderboard_dirty(tx)
+        invalidate_auth(target_uid)
+        sessions.revoke(target_uid)
         
         return jsonify({'success': True, 'message': 'User deleted successfully'}), 200
     except Exception as e:
@@ -470,31 +622,19 @@ def api_admin_delete_user(target_uid):
         return jsonify({'success': False}), 500
 
 @app.route('/api/admin/user/<int:target_uid>/restore', methods=['POST'])
+@root_required
 def api_admin_restore_user(target_uid):
     try:
-        data = request.get_json()
-        uid = data.get('uid')
-        pw_hash = data.get('pwhash', '').strip()
-        
-        if not uid or not pw_hash:
-            return jsonify({'success': False}), 400
-        
-        # Verify authentication and admin access
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-        
-        user = db.fetchone('SELECT type FROM "user" WHERE id = :id', {'id': uid})
-        
-        if not user or user['type'] != 'root':
-            return jsonify({'success': False}), 403
-        
         # Check target user exists
         target_user = db.fetchone('SELECT id FROM "user" WHERE id = :id', {'id': target_uid})
         if not target_user:
             return jsonify({'success': False, 'message': 'Target user not found'}), 404
         
         # Restore user
-        db.execute('UPDATE "user" SET deleted = 0 WHERE id = :id', {'id': target_uid})
+        with db.transaction() as tx:
+            tx.execute('UPDATE "user" SET deleted = false WHERE id = :id', {'id': target_uid})
+            mark_leaderboard_dirty(tx)
+        invalidate_auth(target_uid)
         
         return jsonify({'success': True, 'message': 'User restored successfully'}), 200
     except Exception as e:
@@ -504,27 +644,11 @@ def api_admin_restore_user(target_uid):
 # Dictionary Management API Routes
 
 @app.route('/api/dicts', methods=['GET'])
+@login_required
 def api_get_dicts():
     try:
-        uid = request.args.get('uid', type=int)
-        pw_hash = request.args.get('pwhash', '').strip()
-
-        if not uid or not pw_hash:
-            return jsonify({'success': False}), 400
-
-        # Verify authentication (user, not necessarily root)
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-
-        # Get all non-deleted dicts with word count
-        dicts = db.fetchall("""
-            SELECT d.id, d.dictname, COUNT(w.id) as word_count
-            FROM "dict" d
-            LEFT JOIN "word" w ON d.id = w.dictid AND w.deleted = 0
-            WHERE d.deleted = 0
-            GROUP BY d.id
-            ORDER BY d.id DESC
-        """)
+        # Get all non-deleted dicts; word_count is maintained by the word write paths
+        dicts = db.fetchall('SELECT id, dictname, word_count FROM "dict" WHERE deleted = false ORDER BY id DESC')
 
         return jsonify({'success': True, 'dicts': dicts}), 200
     except Exception as e:
@@ -532,20 +656,15 @@ def api_get_dicts():
         return jsonify({'success': False}), 500
 
 @app.route('/api/dict', methods=['POST'])
+@login_required
 def api_create_dict():
     try:
         data = request.get_json()
-        uid = data.get('uid')
-        pw_hash = data.get('pwhash', '').strip()
         dictname = data.get('dictname', '').strip()
 
-        if not uid or not pw_hash or not dictname:
+        if not dictname:
             return jsonify({'success': False, 'message': 'Missing required fields'}), 400
 
-        # Verify authentication (any authenticated user)
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-
         # Create dict
         dict_id = db.insert_returning_id(
             'INSERT INTO "dict" (dictname, deleted) VALUES (:dictname, :deleted) RETURNING id',
@@ -558,22 +677,17 @@ def api_create_dict():
         return jsonify({'success': False}), 500
 
 @app.route('/api/dict/<int:dict_id>', methods=['PUT'])
+@login_required
 def api_update_dict(dict_id):
     try:
         data = request.get_json()
-        uid = data.get('uid')
-        pw_hash = data.get('pwhash', '').strip()
         dictname = data.get('dictname', '').strip()
 
-        if not uid or not pw_hash or not dictname:
+        if not dictname:
             return jsonify({'success': False, 'message': 'Missing required fields'}), 400
 
-        # Verify authentication (any authenticated user)
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-
         # Check dict exists
-        dict_obj = db.fetchone('SELECT id FROM "dict" WHERE id = :id AND deleted = 0', {'id': dict_id})
+        dict_obj = db.fetchone('SELECT id FROM "dict" WHERE id = :id AND deleted = false', {'id': dict_id})
         if not dict_obj:
             return jsonify({'success': False, 'message': 'Dictionary not found'}), 404
 
@@ -586,27 +700,20 @@ def api_update_dict(dict_id):
         return jsonify({'success': False}), 500
 
 @app.route('/api/dict/<int:dict_id>', methods=['DELETE'])
+@login_required
 def api_delete_dict(dict_id):
     try:
-        data = request.get_json()
-        uid = data.get('uid')
-        pw_hash = data.get('pwhash', '').strip()
-
-        if not uid or not pw_hash:
-            return jsonify({'success': False}), 400
-
-        # Verify authentication (any authenticated user)
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-
         # Check dict exists
-        dict_obj = db.fetchone('SELECT id FROM "dict" WHERE id = :id AND deleted = 0', {'id': dict_id})
+        dict_obj = db.fetchone('SELECT id FROM "dict" WHERE id = :id AND deleted = false', {'id': dict_id})
         if not dict_obj:
             return jsonify({'success': False, 'message': 'Dictionary not found'}), 404
 
-        # Soft delete dict and cascade delete its words
-        db.execute('UPDATE "dict" SET deleted = 1 WHERE id = :id', {'id': dict_id})
-        db.execute('UPDATE "word" SET deleted = 1 WHERE dictid = :dictid', {'dictid': dict_id})
+        # Soft delete dict and cascade delete its words (together or not at all);
+        # the dict UPDATE takes its row lock before the words get new versions (see lock_dict)
+        with db.transaction() as tx:
+            tx.execute('UPDATE "dict" SET deleted = true, word_count = 0 WHERE id = :id', {'id': dict_id})
+            tx.execute("""UPDATE "word" SET deleted = true, version = nextval('word_version_seq') WHERE dictid = :dictid AND deleted = false""", {'dictid': dict_id})
+        invalidate_dict(dict_id)
 
         return jsonify({'success': True, 'message': 'Dictionary and its words deleted'}), 200
     except Exception as e:
@@ -615,61 +722,131 @@ def api_delete_dict(dict_id):
 
 # Word Management API Routes
 
+WORD_LIST_DEFAULT_LIMIT = 1000
+WORD_LIST_MAX_LIMIT = 5000
+
 @app.route('/api/dict/<int:dict_id>/words', methods=['GET'])
+@login_required
 def api_get_words(dict_id):
+    """List a dictionary's words in id order.
+
+    Query parameters:
+      limit   - page size (default 1000, max 5000)
+      after   - cursor: only return words with id > after (use `next_cursor`)
+      since   - only return words changed after this version (use `version`),
+                including deleted ones (`deleted: true`) so clients can drop them
+    """
     try:
-        uid = request.args.get('uid', type=int)
-        pw_hash = request.args.get('pwhash', '').strip()
-
-        if not uid or not pw_hash:
-            return jsonify({'success': False}), 400
-
-        # Verify authentication
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-
-        # Check dict exists
-        dict_obj = db.fetchone('SELECT id FROM "dict" WHERE id = :id AND deleted = 0', {'id': dict_id})
+        limit = request.args.get('limit', WORD_LIST_DEFAULT_LIMIT, type=int)
+        limit = max(1, min(limit, WORD_LIST_MAX_LIMIT))
+        after = request.args.get('after', 0, type=int)
+        since = request.args.get('since', type=int)
+
+        # Read from the database rather than the per-process word cache, which
+        # another instance's write may not have invalidated yet. The version is
+        # read before the words: word writes hold the dict's row lock while they
+        # take versions (see lock_dict), so within a dict versions commit in
+        # order and nothing at or below it can still appear.
+        dict_obj = db.fetchone("""
+            SELECT d.id, (SELECT COALESCE(MAX(w.version), 0) FROM "word" w WHERE w.dictid = d.id) AS version
+            FROM "dict" d WHERE d.id = :id AND d.deleted = false
+        """, {'id': dict_id})
         if not dict_obj:
             return jsonify({'success': False, 'message': 'Dictionary not found'}), 404
 
-        # Get non-deleted words
-        words = db.fetchall(
-            'SELECT id, dictid, english, chinese FROM "word" WHERE dictid = :dictid AND deleted = 0 ORDER BY id ASC',
-            {'dictid': dict_id}
-        )
+        params = {'dictid': dict_id, 'after': after, 'limit': limit + 1}
+        if since is None:
+            # Non-deleted words, keyset paginated on id
+            page = db.fetchall("""
+                SELECT id, dictid, english, chinese FROM "word"
+                WHERE dictid = :dictid AND deleted = false AND id > :after
+                ORDER BY id LIMIT :limit
+            """, params)
+        else:
+            # Every word written after `since`, deleted or not
+            page = db.fetchall("""
+                SELECT id, dictid, english, chinese, deleted FROM "word"
+                WHERE dictid = :dictid AND version > :since AND id > :after
+                ORDER BY id LIMIT :limit
+            """, dict(params, since=since))
+        words = page[:limit]
 
-        return jsonify({'success': True, 'words': words}), 200
+        return jsonify({
+            'success': True,
+            'words': words,
+            'next_cursor': words[-1]['id'] if len(page) > limit else None,
+            'version': dict_obj['version']
+        }), 200
     except Exception as e:
         print(f"Get words error: {e}")
         return jsonify({'success': False}), 500
 
+WORD_SEARCH_DEFAULT_LIMIT = 20
+WORD_SEARCH_MAX_LIMIT = 100
+
+@app.route('/api/dict/<int:dict_id>/words/search', methods=['GET'])
+@login_required
+def api_search_words(dict_id):
+    """Search a dictionary's words.
+
+    Query parameters:
+      q       - search text (english or chinese)
+      mode    - prefix (english starts with q) or fuzzy (default; see search.py)
+      limit   - page size (default 20, max 100)
+      offset  - skip this many results (use `next_offset`)
+    """
+    try:
+        q = search.normalize(request.args.get('q', ''))
+        mode = request.args.get('mode', 'fuzzy')
+        if not q:
+            return jsonify({'success': False, 'message': 'Missing required fields'}), 400
+        if mode not in ('prefix', 'fuzzy'):
+            return jsonify({'success': False, 'message': 'Invalid search mode'}), 400
+        limit = request.args.get('limit', WORD_SEARCH_DEFAULT_LIMIT, type=int)
+        limit = max(1, min(limit, WORD_SEARCH_MAX_LIMIT))
+        offset = max(0, request.args.get('offset', 0, type=int))
+
+        result = word_search.search(dict_id, q, mode, limit, offset)
+        if result is None:
+            return jsonify({'success': False, 'message': 'Dictionary not found'}), 404
+        words, has_more = result
+
+        return jsonify({
+            'success': True,
+            'words': words,
+            'next_offset': offset + limit if has_more else None
+        }), 200
+    except Exception as e:
+        print(f"Search words error: {e}")
+        return jsonify({'success': False}), 500
+
 @app.route('/api/dict/<int:dict_id>/word', methods=['POST'])
+@login_required
 def api_create_word(dict_id):
     try:
         data = request.get_json()
-        uid = data.get('uid')
-        pw_hash = data.get('pwhash', '').strip()
         english = data.get('english', '').strip()
         chinese = data.get('chinese', '').strip()
 
-        if not uid or not pw_hash or not english or not chinese:
+        if not english or not chinese:
             return jsonify({'success': False, 'message': 'Missing required fields'}), 400
 
-        # Verify authentication (any authenticated user)
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-
-        # Check dict exists
-        dict_obj = db.fetchone('SELECT id FROM "dict" WHERE id = :id AND deleted = 0', {'id': dict_id})
-        if not dict_obj:
-            return jsonify({'success': False, 'message': 'Dictionary not found'}), 404
-
-        # Create word
-        word_id = db.insert_returning_id(
-            'INSERT INTO "word" (dictid, english, chinese, deleted) VALUES (:dictid, :english, :chinese, :deleted) RETURNING id',
-            {'dictid': dict_id, 'english': english, 'chinese': chinese, 'deleted': False}
-        )
+        with db.transaction() as tx:
+            # Check dict exists
+            if not lock_dict(tx, dict_id):
+                return jsonify({'success': False, 'message': 'Dictionary not found'}), 404
+
+            # Create word and count it in the same statement
+            word_id = tx.insert_returning_id("""
+                WITH inserted AS (
+                    INSERT INTO "word" (dictid, english, chinese, deleted) VALUES (:dictid, :english, :chinese, :deleted)
+                    RETURNING id, dictid
+                ), counted AS (
+                    UPDATE "dict" SET word_count = word_count + 1 WHERE id IN (SELECT dictid FROM inserted)
+                )
+                SELECT id FROM inserted
+            """, {'dictid': dict_id, 'english': english, 'chinese': chinese, 'deleted': False})
+        invalidate_dict(dict_id)
 
         return jsonify({'success': True, 'word_id': word_id, 'message': 'Word created'}), 201
     except Exception as e:
@@ -677,31 +854,29 @@ def api_create_word(dict_id):
         return jsonify({'success': False}), 500
 
 @app.route('/api/word/<int:word_id>', methods=['PUT'])
+@login_required
 def api_update_word(word_id):
     try:
         data = request.get_json()
-        uid = data.get('uid')
-        pw_hash = data.get('pwhash', '').strip()
         english = data.get('english', '').strip()
         chinese = data.get('chinese', '').strip()
 
-        if not uid or not pw_hash or not english or not chinese:
+        if not english or not chinese:
             return jsonify({'success': False, 'message': 'Missing required fields'}), 400
 
-        # Verify authentication (any authenticated user)
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-
         # Check word exists
-        word = db.fetchone('SELECT dictid FROM "word" WHERE id = :id AND deleted = 0', {'id': word_id})
+        word = db.fetchone('SELECT dictid FROM "word" WHERE id = :id AND deleted = false', {'id': word_id})
         if not word:
             return jsonify({'success': False, 'message': 'Word not found'}), 404
 
         # Update word
-        db.execute(
-            'UPDATE "word" SET english = :english, chinese = :chinese WHERE id = :id',
-            {'english': english, 'chinese': chinese, 'id': word_id}
-        )
+        with db.transaction() as tx:
+            lock_dict(tx, word['dictid'])
+            tx.execute(
+                """UPDATE "word" SET english = :english, chinese = :chinese, version = nextval('word_version_seq') WHERE id = :id""",
+                {'english': english, 'chinese': chinese, 'id': word_id}
+            )
+        invalidate_dict(word['dictid'])
 
         return jsonify({'success': True, 'message': 'Word updated'}), 200
     except Exception as e:
@@ -709,26 +884,25 @@ def api_update_word(word_id):
         return jsonify({'success': False}), 500
 
 @app.route('/api/word/<int:word_id>', methods=['DELETE'])
+@login_required
 def api_delete_word(word_id):
     try:
-        data = request.get_json()
-        uid = data.get('uid')
-        pw_hash = data.get('pwhash', '').strip()
-
-        if not uid or not pw_hash:
-            return jsonify({'success': False}), 400
-
-        # Verify authentication (any authenticated user)
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-
         # Check word exists
-        word = db.fetchone('SELECT id FROM "word" WHERE id = :id AND deleted = 0', {'id': word_id})
+        word = db.fetchone('SELECT dictid FROM "word" WHERE id = :id AND deleted = false', {'id': word_id})
         if not word:
             return jsonify({'success': False, 'message': 'Word not found'}), 404
 
-        # Soft delete word
-        db.execute('UPDATE "word" SET deleted = 1 WHERE id = :id', {'id': word_id})
+        # Soft delete word; the count only drops if this call actually deleted it
+        with db.transaction() as tx:
+            lock_dict(tx, word['dictid'])
+            tx.execute("""
+                WITH removed AS (
+                    UPDATE "word" SET deleted = true, version = nextval('word_version_seq') WHERE id = :id AND deleted = false
+                    RETURNING dictid
+                )
+                UPDATE "dict" SET word_count = word_count - 1 WHERE id IN (SELECT dictid FROM removed)
+            """, {'id': word_id})
+        invalidate_dict(word['dictid'])
 
         return jsonify({'success': True, 'message': 'Word deleted'}), 200
     except Exception as e:
@@ -736,82 +910,106 @@ def api_delete_word(word_id):
         return jsonify({'success': False}), 500
 
 # CSV Import/Export API Routes
+CSV_IMPORT_MAX_ERRORS = 100
+CSV_EXPORT_CHUNK_SIZE = 64 * 1024
 
 @app.route('/api/dict/<int:dict_id>/import-csv', methods=['POST'])
+@login_required
 def api_import_csv(dict_id):
     try:
         data = request.get_json()
-        uid = data.get('uid')
-        pw_hash = data.get('pwhash', '').strip()
         csv_content = data.get('csv', '')
 
-        if not uid or not pw_hash or not csv_content:
+        if not csv_content:
             return jsonify({'success': False, 'message': 'Missing required fields'}), 400
 
-        # Verify authentication (any authenticated user)
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-
         # Check dict exists
-        dict_obj = db.fetchone('SELECT id FROM "dict" WHERE id = :id AND deleted = 0', {'id': dict_id})
+        dict_obj = db.fetchone('SELECT id FROM "dict" WHERE id = :id AND deleted = false', {'id': dict_id})
         if not dict_obj:
             return jsonify({'success': False, 'message': 'Dictionary not found'}), 404
 
-        # Parse CSV and insert words
-        lines = csv_content.strip().split('\n')
-        count = 0
-        for line in lines:
-            line = line.strip()
-            if not line:
+        # Optionally skip words whose english already exists in the dict (case-insensitive)
+        dedupe = bool(data.get('dedupe', False))
+        existing = set()
+        if dedupe:
+            existing = {w['english'].lower() for w in get_dict_words(dict_id)['active']}
+
+        # Parse CSV (quoted fields allowed; extra commas stay in the Chinese text)
+        rows = []
+        errors = []
+        skipped = 0
+        for line_no, parts in enumerate(csv.reader(io.StringIO(csv_content.strip())), start=1):
+            if not parts or not ''.join(parts).strip():
                 continue
-            parts = line.split(',', 1)
-            if len(parts) == 2:
-                english, chinese = parts[0].strip(), parts[1].strip()
-                if english and chinese:
-                    db.execute(
-                        'INSERT INTO "word" (dictid, english, chinese, deleted) VALUES (:dictid, :english, :chinese, :deleted)',
-                        {'dictid': dict_id, 'english': english, 'chinese': chinese, 'deleted': False}
-                    )
-                    count += 1
+            if len(parts) < 2:
+                errors.append({'line': line_no, 'message': 'Expected "english,chinese"'})
+                continue
+            english, chinese = parts[0].strip(), ','.join(parts[1:]).strip()
+            if not english or not chinese:
+                errors.append({'line': line_no, 'message': 'Empty english or chinese'})
+                continue
+            if len(english) > 255 or len(chinese) > 255:
+                errors.append({'line': line_no, 'message': 'Field longer than 255 characters'})
+                continue
+            if dedupe:
+                key = english.lower()
+                if key in existing:
+                    skipped += 1
+                    continue
+                existing.add(key)
+            rows.append((dict_id, english, chinese, False))
+
+        # Insert all words and update the dict's word count in one transaction
+        with db.transaction() as tx:
+            if not lock_dict(tx, dict_id):
+                return jsonify({'success': False, 'message': 'Dictionary not found'}), 404
+            count = tx.insert_values('INSERT INTO "word" (dictid, english, chinese, deleted) VALUES %s', rows)
+            if count:
+                tx.execute('UPDATE "dict" SET word_count = word_count + :count WHERE id = :id', {'count': count, 'id': dict_id})
+        if count:
+            invalidate_dict(dict_id)
 
-        return jsonify({'success': True, 'count': count, 'message': f'{count} words imported'}), 200
+        return jsonify({
+            'success': True,
+            'count': count,
+            'skipped': skipped,
+            'errors': errors[:CSV_IMPORT_MAX_ERRORS],
+            'error_count': len(errors),
+            'message': f'{count} words imported'
+        }), 200
     except Exception as e:
         print(f"Import CSV error: {e}")
         return jsonify({'success': False}), 500
 
 @app.route('/api/dict/<int:dict_id>/export-csv', methods=['GET'])
+@login_required
 def api_export_csv(dict_id):
     try:
-        uid = request.args.get('uid', type=int)
-        pw_hash = request.args.get('pwhash', '').strip()
-
-        if not uid or not pw_hash:
-            return jsonify({'success': False}), 400
-
-        # Verify authentication
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False}), 401
-
         # Check dict exists
-        dict_info = db.fetchone('SELECT dictname FROM "dict" WHERE id = :id AND deleted = 0', {'id': dict_id})
+        dict_info = db.fetchone('SELECT dictname FROM "dict" WHERE id = :id AND deleted = false', {'id': dict_id})
         if not dict_info:
             return jsonify({'success': False, 'message': 'Dictionary not found'}), 404
 
-        # Get words
-        words = db.fetchall(
-            'SELECT english, chinese FROM "word" WHERE dictid = :dictid AND deleted = 0 ORDER BY id ASC',
-            {'dictid': dict_id}
-        )
-
-        # Generate CSV content
-        csv_lines = [f"{word['english']},{word['chinese']}" for word in words]
-        csv_content = '\n'.join(csv_lines)
-
-        return jsonify({
-            'success': True,
-            'filename': f"{dict_info['dictname']}.csv",
-            'content': csv_content
-        }), 200
+        # Stream the words as CSV straight from a server-side cursor
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            words = db.iterate(
+                'SELECT english, chinese FROM "word" WHERE dictid = :dictid AND deleted = false ORDER BY id ASC',
+                {'dictid': dict_id}
+            )
+            for word in words:
+                writer.writerow([word['english'], word['chinese']])
+                if buffer.tell() >= CSV_EXPORT_CHUNK_SIZE:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+
+        filename = quote(f"{dict_info['dictname']}.csv")
+        return Response(generate(), mimetype='text/csv', headers={
+            'Content-Disposition': f"attachment; filename=\"export.csv\"; filename*=UTF-8''{filename}"
+        })
     except Exception as e:
         print(f"Export CSV error: {e}")
         return jsonify({'success': False}), 500
@@ -819,43 +1017,74 @@ def api_export_csv(dict_id):
 # Game API Routes
 import random
 
+GAME_LIST_DEFAULT_LIMIT = 50
+GAME_LIST_MAX_LIMIT = 200
+GAME_LIST_SINCE_WINDOW = int(os.getenv('GAME_LIST_SINCE_WINDOW', '100'))
+# Default for api_game_create's `snapshot` option: copy the english/chinese pairs
+# into game.words so the game no longer depends on (or follows edits to) the dict
+GAME_WORD_SNAPSHOT = os.getenv('GAME_WORD_SNAPSHOT', '0') == '1'
+
+# Helper function to map word id -> word (id, english, chinese, deleted) for a game:
+# from the game's own snapshot when it has one, otherwise from the dict's words
+def game_words_map(game, wordlist):
+    if game.get('words'):
+        pairs = db.decode_json(game['words'], [])
+        return {
+            word_id: {'id': word_id, 'english': english, 'chinese': chinese, 'deleted': False}
+            for word_id, (english, chinese) in zip(wordlist, pairs)
+        }
+    if not game['dictid']:
+        return {}
+    words = get_dict_words(game['dictid'])['words']
+    missing = [word_id for word_id in wordlist if word_id not in words]
+    if missing:
+        # Added by another instance after this process cached the dict: not a
+        # deleted word. Read them directly and reload the dict on the next call.
+        rows = db.fetchall('SELECT id, dictid, english, chinese, deleted FROM "word" WHERE id = ANY(:ids)', {'ids': missing})
+        invalidate_dict(game['dictid'])
+        words = dict(words)
+        words.update((w['id'], w) for w in rows)
+    return words
+
+rating_engine = rating.get_engine()
+grader = grading.Grader()
+
 @app.route('/api/game/create', methods=['POST'])
+@login_required
 def api_game_create():
     """Create a new game."""
     try:
         data = request.get_json()
-        print(data)
-        uid = int(data.get('uid'))
-        pw_hash = data.get('pwhash', '').strip()
+        uid = g.current_user['id']
         dict_id = int(data.get('dict_id'))
-        if not uid or not pw_hash or not dict_id:
+        if not dict_id:
             return jsonify({'success': False, 'message': 'Missing parameters'}), 400
         
-        # Verify authentication
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False, 'message': 'Authentication failed'}), 401
-        
         # Check if dictionary exists and has words
-        dict_obj = db.fetchone('SELECT id FROM "dict" WHERE id = :id AND deleted = 0', {'id': dict_id})
-        if not dict_obj:
+        dict_words = get_dict_words(dict_id)
+        if not dict_words['exists']:
             return jsonify({'success': False, 'message': 'Dictionary not found'}), 404
         
-        words = db.fetchall('SELECT id FROM "word" WHERE dictid = :dictid AND deleted = 0', {'dictid': dict_id})
+        words = dict_words['active']
         if not words:
             return jsonify({'success': False, 'message': 'Dictionary has no words'}), 400
         
         # Shuffle word list
-        word_ids = [w['id'] for w in words]
-        random.shuffle(word_ids)
-        wordlist = json.dumps(word_ids)
+        words = list(words)
+        random.shuffle(words)
+        wordlist = db.encode_ids([w['id'] for w in words])
+        # Optional snapshot: [[english, chinese], ...] in wordlist order
+        snapshot = None
+        if data.get('snapshot', GAME_WORD_SNAPSHOT):
+            snapshot = json.dumps([[w['english'], w['chinese']] for w in words], ensure_ascii=False, separators=(',', ':'))
         
         # Initialize with creator
-        users = json.dumps([uid])
+        users = db.encode_ids([uid])
         
         # Create game (status=-1 for not started)
         game_id = db.insert_returning_id(
-            'INSERT INTO "game" (dictid, users, wordlist, result, status, ownerid) VALUES (:dictid, :users, :wordlist, :result, :status, :ownerid) RETURNING id',
-            {'dictid': dict_id, 'users': users, 'wordlist': wordlist, 'result': '[]', 'status': -1, 'ownerid': uid}
+            'INSERT INTO "game" (dictid, users, wordlist, words, status, ownerid) VALUES (:dictid, :users, :wordlist, :words, :status, :ownerid) RETURNING id',
+            {'dictid': dict_id, 'users': users, 'wordlist': wordlist, 'words': snapshot, 'status': -1, 'ownerid': uid}
         )
         
         return jsonify({'success': True, 'game_id': game_id, 'message': 'Game created'}), 201
@@ -864,72 +1093,127 @@ def api_game_create():
         return jsonify({'success': False, 'message': 'Server error'}), 500
 
 @app.route('/api/game/list', methods=['GET'])
+@login_required
 def api_game_list():
-    """List all games (未开始/进行中/已结束)."""
+    """List games (未开始/进行中/已结束).
+
+    Query parameters:
+      status  - comma separated status filter (-1 未开始, 0 进行中, 1 已结束)
+      limit   - page size (default 50, max 200)
+      before  - cursor: only return games with id < before (use `next_cursor`)
+      since   - only return games changed after this version (use `version`); games
+                changed in the GAME_LIST_SINCE_WINDOW versions before it are sent again
+
+    Responds with 304 when the client's If-None-Match matches the current ETag.
+    """
     try:
-        uid = request.args.get('uid', type=int)
-        pw_hash = request.args.get('pwhash', '').strip()
-        
-        if not uid or not pw_hash:
-            return jsonify({'success': False, 'message': 'Missing parameters'}), 400
+        uid = g.current_user['id']
         
-        # Verify authentication
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False, 'message': 'Authentication failed'}), 401
-        
-        # Get all games with dict info
-        games = db.fetchall("""
-            SELECT g.id, g.dictid, d.dictname, g.users, g.wordlist, g.result, g.status, g.perf, g.ownerid
+        # Parse filters and pagination
+        try:
+            statuses = [int(s) for s in request.args.get('status', '').split(',') if s.strip()]
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid status filter'}), 400
+        if any(s not in (-1, 0, 1) for s in statuses):
+            return jsonify({'success': False, 'message': 'Invalid status filter'}), 400
+        limit = request.args.get('limit', GAME_LIST_DEFAULT_LIMIT, type=int)
+        limit = max(1, min(limit, GAME_LIST_MAX_LIMIT))
+        before = request.args.get('before', type=int)
+        since = request.args.get('since', type=int)
+
+        conditions = []
+        params = {'limit': limit}
+        if statuses:
+            conditions.append('g.status = ANY(:statuses)')
+            params['statuses'] = statuses
+
+        # Every write to "game" bumps its version from a shared sequence. The
+        # versions of the games matching the status filter identify the listed
+        # state, so writes to other games (e.g. answers in running games while
+        # browsing finished ones) keep the ETag. The maximum alone is not enough:
+        # a write that took a lower version can commit after a higher one was
+        # served, so the sum (which grows with every write to a listed game)
+        # and the count (which catches games leaving the filter) go in as well.
+        state = db.fetchone(f"""
+            SELECT COALESCE(MAX(g.version), 0) AS version, COALESCE(SUM(g.version), 0) AS total,
+                   COUNT(*) AS count
+            FROM "game" g
+            {'WHERE ' + conditions[0] if statuses else ''}
+        """, params)
+        current_version = state['version']
+        etag = hashlib.sha1(
+            f"{uid}|{current_version}|{state['total']}|{state['count']}|{request.query_string.decode()}".encode()
+        ).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+
+        if before:
+            conditions.append('g.id < :before')
+            params['before'] = before
+        if since is not None:
+            # Versions are taken before commit, so a write can become visible after
+            # one with a higher version; re-send the last GAME_LIST_SINCE_WINDOW
+            # versions so such late commits are not skipped (clients merge by id)
+            conditions.append('g.version > :since')
+            params['since'] = max(0, since - GAME_LIST_SINCE_WINDOW)
+        where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+
+        # Get one page of games with dict info; wordlist/result are reduced to counts
+        games = db.fetchall(f"""
+            SELECT g.id, g.dictid, d.dictname, g.users, g.status, g.perf, g.ownerid, g.version,
+                   {db.ids_length_sql('g.wordlist')} AS word_count,
+                   g.answer_count AS result_count
             FROM "game" g
             LEFT JOIN "dict" d ON g.dictid = d.id
+            {where}
             ORDER BY g.id DESC
-        """)
+            LIMIT :limit
+        """, params)
         
-        # Parse JSON fields for each game and fetch user info
+        # Parse JSON fields for each game and collect every referenced user id
+        all_user_ids = set()
+        for game in games:
+            game['users'] = db.decode_ids(game['users'])
+            all_user_ids.update(game['users'])
+            if game.get('ownerid'):
+                all_user_ids.add(game['ownerid'])
+
+        # Fetch user info for all games with a single query
+        users_map = fetch_users_map(all_user_ids)
         for game in games:
-            user_ids = json.loads(game['users']) if game['users'] else []
-            game['wordlist'] = json.loads(game['wordlist']) if game['wordlist'] else []
-            game['result'] = json.loads(game['result']) if game['result'] else []
+            user_ids = game['users']
             game['is_joined'] = uid in user_ids
+            game['users'] = [users_map[user_id] for user_id in user_ids if user_id in users_map]
+            game['owner'] = users_map.get(game['ownerid']) if game.get('ownerid') else None
 
-            # Fetch user info for all users in the game
-            users_info = []
-            for user_id in user_ids:
-                user = db.fetchone('SELECT id, username FROM "user" WHERE id = :id', {'id': user_id})
-                if user:
-                    users_info.append(user)
-            game['users'] = users_info
+        next_cursor = games[-1]['id'] if len(games) == limit else None
 
-            # Fetch owner info if present
-            owner_info = None
-            if game.get('ownerid'):
-                owner_info = db.fetchone('SELECT id, username FROM "user" WHERE id = :id', {'id': game['ownerid']})
-            game['owner'] = owner_info
-        
-        return jsonify({'success': True, 'games': games}), 200
+        response = make_response(jsonify({
+            'success': True,
+            'games': games,
+            'next_cursor': next_cursor,
+            'version': current_version
+        }), 200)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
         print(f"Game list error: {e}")
         return jsonify({'success': False, 'message': 'Server error'}), 500
 
 @app.route('/api/game/<int:game_id>', methods=['GET'])
+@login_required
 def api_game_get(game_id):
     """Get game details."""
     try:
-        uid = request.args.get('uid', type=int)
-        pw_hash = request.args.get('pwhash', '').strip()
-        
-        if not uid or not pw_hash:
-            return jsonify({'success': False, 'message': 'Missing parameters'}), 400
-        
-        # Verify authentication
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False, 'message': 'Authentication failed'}), 401
-        
         # Get game info
         game = db.fetchone("""
-            SELECT g.id, g.dictid, d.dictname, g.users, g.wordlist, g.result, g.status, g.ownerid
+            SELECT g.id, g.dictid, d.dictname, g.users, g.wordlist, g.words, r.result::text AS result, g.status, g.ownerid
             FROM "game" g
             LEFT JOIN "dict" d ON g.dictid = d.id
+            LEFT JOIN game_result r ON r.gameid = g.id
             WHERE g.id = :id
         """, {'id': game_id})
         
@@ -937,28 +1221,21 @@ def api_game_get(game_id):
             return jsonify({'success': False, 'message': 'Game not found'}), 404
         
         # Parse JSON fields
-        game['users'] = json.loads(game['users']) if game['users'] else []
-        game['wordlist'] = json.loads(game['wordlist']) if game['wordlist'] else []
-        game['result'] = json.loads(game['result']) if game['result'] else []
-
-        # Get user info for all users in the game
-        users_info = []
-        for user_id in game['users']:
-            user = db.fetchone('SELECT id, username FROM "user" WHERE id = :id', {'id': user_id})
-            if user:
-                users_info.append(user)
-        
-        # Get owner info
-        owner_info = None
-        if game.get('ownerid'):
-            owner_info = db.fetchone('SELECT id, username FROM "user" WHERE id = :id', {'id': game['ownerid']})
-        
-        # Get word info for all words in the wordlist
-        words_info = []
-        for word_id in game['wordlist']:
-            word = db.fetchone('SELECT id, english, chinese FROM "word" WHERE id = :id', {'id': word_id})
-            if word:
-                words_info.append(word)
+        game['users'] = db.decode_ids(game['users'])
+        game['wordlist'] = db.decode_ids(game['wordlist'])
+        game['result'] = db.decode_json(game['result'], [])
+
+        # Get user info for all users in the game (and the owner) with a single query
+        users_map = fetch_users_map(game['users'] + [game.get('ownerid')])
+        users_info = [users_map[user_id] for user_id in game['users'] if user_id in users_map]
+        owner_info = users_map.get(game['ownerid']) if game.get('ownerid') else None
+        
+        # Get word info for all words in the wordlist (snapshot or cached dict words), kept in wordlist order
+        words_map = game_words_map(game, game['wordlist'])
+        words_info = [
+            {'id': words_map[word_id]['id'], 'english': words_map[word_id]['english'], 'chinese': words_map[word_id]['chinese']}
+            for word_id in game['wordlist'] if word_id in words_map
+        ]
         
         # Calculate perf for each user
         perf_map = {}
@@ -984,9 +1261,9 @@ def api_game_get(game_id):
             if game['users'] and current_index < len(game['wordlist']):
                 next_turn_user = game['users'][current_index % len(game['users'])]
                 next_word_id = game['wordlist'][current_index]
-                # fetch next word info (Chinese prompt + english expected answer)
-                w = db.fetchone('SELECT id, english, chinese FROM "word" WHERE id = :id AND deleted = 0', {'id': next_word_id})
-                if w:
+                # next word info (Chinese prompt + english expected answer) comes from the words already loaded
+                w = words_map.get(next_word_id)
+                if w and not w['deleted']:
                     next_word_info = {'id': w['id'], 'english': w['english'], 'chinese': w['chinese']}
         except Exception:
             next_turn_user = None
@@ -1013,45 +1290,91 @@ def api_game_get(game_id):
         print(f"Game get error: {e}")
         return jsonify({'success': False, 'message': 'Server error'}), 500
 
+# Game event stream (Server-Sent Events)
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_STREAM_SECONDS = 300
+
+def publish_game_event(game_id, event, lobby=True):
+    """Push a small delta to watchers of the game and, if the lobby shows the change, notify it."""
+    event = dict(event, game_id=game_id)
+    try:
+        events.broker.publish(events.game_channel(game_id), event)
+        if lobby:
+            events.broker.publish(events.LOBBY_CHANNEL, {'type': 'game_changed', 'game_id': game_id})
+    except Exception as e:
+        # Events are best effort; clients resync on reconnect
+        print(f"Publish game event error: {e}")
+
+def event_stream_response(channel):
+    q = events.broker.subscribe(channel)
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            # Tells clients whether they can rely on the stream alone or must keep polling
+            yield f"event: hello\ndata: {json.dumps({'shared': events.broker.shared})}\n\n"
+            waited = 0
+            while waited < SSE_MAX_STREAM_SECONDS:
+                try:
+                    event = q.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    waited += SSE_KEEPALIVE_SECONDS
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {event.get('type', 'message')}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            events.broker.unsubscribe(channel, q)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/game/events', methods=['GET'])
+@login_required
+def api_game_list_events():
+    """Stream lobby events: one `game_changed` event whenever any game changes."""
+    return event_stream_response(events.LOBBY_CHANNEL)
+
+@app.route('/api/game/<int:game_id>/events', methods=['GET'])
+@login_required
+def api_game_events(game_id):
+    """Stream deltas of one game (answer / users / status events)."""
+    return event_stream_response(events.game_channel(game_id))
+
 @app.route('/api/game/<int:game_id>/join', methods=['POST'])
+@login_required
 def api_game_join(game_id):
     """Join a game (only if not started)."""
     try:
-        data = request.get_json()
-        uid = int(data.get('uid'))
-        pw_hash = data.get('pwhash', '').strip()
-        
-        if not uid or not pw_hash:
-            return jsonify({'success': False, 'message': 'Missing parameters'}), 400
-        
-        # Verify authentication
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False, 'message': 'Authentication failed'}), 401
-        
-        # Get game
-        game = db.fetchone('SELECT users, status, result FROM "game" WHERE id = :id', {'id': game_id})
-        
-        if not game:
-            return jsonify({'success': False, 'message': 'Game not found'}), 404
-        
-        if game['status'] != -1:
-            return jsonify({'success': False, 'message': 'Game already started, cannot join'}), 400
-        
-        # Check if game is finished (has results)
-        result = json.loads(game['result']) if game['result'] else []
-        if result:
-            return jsonify({'success': False, 'message': 'Game already finished, cannot join'}), 400
-        
-        # Parse users and add new user
-        users = json.loads(game['users']) if game['users'] else []
-        if uid in users:
-            return jsonify({'success': False, 'message': 'Already joined'}), 400
-        
-        users.append(uid)
-        random.shuffle(users)  # Re-shuffle user order
-        
-        # Update game
-        db.execute('UPDATE "game" SET users = :users WHERE id = :id', {'users': json.dumps(users), 'id': game_id})
+        uid = g.current_user['id']
+        
+        # Get game; the row stays locked until the users list is written back,
+        # so concurrent joins/leaves cannot overwrite each other
+        with db.transaction() as tx:
+            game = tx.fetchone('SELECT users, status, answer_count FROM "game" WHERE id = :id FOR UPDATE', {'id': game_id})
+            
+            if not game:
+                return jsonify({'success': False, 'message': 'Game not found'}), 404
+            
+            if game['status'] != -1:
+                return jsonify({'success': False, 'message': 'Game already started, cannot join'}), 400
+            
+            # Check if game is finished (has results)
+            if game['answer_count'] > 0:
+                return jsonify({'success': False, 'message': 'Game already finished, cannot join'}), 400
+            
+            # Parse users and add new user
+            users = db.decode_ids(game['users'])
+            if uid in users:
+                return jsonify({'success': False, 'message': 'Already joined'}), 400
+            
+            users.append(uid)
+            random.shuffle(users)  # Re-shuffle user order
+            
+            # Update game
+            tx.execute("""UPDATE "game" SET users = :users, version = nextval('game_version_seq') WHERE id = :id""", {'users': db.encode_ids(users), 'id': game_id})
+        publish_game_event(game_id, {'type': 'users', 'users': users})
         
         return jsonify({'success': True, 'message': 'Joined game'}), 200
     except Exception as e:
@@ -1059,41 +1382,35 @@ def api_game_join(game_id):
         return jsonify({'success': False, 'message': 'Server error'}), 500
 
 @app.route('/api/game/<int:game_id>/leave', methods=['POST'])
+@login_required
 def api_game_leave(game_id):
     """Leave a game (only if not started)."""
     try:
-        data = request.get_json()
-        uid = int(data.get('uid'))
-        pw_hash = data.get('pwhash', '').strip()
-        
-        if not uid or not pw_hash:
-            return jsonify({'success': False, 'message': 'Missing parameters'}), 400
-        
-        # Verify authentication
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False, 'message': 'Authentication failed'}), 401
-        
-        # Get game
-        game = db.fetchone('SELECT users, status, ownerid FROM "game" WHERE id = :id', {'id': game_id})
-        
-        if not game:
-            return jsonify({'success': False, 'message': 'Game not found'}), 404
-        
-        if game['status'] != -1:
-            return jsonify({'success': False, 'message': 'Cannot leave started or finished game'}), 400
-        
-        # Parse users and remove user
-        users = json.loads(game['users']) if game['users'] else []
-        # Owner cannot leave the game
-        if game.get('ownerid') and uid == game.get('ownerid'):
-            return jsonify({'success': False, 'message': 'Owner cannot leave the game'}), 400
-        if uid not in users:
-            return jsonify({'success': False, 'message': 'Not in game'}), 400
-        
-        users.remove(uid)
-        
-        # Update game
-        db.execute('UPDATE "game" SET users = :users WHERE id = :id', {'users': json.dumps(users), 'id': game_id})
+        uid = g.current_user['id']
+        
+        # Get game (row locked until the users list is written back)
+        with db.transaction() as tx:
+            game = tx.fetchone('SELECT users, status, ownerid FROM "game" WHERE id = :id FOR UPDATE', {'id': game_id})
+            
+            if not game:
+                return jsonify({'success': False, 'message': 'Game not found'}), 404
+            
+            if game['status'] != -1:
+                return jsonify({'success': False, 'message': 'Cannot leave started or finished game'}), 400
+            
+            # Parse users and remove user
+            users = db.decode_ids(game['users'])
+            # Owner cannot leave the game
+            if game.get('ownerid') and uid == game.get('ownerid'):
+                return jsonify({'success': False, 'message': 'Owner cannot leave the game'}), 400
+            if uid not in users:
+                return jsonify({'success': False, 'message': 'Not in game'}), 400
+            
+            users.remove(uid)
+            
+            # Update game
+            tx.execute("""UPDATE "game" SET users = :users, version = nextval('game_version_seq') WHERE id = :id""", {'users': db.encode_ids(users), 'id': game_id})
+        publish_game_event(game_id, {'type': 'users', 'users': users})
         
         return jsonify({'success': True, 'message': 'Left game'}), 200
     except Exception as e:
@@ -1101,20 +1418,10 @@ def api_game_leave(game_id):
         return jsonify({'success': False, 'message': 'Server error'}), 500
 
 @app.route('/api/game/<int:game_id>/start', methods=['POST'])
+@login_required
 def api_game_start(game_id):
     """Start a game (only creator)."""
     try:
-        data = request.get_json()
-        uid = int(data.get('uid'))
-        pw_hash = data.get('pwhash', '').strip()
-        
-        if not uid or not pw_hash:
-            return jsonify({'success': False, 'message': 'Missing parameters'}), 400
-        
-        # Verify authentication
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False, 'message': 'Authentication failed'}), 401
-        
         # Get game
         game = db.fetchone('SELECT users FROM "game" WHERE id = :id', {'id': game_id})
         
@@ -1125,7 +1432,8 @@ def api_game_start(game_id):
         # For now, allow any user to start (as per gen.md: "发起者有权点击开始按钮开始对局")
         # TODO: Store creator_id in game table for proper authorization
         
-        db.execute('UPDATE "game" SET status = :status WHERE id = :id', {'status': 0, 'id': game_id})
+        db.execute("""UPDATE "game" SET status = :status, version = nextval('game_version_seq') WHERE id = :id""", {'status': 0, 'id': game_id})
+        publish_game_event(game_id, {'type': 'status', 'status': 0})
         
         return jsonify({'success': True, 'message': 'Game started'}), 200
     except Exception as e:
@@ -1133,36 +1441,30 @@ def api_game_start(game_id):
         return jsonify({'success': False, 'message': 'Server error'}), 500
 
 @app.route('/api/game/<int:game_id>/answer', methods=['POST'])
+@login_required
 def api_game_answer(game_id):
     """Submit an answer to a word."""
     try:
         data = request.get_json()
-        uid = int(data.get('uid'))
-        pw_hash = data.get('pwhash', '').strip()
+        uid = g.current_user['id']
         word_id = int(data.get('word_id'))
         answer = data.get('answer', '').strip().lower()
-        print(data,uid,word_id,answer)
-        if not uid or not pw_hash or not word_id or not answer:
+        if not word_id or not answer:
             return jsonify({'success': False, 'message': 'Missing parameters'}), 400
         
-        # Verify authentication
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False, 'message': 'Authentication failed'}), 401
-        
         # Get game
-        game = db.fetchone('SELECT users, result, wordlist FROM "game" WHERE id = :id', {'id': game_id})
+        game = db.fetchone('SELECT dictid, users, wordlist, words, answer_count FROM "game" WHERE id = :id', {'id': game_id})
         if not game:
             return jsonify({'success': False, 'message': 'Game not found'}), 404
         
         # Check if user is in the game
-        users = json.loads(game['users']) if game['users'] else []
+        users = db.decode_ids(game['users'])
         if uid not in users:
             return jsonify({'success': False, 'message': 'Not in game'}), 400
 
-        # Parse existing results and determine whose turn it is and which word is expected
-        result = json.loads(game['result']) if game['result'] else []
-        wordlist = json.loads(game['wordlist']) if game['wordlist'] else []
-        current_index = len(result)
+        # Determine whose turn it is and which word is expected from the number of answers so far
+        wordlist = db.decode_ids(game['wordlist'])
+        current_index = game['answer_count']
 
         if current_index >= len(wordlist):
             return jsonify({'success': False, 'message': 'All words have been answered'}), 400
@@ -1176,34 +1478,55 @@ def api_game_answer(game_id):
             return jsonify({'success': False, 'message': 'This is not the expected word for your turn'}), 400
 
         # Get expected word info
-        word = db.fetchone('SELECT english, chinese FROM "word" WHERE id = :id AND deleted = 0', {'id': word_id})
-        if not word:
+        words_map = game_words_map(game, wordlist)
+        word = words_map.get(word_id)
+        if not word or word['deleted']:
             return jsonify({'success': False, 'message': 'Word not found'}), 404
 
         # Check if answer is correct (answer should be the English word; prompt will be Chinese in UI)
-        is_correct = answer.strip().lower() == word['english'].strip().lower()
+        is_correct = grader.grade(answer, word['english'])
 
-        # Append result
-        result.append({
+        # Append the answer to the game's answer log (seq = position in the wordlist).
+        # The turn counter only advances if nobody else answered since we read it;
+        # counter update and log insert run as one statement, so they commit together.
+        entry = {
             'uid': uid,
             'word_id': word_id,
             'answer': answer,
             'result': is_correct
-        })
-
-        # Update game result
-        db.execute('UPDATE "game" SET result = :result WHERE id = :id', {'result': json.dumps(result), 'id': game_id})
+        }
+        recorded = db.execute("""
+            WITH claimed AS (
+                UPDATE "game"
+                SET answer_count = answer_count + 1, version = nextval('game_version_seq')
+                WHERE id = :gameid AND answer_count = :seq
+                RETURNING id
+            )
+            INSERT INTO game_answer (gameid, seq, uid, word_id, answer, result)
+            SELECT id, :seq, :uid, :word_id, :answer, :result FROM claimed
+        """, dict(entry, gameid=game_id, seq=current_index))
+        if not recorded:
+            return jsonify({'success': False, 'conflict': True, 'message': 'Turn already answered, please refresh'}), 409
+        answer_count = current_index + 1
 
         # Prepare next turn info
         next_turn = None
         next_word = None
-        if len(result) < len(game['wordlist']):
-            next_turn = users[len(result) % len(users)]
-            next_word_id = game['wordlist'][len(result)]
-            nw = db.fetchone('SELECT id, english, chinese FROM "word" WHERE id = :id AND deleted = 0', {'id': next_word_id})
-            if nw:
+        if answer_count < len(wordlist):
+            next_turn = users[answer_count % len(users)]
+            next_word_id = wordlist[answer_count]
+            nw = words_map.get(next_word_id)
+            if nw and not nw['deleted']:
                 next_word = {'id': nw['id'], 'english': nw['english'], 'chinese': nw['chinese']}
 
+        publish_game_event(game_id, {
+            'type': 'answer',
+            'index': current_index,
+            'entry': entry,
+            'next_turn': next_turn,
+            'next_word': next_word
+        }, lobby=False)  # the lobby does not show answers
+
         return jsonify({
             'success': True,
             'correct': is_correct,
@@ -1216,56 +1539,106 @@ def api_game_answer(game_id):
         print(f"Game answer error: {e}")
         return jsonify({'success': False, 'message': 'Server error'}), 500
 
+def apply_rating_engine(tx, game_id, perf_map):
+    """Finish the game and apply `rating_engine` to its players inside `tx`.
+
+    Elo/Glicko need the current ratings, so the players' rows are locked while
+    the new values are computed. Returns False if the game was already finished.
+    """
+    claimed = tx.fetchone("""
+        UPDATE "game" SET status = 1, version = nextval('game_version_seq')
+        WHERE id = :id AND status <> 1
+        RETURNING id
+    """, {'id': game_id})
+    if not claimed:
+        return False
+    
+    ids = list(perf_map.keys())
+    if rating_engine.uses_deviation:
+        rows = tx.fetchall('SELECT id, rating, rating_rd, rating_vol FROM "user" WHERE id = ANY(:ids) ORDER BY id FOR UPDATE', {'ids': ids})
+        states = {r['id']: rating.RatingState(r['rating'] or 0, r['rating_rd'], r['rating_vol']) for r in rows}
+    else:
+        rows = tx.fetchall('SELECT id, rating FROM "user" WHERE id = ANY(:ids) ORDER BY id FOR UPDATE', {'ids': ids})
+        states = {r['id']: rating.RatingState(r['rating'] or 0) for r in rows}
+    
+    new_states = rating_engine.update(states, perf_map)
+    ids = list(new_states.keys())
+    params = {'ids': ids, 'ratings': [new_states[i].rating for i in ids]}
+    if rating_engine.uses_deviation:
+        params.update(rds=[new_states[i].rd for i in ids], vols=[new_states[i].vol for i in ids])
+        tx.execute("""
+            UPDATE "user" u
+            SET rating = v.rating, rating_rd = v.rd, rating_vol = v.vol
+            FROM unnest(CAST(:ids AS integer[]), CAST(:ratings AS double precision[]), CAST(:rds AS double precision[]), CAST(:vols AS double precision[])) AS v(id, rating, rd, vol)
+            WHERE u.id = v.id
+        """, params)
+    else:
+        tx.execute("""
+            UPDATE "user" u
+            SET rating = v.rating
+            FROM unnest(CAST(:ids AS integer[]), CAST(:ratings AS double precision[])) AS v(id, rating)
+            WHERE u.id = v.id
+        """, params)
+    return True
+
 @app.route('/api/game/<int:game_id>/end', methods=['POST'])
+@login_required
 def api_game_end(game_id):
     """End a game and calculate ratings."""
     try:
-        data = request.get_json()
-        uid = int(data.get('uid'))
-        pw_hash = data.get('pwhash', '').strip()
-        
-        if not uid or not pw_hash:
-            return jsonify({'success': False, 'message': 'Missing parameters'}), 400
-        
-        # Verify authentication
-        if not check_auth(uid, pw_hash):
-            return jsonify({'success': False, 'message': 'Authentication failed'}), 401
+        uid = g.current_user['id']
         
         # Get game
-        game = db.fetchone('SELECT users, result FROM "game" WHERE id = :id', {'id': game_id})
+        game = db.fetchone("""
+            SELECT g.users, r.result::text AS result
+            FROM "game" g
+            LEFT JOIN game_result r ON r.gameid = g.id
+            WHERE g.id = :id
+        """, {'id': game_id})
         
         if not game:
             return jsonify({'success': False, 'message': 'Game not found'}), 404
         
         # Check if user is in the game (or anyone can end?)
-        users = json.loads(game['users']) if game['users'] else []
+        users = db.decode_ids(game['users'])
         if uid not in users:
             return jsonify({'success': False, 'message': 'Not in game'}), 400
         
         # Calculate perf for each user
-        result = json.loads(game['result']) if game['result'] else []
-        perf_map = {}
-        for user_id in users:
-            perf_map[user_id] = 0
-        
-        for result_item in result:
-            uid_result = result_item.get('uid')
-            is_correct = result_item.get('result', False)
-            if uid_result in perf_map:
-                if is_correct:
-                    perf_map[uid_result] += 1
-                else:
-                    perf_map[uid_result] -= 1
-        
-        # Update ratings for each user
-        for user_id, perf in perf_map.items():
-            user = db.fetchone('SELECT rating FROM "user" WHERE id = :id', {'id': user_id})
-            if user:
-                new_rating = user['rating'] + perf
-                db.execute('UPDATE "user" SET rating = :rating WHERE id = :id', {'rating': new_rating, 'id': user_id})
-        
-        # Update game: status=1 (finished)
-        db.execute('UPDATE "game" SET status = :status WHERE id = :id', {'status': 1, 'id': game_id})
+        result = db.decode_json(game['result'], [])
+        perf_map = rating.game_performance(users, result)
+        
+        with db.transaction() as tx:
+            if rating_engine.name == 'classic':
+                # rating += perf needs no read: mark the game finished (status=1) and
+                # apply every delta in one statement. Ratings are only touched when
+                # this call is the one that moved the game to finished, so ending a
+                # game twice cannot double-apply them.
+                row = tx.fetchone("""
+                    WITH finished AS (
+                        UPDATE "game"
+                        SET status = 1, version = nextval('game_version_seq')
+                        WHERE id = :id AND status <> 1
+                        RETURNING id
+                    ), rated AS (
+                        UPDATE "user" u
+                        SET rating = u.rating + v.delta
+                        FROM unnest(CAST(:ids AS integer[]), CAST(:deltas AS integer[])) AS v(id, delta)
+                        WHERE u.id = v.id AND EXISTS (SELECT 1 FROM finished)
+                        RETURNING u.id
+                    )
+                    SELECT (SELECT COUNT(*) FROM finished) AS finished
+                """, {'id': game_id, 'ids': list(perf_map.keys()), 'deltas': list(perf_map.values())})
+                finished = row['finished']
+            else:
+                finished = apply_rating_engine(tx, game_id, perf_map)
+            if finished:
+                mark_leaderboard_dirty(tx)
+        
+        if not finished:
+            return jsonify({'success': True, 'perf': perf_map, 'message': 'Game already ended'}), 200
+        
+        publish_game_event(game_id, {'type': 'status', 'status': 1, 'perf': perf_map})
         
         return jsonify({'success': True, 'perf': perf_map, 'message': 'Game ended and ratings updated'}), 200
     except Exception as e:
@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import string
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+os.environ.setdefault('SESSION_SECRET', 'bench')
+
+import app as app_module
+import db
+
+# Benchmarks of the API routes against a real database (DATABASE_URL),
+# through the Flask test client:
+#
+#   python api/bench.py game-list --games 100,1000,10000
+#   python api/bench.py import --rows 20000
+#   python api/bench.py game-get --words 100,1000,5000
+#   python api/bench.py pool --threads 8     (DB_POOL_MODE=queue against null)
+#
+# Every run creates its own users, dict, words and games (names starting with
+# "bench-") and deletes them at the end. Rows written by the requests (e.g.
+# game answers) are removed with them, so run it against a development or
+# staging database, never production.
+
+
+class QueryCounter:
+    """Counts the statements sent through db.engine while active."""
+
+    def __init__(self):
+        self.count = 0
+
+    def _before_cursor_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+class Fixture:
+    """Rows created for one run, removed again by `cleanup`."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.tag = 'bench-' + ''.join(rng.choice(string.ascii_lowercase) for _ in range(8))
+        self.user_ids = []
+        self.dict_ids = []
+
+    def users(self, count, password='bench-password'):
+        pwhash = app_module.hash_password(password)
+        stored = app_module.passwords.make_hash(pwhash)
+        rows = [(f'{self.tag}-{i}', stored, '', 0, 'normal', False) for i in range(count)]
+        with db.transaction() as tx:
+            tx.insert_values('INSERT INTO "user" (username, pwhash, introduction, rating, type, deleted) VALUES %s', rows)
+            users = tx.fetchall('SELECT id FROM "user" WHERE username LIKE :prefix ORDER BY id', {'prefix': self.tag + '-%'})
+        self.user_ids = [u['id'] for u in users]
+        return [{'id': user_id, 'pwhash': pwhash} for user_id in self.user_ids]
+
+    def dict(self, words=0):
+        dict_id = db.insert_returning_id(
+            'INSERT INTO "dict" (dictname, word_count) VALUES (:name, :count) RETURNING id',
+            {'name': self.tag, 'count': words}
+        )
+        self.dict_ids.append(dict_id)
+        db.insert_values('INSERT INTO "word" (dictid, english, chinese) VALUES %s',
+                         [(dict_id, f'word{i}', f'词{i}') for i in range(words)])
+        return dict_id
+
+    def games(self, count, dict_id, word_ids, players=(2, 4)):
+        rows = []
+        for _ in range(count):
+            users = self.rng.sample(self.user_ids, self.rng.randint(*players))
+            rows.append((dict_id, db.encode_ids(users), db.encode_ids(word_ids), self.rng.choice((-1, 0, 1)), users[0]))
+        db.insert_values('INSERT INTO "game" (dictid, users, wordlist, status, ownerid) VALUES %s', rows)
+
+    def cleanup(self):
+        with db.transaction() as tx:
+            tx.execute('DELETE FROM game_answer WHERE gameid IN (SELECT id FROM "game" WHERE dictid = ANY(:ids))', {'ids': self.dict_ids})
+            tx.execute('DELETE FROM "game" WHERE dictid = ANY(:ids)', {'ids': self.dict_ids})
+            tx.execute('DELETE FROM "word" WHERE dictid = ANY(:ids)', {'ids': self.dict_ids})
+            tx.execute('DELETE FROM "dict" WHERE id = ANY(:ids)', {'ids': self.dict_ids})
+            tx.execute('DELETE FROM "user" WHERE username LIKE :prefix', {'prefix': self.tag + '-%'})
+
+
+def client_for(user):
+    client = app_module.app.test_client()
+    client.set_cookie('uid', str(user['id']))
+    client.set_cookie('pwhash', user['pwhash'])
+    return client
+
+
+def measure(client, path, requests):
+    """(statements per request, median ms, mean ms) of `requests` GETs of `path`."""
+    client.get(path)  # warm up: session cookie, caches
+    timings = []
+    with QueryCounter() as counter:
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get(path)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+    return counter.count / requests, statistics.median(timings), statistics.fmean(timings)
+
+
+def _bench_game_list(args):
+    fixture = Fixture(random.Random(args.seed))
+    try:
+        users = fixture.users(args.players)
+        dict_id = fixture.dict(args.words)
+        word_ids = [w['id'] for w in db.fetchall('SELECT id FROM "word" WHERE dictid = :id ORDER BY id', {'id': dict_id})]
+        client = client_for(users[0])
+        created = 0
+        for size in sorted(int(s) for s in args.games.split(',')):
+            fixture.games(size - created, dict_id, word_ids)
+            created = size
+            for label, path in (('first page', '/api/game/list'), ('status=-1,0', '/api/game/list?status=-1,0')):
+                queries, median, mean = measure(client, path, args.requests)
+                print(f"{size:8d} games  {label:12s} {queries:5.1f} queries/request  "
+                      f"{median:8.2f} ms median  {mean:8.2f} ms mean")
+    finally:
+        fixture.cleanup()
+
+
+def timed(fn, repeat):
+    """Median ms of `repeat` calls of `fn`."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def _bench_game_get(args):
+    fixture = Fixture(random.Random(args.seed))
+    try:
+        users = fixture.users(args.players)
+        clients = {user['id']: client_for(user) for user in users}
+        owner = clients[users[0]['id']]
+        for size in sorted(int(s) for s in args.words.split(',')):
+            dict_id = fixture.dict(size)
+            for snapshot in (False, True):
+                game_id = owner.post('/api/game/create', json={'dict_id': dict_id, 'snapshot': snapshot}).get_json()['game_id']
+                for user in users[1:]:
+                    clients[user['id']].post(f'/api/game/{game_id}/join')
+                owner.post(f'/api/game/{game_id}/start')
+                for _ in range(min(args.answers, size)):
+                    game = owner.get(f'/api/game/{game_id}').get_json()['game']
+                    word = game['next_word']
+                    clients[game['next_turn']].post(f'/api/game/{game_id}/answer', json={'word_id': word['id'], 'answer': word['english']})
+
+                path = f'/api/game/{game_id}'
+                label = f"{size:6d} words  {'snapshot' if snapshot else 'dict    '}"
+                queries, median, _ = measure(owner, path, args.requests)
+                print(f"{label}  GET warm {queries:4.1f} queries  {median:8.2f} ms median")
+
+                def cold():
+                    # Another instance, or the first request after a dict write
+                    app_module.word_cache.clear()
+                    assert owner.get(path).status_code == 200
+                print(f"{label}  GET cold dict cache      {timed(cold, args.requests):8.2f} ms median")
+
+            # The id list and answers of the last (snapshot) game, as integer[] and
+            # as the JSON text DB_ID_LIST_FORMAT=json writes (uncompressed sizes)
+            wordlist = db.decode_ids(db.fetchone('SELECT wordlist FROM "game" WHERE id = :id', {'id': game_id})['wordlist'])
+            text = json.dumps(wordlist)
+            row = db.fetchone("""
+                SELECT r.result::text AS result, pg_column_size(CAST(:wordlist AS integer[])) AS array_bytes,
+                       pg_column_size(CAST(:text AS text)) AS json_bytes, pg_column_size(g.words) AS snapshot_bytes
+                FROM "game" g LEFT JOIN game_result r ON r.gameid = g.id WHERE g.id = :id
+            """, {'id': game_id, 'wordlist': wordlist, 'text': text})
+            result_query = 'SELECT result::text AS result FROM game_result WHERE gameid = :id'
+            read = timed(lambda: db.decode_json(db.fetchone(result_query, {'id': game_id})['result'], []), args.requests)
+            repeat = args.requests * 20
+            as_json = timed(lambda: db.decode_ids(text), repeat) * 1000
+            as_array = timed(lambda: db.decode_ids(wordlist), repeat) * 1000
+            answers = timed(lambda: json.loads(row['result']), repeat) * 1000
+            print(f"{size:6d} words  wordlist {row['array_bytes']:7d} B integer[]  {row['json_bytes']:7d} B json  "
+                  f"snapshot {row['snapshot_bytes']:7d} B")
+            print(f"{size:6d} words  decode wordlist {as_array:8.1f} us integer[]  {as_json:8.1f} us json  "
+                  f"game_result read {read:6.2f} ms  decode {args.answers} answers {answers:6.1f} us")
+    finally:
+        fixture.cleanup()
+
+
+def _bench_import(args):
+    rng = random.Random(args.seed)
+    fixture = Fixture(rng)
+
+    def word():
+        return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 12)))
+
+    try:
+        client = client_for(fixture.users(1)[0])
+        lines = [f'{word()},{word()}' for _ in range(args.rows)]
+
+        # The old route: one INSERT (one connection and transaction) per row
+        dict_id = fixture.dict()
+        rows = [line.split(',') for line in lines[:args.baseline_rows]]
+        started = time.perf_counter()
+        for english, chinese in rows:
+            db.execute('INSERT INTO "word" (dictid, english, chinese, deleted) VALUES (:dictid, :english, :chinese, false)',
+                       {'dictid': dict_id, 'english': english, 'chinese': chinese})
+        elapsed = time.perf_counter() - started
+        print(f"per-row INSERT (old)  {len(rows):8d} rows  {elapsed:7.2f}s  {len(rows) / elapsed:12,.0f} rows/s")
+
+        for label, dedupe in (('import-csv', False), ('import-csv dedupe', True)):
+            dict_id = fixture.dict()
+            started = time.perf_counter()
+            response = client.post(f'/api/dict/{dict_id}/import-csv', json={'csv': '\n'.join(lines), 'dedupe': dedupe})
+            elapsed = time.perf_counter() - started
+            result = response.get_json()
+            assert response.status_code == 200, result
+            print(f"{label:20s}  {result['count']:8d} rows  {elapsed:7.2f}s  {args.rows / elapsed:12,.0f} rows/s  "
+                  f"({result['skipped']} skipped)")
+    finally:
+        fixture.cleanup()
+
+
+def _bench_pool(args):
+    if args.mode is None:
+        # The pool is built when db is imported, so each mode runs in its own process
+        for mode in ('queue', 'null'):
+            subprocess.run([sys.executable, os.path.abspath(__file__), 'pool', '--mode', mode,
+                            '--threads', str(args.threads), '--requests', str(args.requests)],
+                           env=dict(os.environ, DB_POOL_MODE=mode), check=True)
+        return
+    if args.mode != db.POOL_MODE:
+        sys.exit(f"DB_POOL_MODE is {db.POOL_MODE}, not {args.mode}")
+
+    def request(_):
+        # A typical route: one read, then a short write transaction
+        started = time.perf_counter()
+        db.fetchone('SELECT id, username FROM "user" WHERE id = :id', {'id': 1})
+        with db.transaction() as tx:
+            tx.fetchone('SELECT COALESCE(MAX(version), 0) AS version FROM "game"')
+            tx.fetchone('SELECT 1 AS ok')
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(request, range(args.threads)))  # warm up
+        before = db.pool_stats()
+        started = time.perf_counter()
+        timings = sorted(pool.map(request, range(args.requests)))
+        elapsed = time.perf_counter() - started
+    stats = db.pool_stats()
+    checkouts = stats['checkouts'] - before['checkouts']
+    print(f"{db.POOL_MODE:6s} {args.threads:3d} threads  {args.requests / elapsed:10,.0f} requests/s  "
+          f"{timings[len(timings) // 2]:7.2f} ms median  {timings[int(len(timings) * 0.99)]:7.2f} ms p99  "
+          f"{(stats['checkout_seconds'] - before['checkout_seconds']) / checkouts * 1000:6.2f} ms/checkout  "
+          f"{stats['connects'] - before['connects']} connects  {stats['waits'] - before['waits']} waits")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API benchmarks against DATABASE_URL')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    game_list = sub.add_parser('game-list', help='Query count and latency of /api/game/list as games accumulate')
+    game_list.add_argument('--games', default='100,1000,10000', help='comma separated total game counts')
+    game_list.add_argument('--players', type=int, default=50)
+    game_list.add_argument('--words', type=int, default=20)
+    game_list.add_argument('--requests', type=int, default=50)
+    game_list.add_argument('--seed', type=int, default=1)
+    game_list.set_defaults(func=_bench_game_list)
+
+    game_get = sub.add_parser('game-get', help='Latency of /api/game/<id> with and without a word snapshot, '
+                                               'game_result reads and id list decode cost')
+    game_get.add_argument('--words', default='100,1000,5000', help='comma separated dict (and game) sizes')
+    game_get.add_argument('--players', type=int, default=4)
+    game_get.add_argument('--answers', type=int, default=100)
+    game_get.add_argument('--requests', type=int, default=50)
+    game_get.add_argument('--seed', type=int, default=1)
+    game_get.set_defaults(func=_bench_game_get)
+
+    imports = sub.add_parser('import', help='Rows per second of the CSV import against one INSERT per row')
+    imports.add_argument('--rows', type=int, default=20000)
+    imports.add_argument('--baseline-rows', type=int, default=2000)
+    imports.add_argument('--seed', type=int, default=1)
+    imports.set_defaults(func=_bench_import)
+
+    pool = sub.add_parser('pool', help='Requests per second and checkout cost of each DB_POOL_MODE')
+    pool.add_argument('--threads', type=int, default=8)
+    pool.add_argument('--requests', type=int, default=5000)
+    pool.add_argument('--mode', choices=('queue', 'null'), default=None, help='run one mode only (default: both)')
+    pool.set_defaults(func=_bench_pool)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
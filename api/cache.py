@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Small per-process caches. Each serverless instance / worker has its own copy,
+# so entries must either expire (ttl) or be invalidated by the write paths.
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional per-entry TTL (seconds)."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires = item
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+class VersionedCache:
+    """LRU cache whose entries are invalidated by bumping a per-key version.
+
+    `get_or_load` tags each loaded value with the version seen *before* loading,
+    so a load that races with a `bump` is stored as already stale and reloaded
+    on the next read instead of serving old data until the TTL expires.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def version(self, key):
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def bump(self, key):
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+        self._cache.delete(key)
+
+    def get_or_load(self, key, loader):
+        version = self.version(key)
+        item = self._cache.get(key)
+        if item is not None and item[0] == version:
+            return item[1]
+        value = loader(key)
+        self._cache.set(key, (version, value))
+        return value
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        stats = self._cache.stats()
+        with self._lock:
+            stats['versions'] = sum(self._versions.values())
+        return stats
@@ -1,45 +1,264 @@
+import json
 import os
-from sqlalchemy import create_engine, text
+import threading
+import time
+from contextlib import contextmanager
+from psycopg2.extras import execute_values
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.pool import NullPool
 
 DATABASE_URL = os.getenv('DATABASE_URL') or (
     f"postgresql://{os.getenv('DB_USER','')}:" \
     f"{os.getenv('DB_PASSWORD','')}@{os.getenv('DB_HOST','localhost')}:{os.getenv('DB_PORT','5432')}/{os.getenv('DB_NAME','')}")
 
-# Create engine with reasonable defaults for serverless environments
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    future=True
-)
+# Pooling is configured from the environment:
+#   DB_POOL_MODE=queue (default)  keep a small pool per process, sized by
+#                                 DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT / DB_POOL_RECYCLE
+#   DB_POOL_MODE=null             no client-side pool; use behind an external pooler
+#                                 (PgBouncer / Supabase pooler on port 6543)
+# Instead of pool_pre_ping (one extra round trip per checkout) a connection is
+# only pinged when it sat idle in the pool for more than DB_PING_IDLE_SECONDS.
+POOL_MODE = os.getenv('DB_POOL_MODE', 'queue').lower()
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))
+PING_IDLE_SECONDS = float(os.getenv('DB_PING_IDLE_SECONDS', '30'))
+
+
+def _create_engine():
+    if POOL_MODE == 'null':
+        return create_engine(DATABASE_URL, poolclass=NullPool, executemany_mode='values_plus_batch', future=True)
+    return create_engine(
+        DATABASE_URL,
+        executemany_mode='values_plus_batch',
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        pool_recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        future=True
+    )
+
+
+engine = _create_engine()
+
+_stats_lock = threading.Lock()
+_stats = {'connects': 0, 'checkouts': 0, 'pings': 0, 'invalidated': 0, 'waits': 0, 'checkout_seconds': 0.0}
+
+
+def _count(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+@event.listens_for(engine, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    _count('connects')
+    connection_record.info['last_used'] = time.monotonic()
+
+
+@event.listens_for(engine, 'checkout')
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    last_used = connection_record.info.get('last_used')
+    if last_used is None or time.monotonic() - last_used < PING_IDLE_SECONDS:
+        return
+    _count('pings')
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    except Exception:
+        # The pool discards this connection and retries with a new one
+        _count('invalidated')
+        raise exc.DisconnectionError()
+    finally:
+        cursor.close()
+
+
+@event.listens_for(engine, 'checkin')
+def _on_checkin(dbapi_connection, connection_record):
+    connection_record.info['last_used'] = time.monotonic()
+
+
+def _exhausted():
+    # Every connection the pool may open is checked out: this checkout has to
+    # wait for one to be returned. Without a client-side pool nothing waits
+    # here (opening the connection is counted in checkout_seconds).
+    return POOL_MODE != 'null' and engine.pool.checkedout() >= POOL_SIZE + MAX_OVERFLOW
+
+
+def _connect():
+    waits = _exhausted()
+    started = time.monotonic()
+    conn = engine.connect()
+    elapsed = time.monotonic() - started
+    with _stats_lock:
+        _stats['checkouts'] += 1
+        _stats['checkout_seconds'] += elapsed
+        if waits:
+            _stats['waits'] += 1
+    return conn
+
+
+def pool_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['mode'] = POOL_MODE
+    if POOL_MODE != 'null':
+        pool = engine.pool
+        stats.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+    return stats
+
+
+class Transaction:
+    """Helpers bound to one connection and one open transaction (see `transaction()`).
+
+    `execute` also accepts a list of parameter dicts; the statement is then sent
+    as batched pages (psycopg2 execute_batch) instead of one round trip per set.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def fetchone(self, query, params=None):
+        row = self.conn.execute(text(query), params or {}).first()
+        return dict(row._mapping) if row else None
+
+    def fetchall(self, query, params=None):
+        rows = self.conn.execute(text(query), params or {}).fetchall()
+        return [dict(r._mapping) for r in rows]
+
+    def execute(self, query, params=None):
+        if isinstance(params, list) and not params:
+            return 0
+        return self.conn.execute(text(query), params or {}).rowcount
+
+    def insert_returning_id(self, query, params=None):
+        return self.conn.execute(text(query), params or {}).scalar()
+
+    def insert_values(self, query, rows, page_size=1000):
+        # See the module-level `insert_values`
+        if not rows:
+            return 0
+        cursor = self.conn.connection.cursor()
+        try:
+            execute_values(cursor, query, rows, page_size=page_size)
+        finally:
+            cursor.close()
+        return len(rows)
+
+    def execute_script(self, sql):
+        # Run a multi-statement SQL script as is (no bind parameters)
+        cursor = self.conn.connection.cursor()
+        try:
+            cursor.execute(sql)
+        finally:
+            cursor.close()
+
+
+@contextmanager
+def transaction():
+    # Group several statements on one connection: commit when the block exits,
+    # roll everything back if it raises.
+    with _connect() as conn, conn.begin():
+        yield Transaction(conn)
 
 
 def fetchone(query, params=None):
-    with engine.connect() as conn:
+    with _connect() as conn:
         result = conn.execute(text(query), params or {})
         row = result.first()
-        return dict(row) if row else None
+        return dict(row._mapping) if row else None
 
 
 def fetchall(query, params=None):
-    with engine.connect() as conn:
+    with _connect() as conn:
         result = conn.execute(text(query), params or {})
         rows = result.fetchall()
-        return [dict(r) for r in rows]
+        return [dict(r._mapping) for r in rows]
 
 
 def execute(query, params=None):
-    # For UPDATE/DELETE statements
-    with engine.begin() as conn:
+    # For UPDATE/DELETE statements (params may be a list of dicts for a batch)
+    with _connect() as conn, conn.begin():
         result = conn.execute(text(query), params or {})
         return result.rowcount
 
 
 def insert_returning_id(query, params=None):
     # Expects query to include RETURNING id
-    with engine.begin() as conn:
+    with _connect() as conn, conn.begin():
         result = conn.execute(text(query), params or {})
         # scalar() returns the first column of the first row
         try:
             return result.scalar()
         except Exception:
             return None
+
+
+def iterate(query, params=None, batch_size=1000):
+    # Stream rows through a server-side cursor, `batch_size` rows at a time,
+    # so large result sets are never held in memory at once.
+    with _connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(text(query), params or {})
+        for row in result:
+            yield dict(row._mapping)
+
+
+def insert_values(query, rows, page_size=1000):
+    # Bulk INSERT: `query` has a single `VALUES %s` placeholder and rows are tuples.
+    # Rows are sent as multi-row VALUES pages of `page_size`, all in one transaction.
+    if not rows:
+        return 0
+    with transaction() as tx:
+        return tx.insert_values(query, rows, page_size=page_size)
+
+
+# Codec for the id-list columns of "game" (users, wordlist).
+# Since migration 0014 they are integer[], which psycopg2 maps directly to
+# Python lists, so nothing is parsed in Python and each id takes 4 bytes.
+# Databases that have not run it yet keep JSON text. By default
+# (DB_ID_LIST_FORMAT=auto) the format follows the type of game.users, looked
+# up once per process; =json or =array forces one. Decoding accepts both.
+ID_LIST_FORMAT = os.getenv('DB_ID_LIST_FORMAT', 'auto').lower()
+_id_list_format = None if ID_LIST_FORMAT == 'auto' else ID_LIST_FORMAT
+
+
+def id_list_format():
+    global _id_list_format
+    if _id_list_format is None:
+        row = fetchone("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'game' AND column_name = 'users'
+        """)
+        _id_list_format = 'array' if row and row['data_type'] == 'ARRAY' else 'json'
+    return _id_list_format
+
+
+def encode_ids(values):
+    values = [int(v) for v in values]
+    if id_list_format() == 'array':
+        return values
+    return json.dumps(values)
+
+
+def decode_ids(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+
+def ids_length_sql(column):
+    # SQL expression for the number of ids stored in `column`
+    if id_list_format() == 'array':
+        return f'cardinality({column})'
+    return f'json_array_length({column}::json)'
+
+
+def decode_json(value, default=None):
+    # JSON values arrive as text (json/text columns, ::text casts) or already
+    # parsed (jsonb columns); return the Python value either way
+    if value is None or value == '':
+        return default
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
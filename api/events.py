@@ -0,0 +1,152 @@
+import json
+import os
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+
+import db
+
+# Game event pub/sub used by the SSE endpoints in `api/app.py`.
+#
+# `LocalBroker` delivers events to subscribers in the same process. It is the
+# default and is enough for a single worker (and for local testing); with
+# several instances, clients keep polling slowly besides the stream (`shared`
+# is sent to them in the stream's `hello` event).
+# `PostgresBroker` fans events out across workers/instances through Postgres
+# LISTEN/NOTIFY and then delivers them locally like `LocalBroker`.
+# Select it with EVENT_BROKER=postgres; it needs a session connection for
+# LISTEN (EVENT_DATABASE_URL, see `PostgresBroker`).
+
+PG_CHANNEL = 'wm_events'
+LOBBY_CHANNEL = 'lobby'
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class LocalBroker:
+    """In-process broker: each subscriber gets its own bounded queue."""
+
+    # Whether events published by other processes reach this process's subscribers
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channel):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(q)
+        return q
+
+    def unsubscribe(self, channel, q):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def publish(self, channel, event):
+        self._deliver(channel, event)
+
+    def _deliver(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # Slow consumer: drop the event, the client resyncs on reconnect
+                pass
+
+
+class PostgresBroker(LocalBroker):
+    """Broker shared between processes through Postgres LISTEN/NOTIFY.
+
+    The listener holds its own connection for as long as the process runs, so
+    it is opened outside the pool, on EVENT_DATABASE_URL (default DATABASE_URL).
+    LISTEN needs a session: behind a transaction-mode pooler (Supabase port
+    6543, DB_POOL_MODE=null) point EVENT_DATABASE_URL at the direct or
+    session-mode connection string. While no listener runs, events are
+    delivered locally and `shared` is False, so clients keep polling.
+    """
+
+    # Retry an unavailable listener at most this often
+    LISTEN_RETRY_SECONDS = 30
+
+    def __init__(self, dsn=None):
+        super().__init__()
+        self.dsn = dsn or os.getenv('EVENT_DATABASE_URL') or db.DATABASE_URL
+        self.shared = False
+        self._listener = None
+        self._listener_lock = threading.Lock()
+        self._failed_at = None
+
+    def subscribe(self, channel):
+        self._ensure_listener()
+        return super().subscribe(channel)
+
+    def publish(self, channel, event):
+        payload = json.dumps({'channel': channel, 'event': event})
+        # NOTIFY is only delivered when its transaction commits (db.execute commits);
+        # unlike LISTEN it also works through a transaction-mode pooler
+        db.execute('SELECT pg_notify(:pg_channel, :payload)', {'pg_channel': PG_CHANNEL, 'payload': payload})
+        if not self.shared:
+            self._deliver(channel, event)
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener and self._listener.is_alive():
+                return
+            if self._failed_at is not None and time.monotonic() - self._failed_at < self.LISTEN_RETRY_SECONDS:
+                return
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN {PG_CHANNEL}')
+            except psycopg2.Error as e:
+                print(f"Event broker cannot listen, delivering locally: {e}")
+                self._failed_at = time.monotonic()
+                return
+            self._failed_at = None
+            self.shared = True
+            self._listener = threading.Thread(target=self._listen, args=(conn,), daemon=True)
+            self._listener.start()
+
+    def _listen(self, conn):
+        try:
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        message = json.loads(notify.payload)
+                        self._deliver(message['channel'], message['event'])
+                    except (ValueError, KeyError) as e:
+                        print(f"Event broker bad payload: {e}")
+        except Exception as e:
+            print(f"Event broker listener error: {e}")
+        finally:
+            # Deliver locally until the next subscriber restarts the listener
+            self.shared = False
+            conn.close()
+
+
+def _create_broker():
+    if os.getenv('EVENT_BROKER', 'local').lower() == 'postgres':
+        return PostgresBroker()
+    return LocalBroker()
+
+
+broker = _create_broker()
+
+
+def game_channel(game_id):
+    return f'game:{game_id}'
+
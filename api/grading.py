@@ -0,0 +1,191 @@
+import argparse
+import os
+import random
+import re
+import string
+import time
+import unicodedata
+from collections import namedtuple
+
+from cache import LRUCache
+
+# Answer grading for `api_game_answer`.
+#
+# Both the answer and the stored english are normalised: NFKD, case folded,
+# accents dropped, apostrophes removed and any other run of punctuation or
+# whitespace turned into one space ("Don't", "dont" and "DON’T" are equal).
+#
+# The stored english may list alternatives, each of which is accepted:
+#   "color/colour", "a, an", "big; large"  split on / , ; | and their
+#                                           full-width forms
+#   "(to) abandon"                          with and without the parentheses
+#
+# With GRADING_MAX_DISTANCE > 0 answers within that Levenshtein distance of an
+# accepted form also count, but only one edit per GRADING_CHARS_PER_EDIT
+# characters of the form (so short words still need to be exact).
+#
+# The accepted forms and their tolerances are computed once per english text
+# and kept in an LRU cache; grading an answer is then a set lookup plus, with
+# a tolerance, a banded edit distance: O(len(answer) * max distance).
+#
+#   python api/grading.py bench
+
+MAX_DISTANCE = int(os.getenv('GRADING_MAX_DISTANCE', '0'))
+CHARS_PER_EDIT = int(os.getenv('GRADING_CHARS_PER_EDIT', '5'))
+CACHE_SIZE = int(os.getenv('GRADING_CACHE_SIZE', '50000'))
+
+_APOSTROPHES = re.compile(r"['`‘’ʼ]")
+_SEPARATORS = re.compile(r'[\W_]+')
+_ALTERNATIVES = re.compile(r'[/,;|／，；、]')
+_OPTIONAL = re.compile(r'\(([^()]*)\)')
+
+AnswerKey = namedtuple('AnswerKey', ['forms', 'tolerant'])
+
+
+def normalize(text):
+    if text.isascii():
+        text = text.lower()
+    else:
+        text = unicodedata.normalize('NFKD', text).casefold()
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _SEPARATORS.sub(' ', _APOSTROPHES.sub('', text)).strip()
+
+
+def variants(english):
+    """Normalised forms of every alternative listed in `english`."""
+    forms = set()
+    for part in [english] + _ALTERNATIVES.split(english):
+        for form in (_OPTIONAL.sub(r'\1', part), _OPTIONAL.sub(' ', part)):
+            form = normalize(form)
+            if form:
+                forms.add(form)
+    return forms
+
+
+def within_distance(a, b, k):
+    """True if the Levenshtein distance of `a` and `b` is at most `k`, in O(k * len(a))."""
+    n, m = len(a), len(b)
+    if abs(n - m) > k:
+        return False
+    if k == 0 or a == b:
+        return a == b
+    # Only the diagonal band |i - j| <= k can stay within k edits;
+    # row[d] holds the distance of a[:i] and b[:j] for j = i + d - k
+    width = 2 * k + 1
+    over = k + 1
+    prev = [d - k if k <= d <= k + m else over for d in range(width)]
+    for i in range(1, n + 1):
+        cur = [over] * width
+        best = over
+        for d in range(width):
+            j = i + d - k
+            if j < 0 or j > m:
+                continue
+            if j == 0:
+                value = i
+            else:
+                value = prev[d] + (a[i - 1] != b[j - 1])
+                if d + 1 < width and prev[d + 1] + 1 < value:
+                    value = prev[d + 1] + 1
+                if d > 0 and cur[d - 1] + 1 < value:
+                    value = cur[d - 1] + 1
+            cur[d] = value
+            if value < best:
+                best = value
+        if best > k:
+            return False
+        prev = cur
+    return prev[m - n + k] <= k
+
+
+class Grader:
+    def __init__(self, max_distance=MAX_DISTANCE, chars_per_edit=CHARS_PER_EDIT, cache_size=CACHE_SIZE):
+        self.max_distance = max_distance
+        self.chars_per_edit = max(1, chars_per_edit)
+        self.cache = LRUCache(maxsize=cache_size)
+
+    def key(self, english):
+        """Accepted forms of `english`, and (form, allowed edits) for those with a tolerance."""
+        key = self.cache.get(english)
+        if key is None:
+            forms = variants(english)
+            tolerant = []
+            for form in forms:
+                allowed = min(self.max_distance, len(form) // self.chars_per_edit)
+                if allowed:
+                    tolerant.append((form, allowed))
+            key = AnswerKey(frozenset(forms), tuple(tolerant))
+            self.cache.set(english, key)
+        return key
+
+    def grade(self, answer, english):
+        """True if `answer` is an accepted answer for the stored `english`."""
+        answer = normalize(answer)
+        if not answer:
+            return False
+        key = self.key(english)
+        if answer in key.forms:
+            return True
+        return any(within_distance(answer, form, allowed) for form, allowed in key.tolerant)
+
+
+def _bench(args):
+    rng = random.Random(args.seed)
+
+    def word():
+        return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 12)))
+
+    def typo(text):
+        i = rng.randrange(len(text))
+        return text[:i] + rng.choice(string.ascii_lowercase) + text[i + 1:]
+
+    stored = []
+    for _ in range(args.words):
+        english = word()
+        if rng.random() < 0.3:
+            english += '/' + word()
+        if rng.random() < 0.1:
+            english = '(to) ' + english
+        stored.append(english)
+    answers = []
+    for _ in range(args.answers):
+        english = rng.choice(stored)
+        first = _OPTIONAL.sub('', _ALTERNATIVES.split(english)[0]).strip()
+        kind = rng.random()
+        answer = first.upper() if kind < 0.5 else typo(first) if kind < 0.8 else word()
+        answers.append((answer, english))
+
+    started = time.perf_counter()
+    for answer, english in answers:
+        answer.strip().lower() == english.strip().lower()
+    baseline = time.perf_counter() - started
+    print(f"exact compare (old)     {len(answers) / baseline:12,.0f} answers/s")
+
+    for max_distance in (0, args.max_distance):
+        grader = Grader(max_distance=max_distance, cache_size=args.words)
+        started = time.perf_counter()
+        for english in stored:
+            grader.key(english)
+        precomputed = time.perf_counter() - started
+        started = time.perf_counter()
+        correct = sum(grader.grade(answer, english) for answer, english in answers)
+        graded = time.perf_counter() - started
+        print(f"grader max_distance={max_distance}  {len(answers) / graded:12,.0f} answers/s  "
+              f"({correct / len(answers):.0%} accepted; keys for {len(stored)} words in {precomputed * 1000:.0f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Answer grading tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help='Grade synthetic answers and report throughput')
+    bench.add_argument('--words', type=int, default=10000)
+    bench.add_argument('--answers', type=int, default=200000)
+    bench.add_argument('--max-distance', type=int, default=2)
+    bench.add_argument('--seed', type=int, default=1)
+    bench.set_defaults(func=_bench)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
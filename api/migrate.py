@@ -0,0 +1,207 @@
+import argparse
+import os
+import re
+import sys
+
+import db
+
+# Versioned schema migrations.
+#
+# Each file in api/migrations is named NNNN_description.sql and is applied once,
+# in version order, inside its own transaction; applied versions are recorded in
+# the schema_migrations table. The files use IF NOT EXISTS throughout, so they
+# can also be run against a database that was created from the old hand-pasted
+# script.
+#
+#   python api/migrate.py status   list applied and pending migrations
+#   python api/migrate.py up       apply pending migrations
+#   python api/migrate.py check    EXPLAIN the app's hot queries, fail on seq scans
+#   python api/migrate.py repair-word-counts
+#                                  recount dict.word_count from the word table
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILE = re.compile(r'^(\d+)_(\w+)\.sql$')
+# Serialises concurrent `up` runs (pg_advisory_xact_lock key)
+MIGRATION_LOCK_KEY = 727274
+
+# Representative queries of each route, as issued by api/app.py. `check` runs
+# them with enable_seqscan=off: the planner then only chooses a sequential scan
+# when no index can serve the query, so the result does not depend on how many
+# rows the (possibly tiny) database being checked happens to have.
+CHECK_QUERIES = [
+    ('login', 'SELECT id, pwhash FROM "user" WHERE username = :username AND deleted = false', {'username': 'check'}),
+    ('authenticate', 'SELECT id, username, type, pwhash, token_version FROM "user" WHERE id = :id AND deleted = false', {'id': 1}),
+    ('dict list', 'SELECT id, dictname, word_count FROM "dict" WHERE deleted = false ORDER BY id DESC', {}),
+    ('dict words (cache load)', 'SELECT id, dictid, english, chinese, deleted FROM "word" WHERE dictid = :dictid ORDER BY id ASC', {'dictid': 1}),
+    ('word search (prefix)', """
+        SELECT id, dictid, english, chinese FROM "word"
+        WHERE dictid = :dictid AND deleted = false AND lower(english) COLLATE "C" LIKE :prefix
+        ORDER BY lower(english) COLLATE "C", id
+        LIMIT :limit
+    """, {'dictid': 1, 'prefix': 'ab%', 'limit': 21}),
+    ('dict words (page)', 'SELECT id, dictid, english, chinese FROM "word" WHERE dictid = :dictid AND deleted = false AND id > :after ORDER BY id LIMIT 1000', {'dictid': 1, 'after': 0}),
+    ('dict words (since)', 'SELECT id, dictid, english, chinese, deleted FROM "word" WHERE dictid = :dictid AND version > :since AND id > :after ORDER BY id LIMIT 1000', {'dictid': 1, 'since': 0, 'after': 0}),
+    ('dict words (version)', 'SELECT COALESCE(MAX(version), 0) FROM "word" WHERE dictid = :dictid', {'dictid': 1}),
+    ('dict export', 'SELECT english, chinese FROM "word" WHERE dictid = :dictid AND deleted = false ORDER BY id ASC', {'dictid': 1}),
+    ('game list version', 'SELECT COALESCE(MAX(version), 0) AS version, COALESCE(SUM(version), 0) AS total, COUNT(*) AS count FROM "game"', {}),
+    ('game list version (status)', """
+        SELECT COALESCE(MAX(version), 0) AS version, COALESCE(SUM(version), 0) AS total, COUNT(*) AS count
+        FROM "game" WHERE status = ANY(:statuses)
+    """, {'statuses': [-1, 0]}),
+    ('game list (open)', """
+        SELECT g.id, g.dictid, d.dictname, g.users, g.status, g.version
+        FROM "game" g
+        LEFT JOIN "dict" d ON g.dictid = d.id
+        WHERE g.status = ANY(:statuses)
+        ORDER BY g.id DESC
+        LIMIT :limit
+    """, {'statuses': [-1, 0], 'limit': 200}),
+    ('game list (since)', """
+        SELECT g.id, g.status, g.version
+        FROM "game" g
+        WHERE g.version > :since
+        ORDER BY g.id DESC
+        LIMIT :limit
+    """, {'since': 1, 'limit': 50}),
+    ('game get', """
+        SELECT g.id, g.dictid, d.dictname, g.users, g.wordlist, g.words, r.result::text AS result, g.status, g.ownerid
+        FROM "game" g
+        LEFT JOIN "dict" d ON g.dictid = d.id
+        LEFT JOIN game_result r ON r.gameid = g.id
+        WHERE g.id = :id
+    """, {'id': 1}),
+    # REFRESH MATERIALIZED VIEW cannot be EXPLAINed; this is the view's query (0013)
+    ('leaderboard refresh', """
+        SELECT id, rating, row_number() OVER (ORDER BY rating DESC, id ASC) AS rank
+        FROM "user"
+        WHERE deleted = false
+    """, {}),
+    ('leaderboard', """
+        SELECT u.id, u.username, u.introduction, l.rating, l.rank
+        FROM leaderboard l
+        JOIN "user" u ON u.id = l.id
+        WHERE l.rank <= :size
+        ORDER BY l.rank
+    """, {'size': 100}),
+    ('user profile', """
+        SELECT u.id, u.username, u.introduction, u.rating, u.type, l.rank
+        FROM "user" u
+        LEFT JOIN leaderboard l ON l.id = u.id
+        WHERE u.id = :id AND u.deleted = false
+    """, {'id': 1}),
+]
+
+
+def _migrations():
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+
+def _ensure_table():
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+          version INTEGER PRIMARY KEY,
+          name TEXT NOT NULL,
+          applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _applied():
+    _ensure_table()
+    return {row['version'] for row in db.fetchall('SELECT version FROM schema_migrations')}
+
+
+def status(args):
+    applied = _applied()
+    for version, name, _ in _migrations():
+        print(f"{'applied' if version in applied else 'pending'}  {version:04d}_{name}")
+
+
+def up(args):
+    applied = _applied()
+    for version, name, path in _migrations():
+        if version in applied:
+            continue
+        with open(path, encoding='utf-8') as f:
+            sql = f.read()
+        with db.transaction() as tx:
+            tx.fetchone('SELECT pg_advisory_xact_lock(:key)', {'key': MIGRATION_LOCK_KEY})
+            if tx.fetchone('SELECT version FROM schema_migrations WHERE version = :version', {'version': version}):
+                continue
+            tx.execute_script(sql)
+            tx.execute('INSERT INTO schema_migrations (version, name) VALUES (:version, :name)', {'version': version, 'name': name})
+        print(f"applied  {version:04d}_{name}")
+    print('Schema is up to date')
+
+
+def _seq_scans(plan):
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append(plan.get('Relation Name'))
+    for child in plan.get('Plans', []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def check(args):
+    failures = 0
+    for name, query, params in CHECK_QUERIES:
+        try:
+            with db.transaction() as tx:
+                tx.execute('SET LOCAL enable_seqscan = off')
+                row = tx.fetchone('EXPLAIN (FORMAT JSON) ' + query, params)
+        except Exception as e:
+            # e.g. a column missing or of the wrong type: the route would fail the same way
+            failures += 1
+            print(f"ERROR {name}: {str(getattr(e, 'orig', e)).strip().splitlines()[0]}")
+            continue
+        plan = db.decode_json(row['QUERY PLAN'])[0]['Plan']
+        scans = _seq_scans(plan)
+        if scans:
+            failures += 1
+            print(f"FAIL  {name}: seq scan on {', '.join(sorted(set(scans)))}")
+        else:
+            print(f"ok    {name}")
+    if failures:
+        sys.exit(1)
+
+
+def repair_word_counts(args):
+    # Deleted dicts count 0 (their words are deleted with them)
+    with db.transaction() as tx:
+        fixed = tx.fetchall("""
+            WITH actual AS (
+                SELECT d.id, CASE WHEN d.deleted = false THEN COUNT(w.id) ELSE 0 END AS n
+                FROM dict d
+                LEFT JOIN word w ON w.dictid = d.id AND w.deleted = false
+                GROUP BY d.id
+            )
+            UPDATE dict d
+            SET word_count = a.n
+            FROM actual a
+            WHERE a.id = d.id AND d.word_count <> a.n
+            RETURNING d.id, a.n
+        """)
+    for row in fixed:
+        print(f"dict {row['id']}: word_count set to {row['n']}")
+    print(f"{len(fixed)} dict(s) repaired")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Database schema migrations')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help='List applied and pending migrations').set_defaults(func=status)
+    sub.add_parser('up', help='Apply pending migrations').set_defaults(func=up)
+    sub.add_parser('check', help="EXPLAIN the app's hot queries and fail on sequential scans").set_defaults(func=check)
+    sub.add_parser('repair-word-counts', help='Recount dict.word_count from the word table').set_defaults(func=repair_word_counts)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
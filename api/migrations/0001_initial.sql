@@ -0,0 +1,39 @@
+-- Base tables
+CREATE TABLE IF NOT EXISTS "user" (
+  id SERIAL PRIMARY KEY,
+  username VARCHAR(255) NOT NULL UNIQUE,
+  pwhash VARCHAR(255) NOT NULL,
+  introduction TEXT DEFAULT '',
+  rating INTEGER DEFAULT 0,
+  type VARCHAR(50) DEFAULT 'normal',
+  deleted BOOLEAN DEFAULT false,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS dict (
+  id SERIAL PRIMARY KEY,
+  dictname VARCHAR(255) NOT NULL,
+  deleted BOOLEAN DEFAULT false,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS word (
+  id SERIAL PRIMARY KEY,
+  dictid INTEGER NOT NULL REFERENCES dict(id),
+  english VARCHAR(255) NOT NULL,
+  chinese VARCHAR(255) NOT NULL,
+  deleted BOOLEAN DEFAULT false,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS game (
+  id SERIAL PRIMARY KEY,
+  dictid INTEGER REFERENCES dict(id),
+  users JSON DEFAULT '[]',
+  wordlist JSON DEFAULT '[]',
+  result JSON DEFAULT '[]',
+  status INTEGER DEFAULT -1,
+  perf JSON,
+  ownerid INTEGER REFERENCES "user"(id),
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,3 @@
+-- Every write to a game takes a new version from this sequence (incremental list, ETag)
+CREATE SEQUENCE IF NOT EXISTS game_version_seq;
+ALTER TABLE game ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT nextval('game_version_seq');
@@ -0,0 +1,29 @@
+-- Append-only answer log (seq = position in the game's wordlist)
+CREATE TABLE IF NOT EXISTS game_answer (
+  gameid INTEGER NOT NULL REFERENCES game(id),
+  seq INTEGER NOT NULL,
+  uid INTEGER NOT NULL,
+  word_id INTEGER NOT NULL,
+  answer TEXT NOT NULL,
+  result BOOLEAN NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (gameid, seq)
+);
+
+-- Compatibility view: answers aggregated in the old game.result JSON format
+CREATE OR REPLACE VIEW game_result AS
+SELECT gameid,
+       json_agg(json_build_object('uid', uid, 'word_id', word_id, 'answer', answer, 'result', result) ORDER BY seq) AS result,
+       COUNT(*) AS result_count
+FROM game_answer
+GROUP BY gameid;
+
+-- Move answers stored in the old game.result column into the log
+INSERT INTO game_answer (gameid, seq, uid, word_id, answer, result)
+SELECT g.id, e.ord - 1, (e.item->>'uid')::int, (e.item->>'word_id')::int, e.item->>'answer', (e.item->>'result')::boolean
+FROM game g, json_array_elements(g.result::json) WITH ORDINALITY AS e(item, ord)
+ON CONFLICT (gameid, seq) DO NOTHING;
+
+-- Turn counter, advanced by a conditional UPDATE when an answer is recorded
+ALTER TABLE game ADD COLUMN IF NOT EXISTS answer_count INTEGER NOT NULL DEFAULT 0;
+UPDATE game g SET answer_count = r.result_count FROM game_result r WHERE r.gameid = g.id;
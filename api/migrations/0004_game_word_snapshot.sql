@@ -0,0 +1,2 @@
+-- Optional [[english, chinese], ...] snapshot of a game's words, in wordlist order
+ALTER TABLE game ADD COLUMN IF NOT EXISTS words TEXT;
@@ -0,0 +1,3 @@
+-- Glicko-2 state (only used with RATING_ENGINE=glicko2)
+ALTER TABLE "user" ADD COLUMN IF NOT EXISTS rating_rd DOUBLE PRECISION NOT NULL DEFAULT 350;
+ALTER TABLE "user" ADD COLUMN IF NOT EXISTS rating_vol DOUBLE PRECISION NOT NULL DEFAULT 0.06;
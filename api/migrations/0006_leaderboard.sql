@@ -0,0 +1,9 @@
+-- Ranking of active users, refreshed by the app when ratings change. Rank and
+-- rank-of-user lookups go through the unique indexes below instead of sorting "user".
+CREATE MATERIALIZED VIEW IF NOT EXISTS leaderboard AS
+SELECT id, rating, row_number() OVER (ORDER BY rating DESC, id ASC) AS rank
+FROM "user"
+WHERE deleted::int = 0;  -- works whether deleted is BOOLEAN or numeric
+
+CREATE UNIQUE INDEX IF NOT EXISTS leaderboard_id_idx ON leaderboard (id);
+CREATE UNIQUE INDEX IF NOT EXISTS leaderboard_rank_idx ON leaderboard (rank);
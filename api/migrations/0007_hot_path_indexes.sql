@@ -0,0 +1,13 @@
+-- Indexes for the queries in api/app.py ("user".username is already covered by its UNIQUE constraint)
+
+-- Words of a dict: word cache loader, get_words/export (deleted = 0, ORDER BY id), dict delete cascade
+CREATE INDEX IF NOT EXISTS word_dict_idx ON word (dictid, deleted, id);
+
+-- Dict list (deleted = 0 ORDER BY id DESC)
+CREATE INDEX IF NOT EXISTS dict_active_idx ON dict (deleted, id);
+
+-- Lobby: open games (status -1/0) newest first; finished games page through the primary key
+CREATE INDEX IF NOT EXISTS game_open_idx ON game (id DESC) WHERE status IN (-1, 0);
+
+-- Game list ETag (MAX(version)) and ?since= deltas
+CREATE INDEX IF NOT EXISTS game_version_idx ON game (version);
@@ -0,0 +1,7 @@
+-- Number of non-deleted words per dict, maintained by the app's word write paths
+-- (repair with: python api/migrate.py repair-word-counts)
+ALTER TABLE dict ADD COLUMN IF NOT EXISTS word_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE dict d
+SET word_count = (SELECT COUNT(*) FROM word w WHERE w.dictid = d.id AND w.deleted::int = 0)
+WHERE d.deleted::int = 0;
@@ -0,0 +1,10 @@
+-- Signed session tokens: bumping token_version invalidates every token issued before
+ALTER TABLE "user" ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
+
+-- Revocations (uid, lowest still-valid token_version), mirrored in memory by each process
+CREATE TABLE IF NOT EXISTS session_revocation (
+  id BIGSERIAL PRIMARY KEY,
+  uid INTEGER NOT NULL REFERENCES "user"(id),
+  token_version INTEGER NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,21 @@
+-- Word search (api/search.py)
+
+-- Prefix search: code point ("C") order serves both LIKE 'abc%' and ORDER BY
+CREATE INDEX IF NOT EXISTS word_english_prefix_idx ON word (dictid, (lower(english) COLLATE "C"));
+
+-- Substring and similarity search need pg_trgm. Without it (or without the
+-- privilege to install it) the app searches its in-process index instead.
+DO $$
+BEGIN
+  CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EXCEPTION WHEN OTHERS THEN
+  RAISE NOTICE 'pg_trgm not available (%); word search will use the in-process index', SQLERRM;
+END $$;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+    CREATE INDEX IF NOT EXISTS word_english_trgm_idx ON word USING gin (lower(english) gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS word_chinese_trgm_idx ON word USING gin (chinese gin_trgm_ops);
+  END IF;
+END $$;
@@ -0,0 +1,3 @@
+-- Every write to a word takes a new version from this sequence (api_get_words ?since= deltas)
+CREATE SEQUENCE IF NOT EXISTS word_version_seq;
+ALTER TABLE word ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT nextval('word_version_seq');
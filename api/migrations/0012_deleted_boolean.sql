@@ -0,0 +1,35 @@
+-- "deleted" is BOOLEAN on "user", dict and word (as created by 0001), and the
+-- app compares it with false/true. Databases whose columns were created as
+-- numbers are converted here (non-zero = deleted). The leaderboard view
+-- depends on "user".deleted, so it is rebuilt around the conversion.
+DO $$
+DECLARE
+  t text;
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name IN ('user', 'dict', 'word')
+      AND column_name = 'deleted' AND data_type <> 'boolean'
+  ) THEN
+    DROP MATERIALIZED VIEW IF EXISTS leaderboard;
+    FOREACH t IN ARRAY ARRAY['user', 'dict', 'word'] LOOP
+      IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = t
+          AND column_name = 'deleted' AND data_type <> 'boolean'
+      ) THEN
+        EXECUTE format('ALTER TABLE %I ALTER COLUMN deleted DROP DEFAULT', t);
+        EXECUTE format('ALTER TABLE %I ALTER COLUMN deleted TYPE BOOLEAN USING deleted <> 0', t);
+        EXECUTE format('ALTER TABLE %I ALTER COLUMN deleted SET DEFAULT false', t);
+      END IF;
+    END LOOP;
+  END IF;
+END $$;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS leaderboard AS
+SELECT id, rating, row_number() OVER (ORDER BY rating DESC, id ASC) AS rank
+FROM "user"
+WHERE deleted = false;
+
+CREATE UNIQUE INDEX IF NOT EXISTS leaderboard_id_idx ON leaderboard (id);
+CREATE UNIQUE INDEX IF NOT EXISTS leaderboard_rank_idx ON leaderboard (rank);
@@ -0,0 +1,15 @@
+-- Leaderboard refresh: active users in rank order straight from an index
+-- instead of sorting "user" on every REFRESH
+CREATE INDEX IF NOT EXISTS user_rating_idx ON "user" (rating DESC, id) WHERE deleted = false;
+
+-- Views created by 0006 filter on deleted::int = 0, which the partial index
+-- predicate does not match; recreate them with the same filter as the index
+DROP MATERIALIZED VIEW IF EXISTS leaderboard;
+
+CREATE MATERIALIZED VIEW leaderboard AS
+SELECT id, rating, row_number() OVER (ORDER BY rating DESC, id ASC) AS rank
+FROM "user"
+WHERE deleted = false;
+
+CREATE UNIQUE INDEX IF NOT EXISTS leaderboard_id_idx ON leaderboard (id);
+CREATE UNIQUE INDEX IF NOT EXISTS leaderboard_rank_idx ON leaderboard (rank);
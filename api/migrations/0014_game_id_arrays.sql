@@ -0,0 +1,20 @@
+-- game.users / game.wordlist as integer[] instead of JSON text (see the codec in db.py).
+-- ALTER ... TYPE ... USING cannot take a subquery, so the ids go through new
+-- columns: add, backfill, then swap them in under the old names.
+DO $$
+BEGIN
+  IF (SELECT data_type FROM information_schema.columns
+      WHERE table_schema = current_schema() AND table_name = 'game' AND column_name = 'users') <> 'ARRAY' THEN
+    ALTER TABLE game
+      ADD COLUMN users_ids INTEGER[] NOT NULL DEFAULT '{}',
+      ADD COLUMN wordlist_ids INTEGER[] NOT NULL DEFAULT '{}';
+
+    UPDATE game SET
+      users_ids = ARRAY(SELECT json_array_elements_text(COALESCE(users::json, '[]'))::int),
+      wordlist_ids = ARRAY(SELECT json_array_elements_text(COALESCE(wordlist::json, '[]'))::int);
+
+    ALTER TABLE game DROP COLUMN users, DROP COLUMN wordlist;
+    ALTER TABLE game RENAME COLUMN users_ids TO users;
+    ALTER TABLE game RENAME COLUMN wordlist_ids TO wordlist;
+  END IF;
+END $$;
@@ -0,0 +1,2 @@
+-- api_get_words ?since= deltas: the words of one dict written after a version, and the dict's latest version
+CREATE INDEX IF NOT EXISTS word_dict_version_idx ON word (dictid, version);
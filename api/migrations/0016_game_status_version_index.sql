@@ -0,0 +1,2 @@
+-- Game list ETag: MAX(version) and COUNT(*) of the games with the requested statuses
+CREATE INDEX IF NOT EXISTS game_status_version_idx ON game (status, version);
@@ -0,0 +1,9 @@
+-- Whether the leaderboard view is behind "user" (set when ratings or ranked users change)
+-- and when it was last refreshed; see refresh_leaderboard in api/app.py
+CREATE TABLE IF NOT EXISTS leaderboard_state (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  dirty BOOLEAN NOT NULL DEFAULT false,
+  refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO leaderboard_state (id) VALUES (1) ON CONFLICT DO NOTHING;
@@ -0,0 +1,19 @@
+-- Elo/Glicko ratings are fractional; store them unrounded so live updates match
+-- `rating.py rebuild` (pages and the API still show them rounded)
+DO $$
+BEGIN
+  IF (SELECT data_type FROM information_schema.columns
+      WHERE table_schema = current_schema() AND table_name = 'user' AND column_name = 'rating') <> 'double precision' THEN
+    -- The view depends on the column's type
+    DROP MATERIALIZED VIEW IF EXISTS leaderboard;
+    ALTER TABLE "user" ALTER COLUMN rating TYPE DOUBLE PRECISION;
+  END IF;
+END $$;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS leaderboard AS
+SELECT id, rating, row_number() OVER (ORDER BY rating DESC, id ASC) AS rank
+FROM "user"
+WHERE deleted = false;
+
+CREATE UNIQUE INDEX IF NOT EXISTS leaderboard_id_idx ON leaderboard (id);
+CREATE UNIQUE INDEX IF NOT EXISTS leaderboard_rank_idx ON leaderboard (rank);
@@ -0,0 +1,188 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Password storage.
+#
+# The browser never sends the password itself after login: it keeps
+# sha256(password) (see `hash_password` in app.py and auth.js) and sends that as
+# its credential. What is stored in "user".pwhash is derived from that digest:
+#
+#   sha256   the digest itself (legacy format, 64 hex characters)
+#   scrypt   "scrypt$<n>$<r>$<p>$<salt>$<hash>", salted, memory-hard
+#
+# PASSWORD_HASHER selects the format for new hashes (default scrypt). Stored
+# hashes in any other format still verify; they are upgraded on the next login
+# when the configured hasher is a slow one, never downgraded to sha256.
+#
+# KDF work runs on a small bounded pool (PASSWORD_HASH_WORKERS threads, default
+# one per CPU; hashlib.scrypt releases the GIL), and at most
+# PASSWORD_HASH_QUEUE requests may wait for it. Beyond that `Busy` is raised so
+# the route can answer 503 instead of piling up slow requests.
+#
+#   python api/passwords.py bench    logins per second per hasher
+
+
+class Busy(Exception):
+    """Too many password hashes are already queued."""
+
+
+class Sha256Hasher:
+    name = 'sha256'
+    slow = False
+
+    def identify(self, stored):
+        return len(stored) == 64 and '$' not in stored
+
+    def hash(self, digest):
+        return digest
+
+    def verify(self, digest, stored):
+        return hmac.compare_digest(digest, stored)
+
+    def needs_rehash(self, stored):
+        return False
+
+
+class ScryptHasher:
+    name = 'scrypt'
+    slow = True
+
+    def __init__(self, n=2 ** 14, r=8, p=1):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def identify(self, stored):
+        return stored.startswith('scrypt$')
+
+    def _derive(self, digest, salt, n, r, p):
+        return hashlib.scrypt(digest.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+    def hash(self, digest):
+        salt = os.urandom(16)
+        derived = self._derive(digest, salt, self.n, self.r, self.p)
+        return '$'.join([
+            'scrypt', str(self.n), str(self.r), str(self.p),
+            base64.b64encode(salt).decode(), base64.b64encode(derived).decode()
+        ])
+
+    def verify(self, digest, stored):
+        try:
+            _, n, r, p, salt, expected = stored.split('$')
+            derived = self._derive(digest, base64.b64decode(salt), int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(derived, base64.b64decode(expected))
+
+    def needs_rehash(self, stored):
+        try:
+            _, n, r, p, _, _ = stored.split('$')
+        except ValueError:
+            return True
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+
+HASHERS = {
+    'sha256': Sha256Hasher,
+    'scrypt': ScryptHasher,
+}
+
+hasher = HASHERS[os.getenv('PASSWORD_HASHER', 'scrypt').lower()]()
+_known = [hasher] + [cls() for name, cls in HASHERS.items() if name != hasher.name]
+
+WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 1)))
+QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE', '32'))
+QUEUE_TIMEOUT = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', '2'))
+
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='pwhash')
+_slots = threading.BoundedSemaphore(WORKERS + QUEUE_SIZE)
+
+
+def _hasher_for(stored):
+    for candidate in _known:
+        if candidate.identify(stored):
+            return candidate
+    return None
+
+
+def _bounded(fn, *args):
+    if not _slots.acquire(timeout=QUEUE_TIMEOUT):
+        raise Busy()
+    try:
+        return _pool.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def make_hash(digest):
+    """Stored form of a credential digest, using the configured hasher."""
+    if not hasher.slow:
+        return hasher.hash(digest)
+    return _bounded(hasher.hash, digest)
+
+
+def verify(digest, stored):
+    """True if `digest` matches the stored hash (any known format)."""
+    if not digest or not stored:
+        return False
+    candidate = _hasher_for(stored)
+    if candidate is None:
+        return False
+    if not candidate.slow:
+        return candidate.verify(digest, stored)
+    return _bounded(candidate.verify, digest, stored)
+
+
+def needs_rehash(stored):
+    """True if `stored` is not in the configured format/parameters.
+
+    Hashes are only ever upgraded: with a fast hasher configured (sha256, for
+    tests), slow hashes are left as they are.
+    """
+    if not hasher.slow:
+        return False
+    candidate = _hasher_for(stored)
+    return candidate is None or candidate.name != hasher.name or hasher.needs_rehash(stored)
+
+
+def _bench(args):
+    digest = hashlib.sha256(b'correct horse battery staple').hexdigest()
+    for name, cls in HASHERS.items():
+        h = cls()
+        stored = h.hash(digest)
+        started = time.perf_counter()
+        count = 0
+        while time.perf_counter() - started < args.seconds:
+            h.verify(digest, stored)
+            count += 1
+        single = count / (time.perf_counter() - started)
+
+        threads = args.threads or WORKERS
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            started = time.perf_counter()
+            total = max(int(single * args.seconds), threads)
+            list(pool.map(lambda _: h.verify(digest, stored), range(total)))
+            parallel = total / (time.perf_counter() - started)
+        print(f"{name:7s} 1 thread: {single:12,.0f} logins/s   {threads} threads: {parallel:12,.0f} logins/s "
+              f"({parallel / threads:,.0f} per thread)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Password hashing tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help='Measure verifications per second for each hasher')
+    bench.add_argument('--seconds', type=float, default=2.0)
+    bench.add_argument('--threads', type=int, default=None, help='default: PASSWORD_HASH_WORKERS')
+    bench.set_defaults(func=_bench)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,407 @@
+import argparse
+import math
+import os
+import random
+import time
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; batch replay falls back to a Python loop
+    np = None
+
+# Rating engines used when a game ends (`api_game_end`) and for offline replays.
+#
+# Every engine takes the current state of the players in one game plus each
+# player's performance (correct answers minus wrong answers) and returns the
+# new states. Select the engine with RATING_ENGINE=classic|elo|glicko2.
+#
+#   classic  rating += performance (the original rule)
+#   elo      multi-player Elo: each pair of players is one match, decided by
+#            who had the better performance
+#   glicko2  Glicko-2 with each game treated as one rating period; needs the
+#            "user".rating_rd / rating_vol columns (see SUPABASE_MIGRATION.md)
+#
+# Stored ratings are centred on 0 (the column default), i.e. 0 corresponds to
+# 1500 on the usual Elo/Glicko scale.
+#
+# The offline tools live at the bottom of this file:
+#   python api/rating.py rebuild --engine elo [--dry-run]
+#   python api/rating.py bench --games 1000000 --players 10000 --engine glicko2
+
+GLICKO_SCALE = 173.7178
+GLICKO_DEFAULT_RD = 350.0
+GLICKO_DEFAULT_VOL = 0.06
+# Convergence tolerance of the Glicko-2 volatility iteration
+GLICKO_EPSILON = 1e-6
+GLICKO_MAX_ITERATIONS = 100
+
+RatingState = namedtuple('RatingState', ['rating', 'rd', 'vol'], defaults=(0.0, GLICKO_DEFAULT_RD, GLICKO_DEFAULT_VOL))
+
+
+def game_performance(users, result):
+    """Performance per player of one game: +1 per correct answer, -1 per wrong one."""
+    perf = {user_id: 0 for user_id in users}
+    for item in result:
+        uid = item.get('uid')
+        if uid in perf:
+            perf[uid] += 1 if item.get('result', False) else -1
+    return perf
+
+
+def _pair_score(perf_a, perf_b):
+    if perf_a > perf_b:
+        return 1.0
+    if perf_a < perf_b:
+        return 0.0
+    return 0.5
+
+
+class ClassicEngine:
+    name = 'classic'
+    uses_deviation = False
+
+    def update(self, states, perf):
+        return {uid: state._replace(rating=state.rating + perf[uid]) for uid, state in states.items()}
+
+    def replay_rounds(self, ratings, rds, vols, rounds):
+        for a, b, score, weight, entries, entry_perf in rounds:
+            ratings += np.bincount(entries, weights=entry_perf, minlength=len(ratings))
+
+
+class EloEngine:
+    name = 'elo'
+    uses_deviation = False
+
+    def __init__(self, k=32.0):
+        self.k = k
+
+    def update(self, states, perf):
+        players = [uid for uid in states if uid in perf]
+        if len(players) < 2:
+            return dict(states)
+        weight = self.k / (len(players) - 1)
+        new_states = dict(states)
+        for uid in players:
+            rating = states[uid].rating
+            delta = 0.0
+            for other in players:
+                if other == uid:
+                    continue
+                expected = 1.0 / (1.0 + 10 ** ((states[other].rating - rating) / 400.0))
+                delta += _pair_score(perf[uid], perf[other]) - expected
+            new_states[uid] = states[uid]._replace(rating=rating + weight * delta)
+        return new_states
+
+    def replay_rounds(self, ratings, rds, vols, rounds):
+        for a, b, score, weight, entries, entry_perf in rounds:
+            expected = 1.0 / (1.0 + 10 ** ((ratings[b] - ratings[a]) / 400.0))
+            ratings += np.bincount(a, weights=self.k * weight * (score - expected), minlength=len(ratings))
+
+
+class Glicko2Engine:
+    name = 'glicko2'
+    uses_deviation = True
+
+    def __init__(self, tau=0.5):
+        self.tau = tau
+
+    def _volatility(self, phi, vol, v, delta):
+        # Illinois iteration from Glickman's "Example of the Glicko-2 system", step 5
+        a = math.log(vol * vol)
+
+        def f(x):
+            ex = math.exp(x)
+            return ex * (delta * delta - phi * phi - v - ex) / (2 * (phi * phi + v + ex) ** 2) - (x - a) / (self.tau * self.tau)
+
+        big_a = a
+        if delta * delta > phi * phi + v:
+            big_b = math.log(delta * delta - phi * phi - v)
+        else:
+            k = 1
+            while f(a - k * self.tau) < 0:
+                k += 1
+            big_b = a - k * self.tau
+        f_a, f_b = f(big_a), f(big_b)
+        for _ in range(GLICKO_MAX_ITERATIONS):
+            if abs(big_b - big_a) <= GLICKO_EPSILON:
+                break
+            big_c = big_a + (big_a - big_b) * f_a / (f_b - f_a)
+            f_c = f(big_c)
+            if f_c * f_b < 0:
+                big_a, f_a = big_b, f_b
+            else:
+                f_a /= 2
+            big_b, f_b = big_c, f_c
+        return math.exp(big_a / 2)
+
+    def update(self, states, perf):
+        players = [uid for uid in states if uid in perf]
+        if len(players) < 2:
+            return dict(states)
+        new_states = dict(states)
+        for uid in players:
+            mu = states[uid].rating / GLICKO_SCALE
+            phi = states[uid].rd / GLICKO_SCALE
+            v_inv = 0.0
+            score_sum = 0.0
+            for other in players:
+                if other == uid:
+                    continue
+                phi_j = states[other].rd / GLICKO_SCALE
+                g = 1.0 / math.sqrt(1.0 + 3.0 * phi_j * phi_j / (math.pi * math.pi))
+                expected = 1.0 / (1.0 + math.exp(-g * (mu - states[other].rating / GLICKO_SCALE)))
+                v_inv += g * g * expected * (1.0 - expected)
+                score_sum += g * (_pair_score(perf[uid], perf[other]) - expected)
+            v = 1.0 / v_inv
+            vol = self._volatility(phi, states[uid].vol, v, v * score_sum)
+            phi_star = math.sqrt(phi * phi + vol * vol)
+            new_phi = 1.0 / math.sqrt(1.0 / (phi_star * phi_star) + 1.0 / v)
+            new_mu = mu + new_phi * new_phi * score_sum
+            new_states[uid] = RatingState(new_mu * GLICKO_SCALE, new_phi * GLICKO_SCALE, vol)
+        return new_states
+
+    def _volatility_batch(self, phi, vol, v, delta):
+        # Same iteration as `_volatility`, run for all players of a round at once
+        a = np.log(vol * vol)
+        tau2 = self.tau * self.tau
+
+        def f(x):
+            ex = np.exp(x)
+            return ex * (delta * delta - phi * phi - v - ex) / (2 * (phi * phi + v + ex) ** 2) - (x - a) / tau2
+
+        big_a = a.copy()
+        gap = delta * delta - phi * phi - v
+        big_b = np.where(gap > 0, np.log(np.where(gap > 0, gap, 1.0)), a - self.tau)
+        pending = (gap <= 0) & (f(big_b) < 0)
+        while pending.any():
+            big_b = np.where(pending, big_b - self.tau, big_b)
+            pending &= f(big_b) < 0
+        f_a, f_b = f(big_a), f(big_b)
+        for _ in range(GLICKO_MAX_ITERATIONS):
+            active = np.abs(big_b - big_a) > GLICKO_EPSILON
+            if not active.any():
+                break
+            big_c = np.where(active, big_a + (big_a - big_b) * f_a / np.where(active, f_b - f_a, 1.0), big_b)
+            f_c = f(big_c)
+            swap = active & (f_c * f_b < 0)
+            big_a = np.where(swap, big_b, big_a)
+            f_a = np.where(swap, f_b, np.where(active, f_a / 2, f_a))
+            big_b = np.where(active, big_c, big_b)
+            f_b = np.where(active, f_c, f_b)
+        return np.exp(big_a / 2)
+
+    def replay_rounds(self, ratings, rds, vols, rounds):
+        size = len(ratings)
+        for a, b, score, weight, entries, entry_perf in rounds:
+            if not len(a):
+                continue
+            mu = ratings / GLICKO_SCALE
+            phi_b = rds[b] / GLICKO_SCALE
+            g = 1.0 / np.sqrt(1.0 + 3.0 * phi_b * phi_b / (math.pi * math.pi))
+            expected = 1.0 / (1.0 + np.exp(-g * (mu[a] - mu[b])))
+            v_inv = np.bincount(a, weights=g * g * expected * (1.0 - expected), minlength=size)
+            score_sum = np.bincount(a, weights=g * (score - expected), minlength=size)
+            idx = np.unique(a)
+            v = 1.0 / v_inv[idx]
+            phi = rds[idx] / GLICKO_SCALE
+            vol = self._volatility_batch(phi, vols[idx], v, v * score_sum[idx])
+            phi_star = np.sqrt(phi * phi + vol * vol)
+            new_phi = 1.0 / np.sqrt(1.0 / (phi_star * phi_star) + 1.0 / v)
+            ratings[idx] = (mu[idx] + new_phi * new_phi * score_sum[idx]) * GLICKO_SCALE
+            rds[idx] = new_phi * GLICKO_SCALE
+            vols[idx] = vol
+
+
+ENGINES = {
+    'classic': ClassicEngine,
+    'elo': EloEngine,
+    'glicko2': Glicko2Engine,
+}
+
+
+def get_engine(name=None):
+    name = (name or os.getenv('RATING_ENGINE', 'classic')).lower()
+    if name not in ENGINES:
+        raise ValueError(f"Unknown rating engine: {name}")
+    return ENGINES[name]()
+
+
+def _build_rounds(games, index):
+    # Split the history into rounds in which every player appears at most once.
+    # A game goes into the round after the latest round of any of its players,
+    # so each player still sees their games in order, while all games of one
+    # round are independent and can be updated together.
+    last_round = {}
+    game_round = []
+    for players, _ in games:
+        r = 1 + max((last_round.get(p, -1) for p in players), default=-1)
+        for p in players:
+            last_round[p] = r
+        game_round.append(r)
+
+    sizes = np.fromiter((len(players) for players, _ in games), dtype=np.int64, count=len(games))
+    total = int(sizes.sum())
+    entry_game = np.repeat(np.arange(len(games)), sizes)
+    entry_player = np.fromiter((index[p] for players, _ in games for p in players), dtype=np.int64, count=total)
+    entry_perf = np.fromiter((x for _, perfs in games for x in perfs), dtype=np.float64, count=total)
+    game_start = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    # Every ordered pair (a, b) of distinct entries of the same game
+    entry_size = sizes[entry_game]
+    pair_a = np.repeat(np.arange(total), entry_size)
+    pair_offset = np.arange(len(pair_a)) - np.repeat(np.cumsum(entry_size) - entry_size, entry_size)
+    pair_b = game_start[entry_game[pair_a]] + pair_offset
+    keep = pair_a != pair_b
+    pair_a, pair_b = pair_a[keep], pair_b[keep]
+    perf_a, perf_b = entry_perf[pair_a], entry_perf[pair_b]
+    score = np.where(perf_a > perf_b, 1.0, np.where(perf_a < perf_b, 0.0, 0.5))
+    weight = 1.0 / (entry_size[pair_a] - 1)
+
+    game_round = np.asarray(game_round, dtype=np.int64)
+    pair_round = game_round[entry_game[pair_a]]
+    entry_round = game_round[entry_game]
+    pair_order = np.argsort(pair_round, kind='stable')
+    entry_order = np.argsort(entry_round, kind='stable')
+    rounds_count = int(game_round.max()) + 1 if len(games) else 0
+    pair_bounds = np.searchsorted(pair_round[pair_order], np.arange(rounds_count + 1))
+    entry_bounds = np.searchsorted(entry_round[entry_order], np.arange(rounds_count + 1))
+
+    a = entry_player[pair_a][pair_order]
+    b = entry_player[pair_b][pair_order]
+    score, weight = score[pair_order], weight[pair_order]
+    players_sorted, perf_sorted = entry_player[entry_order], entry_perf[entry_order]
+    for r in range(rounds_count):
+        p0, p1 = pair_bounds[r], pair_bounds[r + 1]
+        e0, e1 = entry_bounds[r], entry_bounds[r + 1]
+        yield a[p0:p1], b[p0:p1], score[p0:p1], weight[p0:p1], players_sorted[e0:e1], perf_sorted[e0:e1]
+
+
+def replay(games, engine, initial=None):
+    """Recompute ratings from scratch over `games`, oldest first.
+
+    `games` is a list of (players, perfs) pairs. Returns {uid: RatingState} for
+    every player that appears in `games` or `initial`. Uses NumPy when it is
+    installed and a plain per-game loop otherwise; both give the same result.
+    """
+    initial = dict(initial or {})
+    if np is None:
+        states = initial
+        for players, perfs in games:
+            current = {uid: states.get(uid, RatingState()) for uid in players}
+            states.update(engine.update(current, dict(zip(players, perfs))))
+        return states
+
+    uids = list(initial)
+    index = {uid: i for i, uid in enumerate(uids)}
+    for players, _ in games:
+        for uid in players:
+            if uid not in index:
+                index[uid] = len(uids)
+                uids.append(uid)
+    start = [initial.get(uid, RatingState()) for uid in uids]
+    ratings = np.array([s.rating for s in start], dtype=np.float64)
+    rds = np.array([s.rd for s in start], dtype=np.float64)
+    vols = np.array([s.vol for s in start], dtype=np.float64)
+    if games:
+        engine.replay_rounds(ratings, rds, vols, _build_rounds(games, index))
+    return {uid: RatingState(float(ratings[i]), float(rds[i]), float(vols[i])) for i, uid in enumerate(uids)}
+
+
+def _load_history():
+    import db
+    games = []
+    for row in db.iterate("""
+        SELECT g.id, g.users, r.result::text AS result
+        FROM "game" g
+        LEFT JOIN game_result r ON r.gameid = g.id
+        WHERE g.status = 1
+        ORDER BY g.id
+    """):
+        users = db.decode_ids(row['users'])
+        result = db.decode_json(row['result'], [])
+        perf = game_performance(users, result)
+        games.append((users, [perf[uid] for uid in users]))
+    return games
+
+
+def _rebuild(args):
+    import db
+    engine = get_engine(args.engine)
+    started = time.perf_counter()
+    games = _load_history()
+    loaded = time.perf_counter()
+    states = replay(games, engine)
+    replayed = time.perf_counter()
+    print(f"{len(games)} games, {len(states)} players: load {loaded - started:.2f}s, replay {replayed - loaded:.2f}s ({engine.name})")
+
+    if args.dry_run:
+        top = sorted(states.items(), key=lambda item: -item[1].rating)[:10]
+        for uid, state in top:
+            print(f"  {uid}: {round(state.rating)} (rd {state.rd:.1f})")
+        return
+
+    ids = list(states)
+    with db.transaction() as tx:
+        # Players without finished games go back to the defaults
+        if engine.uses_deviation:
+            tx.execute('UPDATE "user" SET rating = 0, rating_rd = :rd, rating_vol = :vol', {'rd': GLICKO_DEFAULT_RD, 'vol': GLICKO_DEFAULT_VOL})
+            tx.execute("""
+                UPDATE "user" u
+                SET rating = v.rating, rating_rd = v.rd, rating_vol = v.vol
+                FROM unnest(CAST(:ids AS integer[]), CAST(:ratings AS double precision[]), CAST(:rds AS double precision[]), CAST(:vols AS double precision[])) AS v(id, rating, rd, vol)
+                WHERE u.id = v.id
+            """, {'ids': ids, 'ratings': [states[uid].rating for uid in ids],
+                  'rds': [states[uid].rd for uid in ids], 'vols': [states[uid].vol for uid in ids]})
+        else:
+            tx.execute('UPDATE "user" SET rating = 0')
+            tx.execute("""
+                UPDATE "user" u
+                SET rating = v.rating
+                FROM unnest(CAST(:ids AS integer[]), CAST(:ratings AS double precision[])) AS v(id, rating)
+                WHERE u.id = v.id
+            """, {'ids': ids, 'ratings': [states[uid].rating for uid in ids]})
+        # The app refreshes the leaderboard view on its next read
+        tx.execute('UPDATE leaderboard_state SET dirty = true WHERE id = 1')
+    print(f"Ratings written for {len(ids)} players")
+
+
+def _bench(args):
+    engine = get_engine(args.engine)
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    games = []
+    for _ in range(args.games):
+        players = rng.sample(range(args.players), rng.randint(2, 4))
+        games.append((players, [rng.randint(-5, 5) for _ in players]))
+    generated = time.perf_counter()
+    replay(games, engine)
+    replayed = time.perf_counter()
+    mode = 'numpy' if np is not None else 'python'
+    print(f"{engine.name} ({mode}): {args.games} games, {args.players} players, "
+          f"generate {generated - started:.2f}s, replay {replayed - generated:.2f}s "
+          f"({args.games / max(replayed - generated, 1e-9):,.0f} games/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline rating tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    rebuild = sub.add_parser('rebuild', help='Replay all finished games and rewrite "user".rating')
+    rebuild.add_argument('--engine', default=None, help='classic, elo or glicko2 (default: RATING_ENGINE)')
+    rebuild.add_argument('--dry-run', action='store_true', help='Only print the top ratings')
+    rebuild.set_defaults(func=_rebuild)
+
+    bench = sub.add_parser('bench', help='Replay synthetic games and report throughput')
+    bench.add_argument('--engine', default=None)
+    bench.add_argument('--games', type=int, default=1000000)
+    bench.add_argument('--players', type=int, default=10000)
+    bench.add_argument('--seed', type=int, default=1)
+    bench.set_defaults(func=_bench)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+import argparse
+import os
+import random
+import re
+import string
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict, defaultdict
+
+import db
+
+# Word search within one dictionary (`api_search_words`).
+#
+#   prefix   words whose english starts with the query
+#   fuzzy    ranked: exact english match, english prefix, substring of the
+#            english or chinese, then english words with a trigram similarity
+#            of at least WORD_SEARCH_SIMILARITY (pg_trgm semantics, default 0.3)
+#
+# Within a rank words are ordered by lower(english) in code point order, then
+# id; similar words by similarity first. Both backends return the same pages:
+#
+#   postgres  indexes from migrations/0010_word_search.sql; needs pg_trgm
+#   memory    a WordIndex built from the cached words of the dict (see
+#             get_dict_words in app.py), no extension required. The indexes
+#             take about 0.8 KB per word; WORD_SEARCH_INDEX_WORDS bounds the
+#             words indexed per process (default 100000)
+#
+# WORD_SEARCH_BACKEND=auto (default) uses postgres when pg_trgm is installed.
+#
+#   python api/search.py bench --words 100000
+
+SIMILARITY = float(os.getenv('WORD_SEARCH_SIMILARITY', '0.3'))
+# Sorts after every character, so (prefix + _MAX_CHAR,) bounds all keys starting with prefix
+_MAX_CHAR = '\U0010ffff'
+_WORD = re.compile(r'[^\W_]+')
+INDEX_MAX_WORDS = int(os.getenv('WORD_SEARCH_INDEX_WORDS', '100000'))
+# A reload that changed more than this share of a dict's words rebuilds its index
+REBUILD_FRACTION = 0.1
+
+
+def normalize(query):
+    return query.strip().lower()
+
+
+def trigrams(text):
+    """pg_trgm's trigrams: each alphanumeric word padded with two spaces in front, one behind."""
+    grams = set()
+    for word in _WORD.findall(text.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _substring_grams(text):
+    # Bigrams narrow down substring matches; single non-ASCII characters are
+    # indexed too so one-character Chinese queries are served from the index
+    grams = {text[i:i + 2] for i in range(len(text) - 1)}
+    grams.update(c for c in text if not c.isascii())
+    return grams
+
+
+def _searches_substrings(q):
+    # A single ASCII letter "contained" in a word matches nearly everything
+    return len(q) >= 2 or not q.isascii()
+
+
+def _row(word):
+    return {'id': word['id'], 'dictid': word['dictid'], 'english': word['english'], 'chinese': word['chinese']}
+
+
+class WordIndex:
+    """Prefix, substring and trigram index over the active words of one dict."""
+
+    def __init__(self, words):
+        self.words = {}
+        self.keys = []
+        self.grams = defaultdict(list)
+        self.trigrams = defaultdict(list)
+        self.trigram_count = {}
+        for word in words:
+            self._index(word)
+            self.keys.append((self.words[word['id']][1], word['id']))
+        self.keys.sort()
+
+    def _index(self, word):
+        word_id = word['id']
+        english, chinese = word['english'].lower(), word['chinese'].lower()
+        self.words[word_id] = (word, english, chinese)
+        for gram in _substring_grams(english) | _substring_grams(chinese):
+            self.grams[gram].append(word_id)
+        grams = trigrams(english)
+        self.trigram_count[word_id] = len(grams)
+        for gram in grams:
+            self.trigrams[gram].append(word_id)
+
+    def add(self, word):
+        self._index(word)
+        insort(self.keys, (self.words[word['id']][1], word['id']))
+
+    def remove(self, word_id):
+        _, english, chinese = self.words.pop(word_id)
+        del self.keys[bisect_left(self.keys, (english, word_id))]
+        del self.trigram_count[word_id]
+        for postings, grams in ((self.grams, _substring_grams(english) | _substring_grams(chinese)),
+                                (self.trigrams, trigrams(english))):
+            for gram in grams:
+                ids = postings[gram]
+                ids.remove(word_id)
+                if not ids:
+                    del postings[gram]
+
+    def update(self, words, max_changes):
+        """Bring the index in line with `words` in place.
+
+        Returns False, leaving the index as it was, if more than `max_changes`
+        words were added, edited or removed (rebuilding is cheaper then).
+        """
+        current = set()
+        changed = []
+        for word in words:
+            current.add(word['id'])
+            entry = self.words.get(word['id'])
+            if entry is None or (entry[0]['english'], entry[0]['chinese']) != (word['english'], word['chinese']):
+                changed.append(word)
+        removed = [word_id for word_id in self.words if word_id not in current]
+        if len(changed) + len(removed) > max_changes:
+            return False
+        for word_id in removed:
+            self.remove(word_id)
+        for word in changed:
+            if word['id'] in self.words:
+                self.remove(word['id'])
+            self.add(word)
+        # Unchanged words point at the new copies so the old ones can be freed
+        for word in words:
+            _, english, chinese = self.words[word['id']]
+            self.words[word['id']] = (word, english, chinese)
+        return True
+
+    def prefix_range(self, q):
+        """Bounds of the words starting with `q` in `keys`."""
+        return bisect_left(self.keys, (q,)), bisect_left(self.keys, (q + _MAX_CHAR,))
+
+    def containing(self, q):
+        """Ids of words whose english or chinese contains `q`."""
+        if not _searches_substrings(q):
+            return set()
+        grams = sorted(_substring_grams(q) if len(q) > 1 else {q}, key=lambda gram: len(self.grams.get(gram, ())))
+        candidates = set(self.grams.get(grams[0], ()))
+        for gram in grams[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(self.grams.get(gram, ()))
+        return {i for i in candidates if q in self.words[i][1] or q in self.words[i][2]}
+
+    def similar(self, q, threshold):
+        """{id: similarity} of words whose english is at least `threshold` similar to `q`."""
+        query = trigrams(q)
+        if not query:
+            return {}
+        shared = defaultdict(int)
+        for gram in query:
+            for word_id in self.trigrams.get(gram, ()):
+                shared[word_id] += 1
+        result = {}
+        for word_id, count in shared.items():
+            similarity = count / (len(query) + self.trigram_count[word_id] - count)
+            if similarity >= threshold:
+                result[word_id] = similarity
+        return result
+
+
+class _IndexEntry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.source = None
+        self.index = None
+
+
+class MemoryBackend:
+    """Searches a WordIndex per dict, kept in an LRU bounded by indexed words.
+
+    The indexes are kept apart from the word cache (which is bounded by dict
+    count, not size): at most `max_words` words are indexed in total, evicting
+    the least recently searched dicts first (the dict being searched is always
+    kept). When the dict's cached words are reloaded after a write the index is
+    updated in place, and only rebuilt when more than REBUILD_FRACTION of its
+    words changed.
+    """
+
+    name = 'memory'
+
+    def __init__(self, load_words, similarity=SIMILARITY, max_words=INDEX_MAX_WORDS):
+        self._load_words = load_words
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._indexed = 0
+        self.similarity = similarity
+        self.max_words = max_words
+
+    def _entry(self, dict_id):
+        with self._lock:
+            entry = self._entries.get(dict_id)
+            if entry is None:
+                entry = self._entries[dict_id] = _IndexEntry()
+            self._entries.move_to_end(dict_id)
+            return entry
+
+    def _resize(self, dict_id, entry, delta):
+        with self._lock:
+            if self._entries.get(dict_id) is not entry:
+                # Evicted meanwhile; no longer counted
+                return
+            self._indexed += delta
+            while self._indexed > self.max_words and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._indexed -= len(evicted.index.words) if evicted.index else 0
+
+    def stats(self):
+        with self._lock:
+            return {'dicts': len(self._entries), 'words': self._indexed}
+
+    def _refresh(self, dict_id, entry, dict_words):
+        # Called with entry.lock held
+        if entry.source is dict_words:
+            return
+        before = len(entry.index.words) if entry.index else 0
+        active = dict_words['active']
+        if entry.index is None or not entry.index.update(active, max(1, int(before * REBUILD_FRACTION))):
+            entry.index = WordIndex(active)
+        entry.source = dict_words
+        self._resize(dict_id, entry, len(entry.index.words) - before)
+
+    def index(self, dict_id):
+        """The dict's up-to-date WordIndex (None if the dict does not exist)."""
+        dict_words = self._load_words(dict_id)
+        if not dict_words['exists']:
+            return None
+        entry = self._entry(dict_id)
+        with entry.lock:
+            self._refresh(dict_id, entry, dict_words)
+            return entry.index
+
+    def search(self, dict_id, q, mode, limit, offset):
+        dict_words = self._load_words(dict_id)
+        if not dict_words['exists']:
+            return None
+        entry = self._entry(dict_id)
+        # Updates happen in place, so searches of the same dict wait for them
+        with entry.lock:
+            self._refresh(dict_id, entry, dict_words)
+            return self._search(entry.index, q, mode, limit, offset)
+
+    def _search(self, index, q, mode, limit, offset):
+        end = offset + limit + 1
+        lo, hi = index.prefix_range(q)
+        ids = [word_id for _, word_id in index.keys[lo:min(hi, lo + end)]]
+        if mode == 'fuzzy' and len(ids) < end:
+            seen = {word_id for _, word_id in index.keys[lo:hi]}
+            containing = index.containing(q) - seen
+            ids.extend(sorted(containing, key=lambda i: (index.words[i][1], i)))
+            seen |= containing
+            if len(ids) < end:
+                similar = index.similar(q, self.similarity)
+                ids.extend(sorted(
+                    (i for i in similar if i not in seen),
+                    key=lambda i: (-similar[i], index.words[i][1], i)
+                ))
+        page = [_row(index.words[i][0]) for i in ids[offset:end]]
+        return page[:limit], len(page) > limit
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class PostgresBackend:
+    name = 'postgres'
+
+    def __init__(self, similarity=SIMILARITY):
+        self.similarity = similarity
+
+    def search(self, dict_id, q, mode, limit, offset):
+        params = {
+            'dictid': dict_id, 'q': q, 'limit': limit + 1, 'offset': offset,
+            'prefix': _escape_like(q) + '%',
+            'contains': '%' + _escape_like(q) + '%' if _searches_substrings(q) else None,
+            'similarity': str(self.similarity)
+        }
+        with db.transaction() as tx:
+            if not tx.fetchone('SELECT id FROM "dict" WHERE id = :id AND deleted = false', {'id': dict_id}):
+                return None
+            if mode == 'prefix':
+                rows = tx.fetchall("""
+                    SELECT id, dictid, english, chinese FROM "word"
+                    WHERE dictid = :dictid AND deleted = false AND lower(english) COLLATE "C" LIKE :prefix
+                    ORDER BY lower(english) COLLATE "C", id
+                    LIMIT :limit OFFSET :offset
+                """, params)
+            else:
+                # `%` (similar to) uses the transaction's threshold
+                tx.fetchone("SELECT set_config('pg_trgm.similarity_threshold', :similarity, true)", params)
+                rows = tx.fetchall("""
+                    SELECT id, dictid, english, chinese FROM (
+                        SELECT id, dictid, english, chinese, lower(english) AS key,
+                               CASE WHEN lower(english) = :q THEN 0
+                                    WHEN lower(english) COLLATE "C" LIKE :prefix THEN 1
+                                    WHEN lower(english) LIKE :contains OR chinese ILIKE :contains THEN 2
+                                    ELSE 3 END AS rank,
+                               similarity(lower(english), :q) AS similarity
+                        FROM "word"
+                        WHERE dictid = :dictid AND deleted = false
+                          AND (lower(english) COLLATE "C" LIKE :prefix
+                               OR lower(english) LIKE :contains
+                               OR chinese ILIKE :contains
+                               OR lower(english) % :q)
+                    ) matches
+                    ORDER BY rank, CASE WHEN rank = 3 THEN similarity ELSE 0 END DESC, key COLLATE "C", id
+                    LIMIT :limit OFFSET :offset
+                """, params)
+        return rows[:limit], len(rows) > limit
+
+
+class AutoBackend:
+    """Postgres when pg_trgm is installed, otherwise memory; decided on the first search."""
+    name = 'auto'
+
+    def __init__(self, load_words):
+        self._load_words = load_words
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            installed = db.fetchone("SELECT extname FROM pg_extension WHERE extname = 'pg_trgm'")
+            self._backend = PostgresBackend() if installed else MemoryBackend(self._load_words)
+        return self._backend
+
+    def search(self, dict_id, q, mode, limit, offset):
+        return self.backend.search(dict_id, q, mode, limit, offset)
+
+
+def get_backend(load_words, name=None):
+    """Search backend; `load_words(dict_id)` returns the dict's cached words (memory backend)."""
+    name = (name or os.getenv('WORD_SEARCH_BACKEND', 'auto')).lower()
+    if name == 'auto':
+        return AutoBackend(load_words)
+    if name == 'memory':
+        return MemoryBackend(load_words)
+    if name == 'postgres':
+        return PostgresBackend()
+    raise ValueError(f"Unknown word search backend: {name}")
+
+
+def _bench(args):
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    words = []
+    for word_id in range(1, args.words + 1):
+        english = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 12)))
+        chinese = ''.join(chr(rng.randint(0x4e00, 0x4e00 + 2000)) for _ in range(rng.randint(1, 4)))
+        words.append({'id': word_id, 'dictid': 1, 'english': english, 'chinese': chinese, 'deleted': False})
+    cached = {'exists': True, 'words': {w['id']: w for w in words}, 'active': words}
+    backend = MemoryBackend(lambda dict_id: cached, max_words=args.words)
+    generated = time.perf_counter()
+    backend.index(1)
+    built = time.perf_counter()
+    print(f"{args.words} words: generate {generated - started:.2f}s, build index {built - generated:.2f}s")
+
+    # A word write reloads the cached words; the index is updated in place
+    edited = [dict(w, english=w['english'] + 's') if w['id'] % 1000 == 0 else w for w in words]
+    cached = {'exists': True, 'words': {w['id']: w for w in edited}, 'active': edited}
+    started = time.perf_counter()
+    backend.index(1)
+    print(f"{args.words // 1000} words edited: update index {time.perf_counter() - started:.3f}s")
+
+    samples = [rng.choice(words) for _ in range(args.queries)]
+    queries = [
+        ('prefix, 1 letter', 'prefix', [w['english'][:1] for w in samples]),
+        ('prefix, 3 letters', 'prefix', [w['english'][:3] for w in samples]),
+        ('fuzzy, 1 letter', 'fuzzy', [w['english'][:1] for w in samples]),
+        ('fuzzy, typo', 'fuzzy', [w['english'][:-1] + 'x' for w in samples]),
+        ('fuzzy, 1 chinese char', 'fuzzy', [w['chinese'][:1] for w in samples]),
+        ('fuzzy, 2 chinese chars', 'fuzzy', [w['chinese'][:2] for w in samples]),
+    ]
+    for label, mode, texts in queries:
+        started = time.perf_counter()
+        for q in texts:
+            backend.search(1, q, mode, args.limit, 0)
+        elapsed = (time.perf_counter() - started) / len(texts)
+        print(f"{label:24s} {elapsed * 1000:8.3f} ms/query")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Word search tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help='Query a synthetic dict with the in-process index')
+    bench.add_argument('--words', type=int, default=100000)
+    bench.add_argument('--queries', type=int, default=200)
+    bench.add_argument('--limit', type=int, default=20)
+    bench.add_argument('--seed', type=int, default=1)
+    bench.set_defaults(func=_bench)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
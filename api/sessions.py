@@ -0,0 +1,150 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+
+import db
+
+# Signed session tokens.
+#
+# `api_login` sets an HttpOnly cookie holding
+#     base64url(payload) "." base64url(HMAC-SHA256(SESSION_SECRET, payload))
+# where payload is {"uid", "name", "type", "tv", "exp"}. Checking a token needs
+# no database access: the signature proves we issued it, `exp` bounds its life
+# (SESSION_TTL seconds) and `tv` is the user's "user".token_version at issue time.
+#
+# Password changes, admin resets and deletes bump token_version and record the
+# new value in session_revocation. Each process keeps that (small) list in memory
+# and pulls new rows at most every REVOCATION_REFRESH_SECONDS, so a revoked
+# token stops working everywhere within that interval (immediately in the
+# process that revoked it).
+#
+# SESSION_SECRET must be set to the same value on every instance; without it a
+# random per-process secret is used and sessions only survive within one process.
+
+COOKIE_NAME = 'wm_session'
+TTL = int(os.getenv('SESSION_TTL', str(30 * 24 * 3600)))
+REVOCATION_REFRESH_SECONDS = float(os.getenv('SESSION_REVOCATION_REFRESH', '30'))
+
+_secret = os.getenv('SESSION_SECRET')
+if not _secret:
+    print("SESSION_SECRET is not set; using a random per-process secret")
+    _secret = base64.b64encode(os.urandom(32)).decode()
+SECRET = _secret.encode()
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _b64encode(hmac.new(SECRET, payload.encode(), hashlib.sha256).digest())
+
+
+def issue(user):
+    """Token for `user` (id, username, type, token_version)."""
+    payload = _b64encode(json.dumps({
+        'uid': user['id'],
+        'name': user['username'],
+        'type': user['type'],
+        'tv': user.get('token_version') or 0,
+        'exp': int(time.time()) + TTL
+    }, separators=(',', ':')).encode())
+    return f'{payload}.{_sign(payload)}'
+
+
+class RevocationList:
+    """uid -> lowest token_version that is still valid, mirrored from session_revocation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._min_version = {}
+        self._last_id = None
+        self._refreshed = 0.0
+
+    def _refresh(self):
+        if self._last_id is None:
+            # Revocations older than TTL only concern tokens that have expired anyway
+            rows = db.fetchall("""
+                SELECT id, uid, token_version FROM session_revocation
+                WHERE created_at > CURRENT_TIMESTAMP - make_interval(secs => :ttl)
+                ORDER BY id
+            """, {'ttl': TTL})
+            self._last_id = 0
+        else:
+            rows = db.fetchall(
+                'SELECT id, uid, token_version FROM session_revocation WHERE id > :last ORDER BY id',
+                {'last': self._last_id}
+            )
+        for row in rows:
+            self._remember(row['uid'], row['token_version'])
+            self._last_id = max(self._last_id, row['id'])
+
+    def _remember(self, uid, token_version):
+        if token_version > self._min_version.get(uid, 0):
+            self._min_version[uid] = token_version
+
+    def min_version(self, uid):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._refreshed > REVOCATION_REFRESH_SECONDS:
+                try:
+                    self._refresh()
+                    self._refreshed = now
+                except Exception as e:
+                    # Keep serving from the last known list; retry on the next request
+                    print(f"Session revocation refresh error: {e}")
+            return self._min_version.get(uid, 0)
+
+    def add(self, uid, token_version):
+        with self._lock:
+            self._remember(uid, token_version)
+
+    def size(self):
+        with self._lock:
+            return len(self._min_version)
+
+
+revocations = RevocationList()
+
+
+def verify(token):
+    """The user (id, username, type, token_version) of a valid token, else None."""
+    if not token:
+        return None
+    try:
+        payload, signature = token.split('.')
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        data = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+    if data.get('exp', 0) < time.time():
+        return None
+    if data['tv'] < revocations.min_version(data['uid']):
+        return None
+    return {'id': data['uid'], 'username': data['name'], 'type': data['type'], 'token_version': data['tv']}
+
+
+def revoke(uid):
+    """Invalidate every token issued to `uid` so far. Returns the new token_version."""
+    with db.transaction() as tx:
+        row = tx.fetchone(
+            'UPDATE "user" SET token_version = token_version + 1 WHERE id = :id RETURNING token_version',
+            {'id': uid}
+        )
+        if row is None:
+            return None
+        tx.execute(
+            'INSERT INTO session_revocation (uid, token_version) VALUES (:uid, :tv)',
+            {'uid': uid, 'tv': row['token_version']}
+        )
+    revocations.add(uid, row['token_version'])
+    return row['token_version']
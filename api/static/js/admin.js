@@ -11,8 +11,10 @@ let currentDictId = null;
 let currentWordId = null;
 let dicts = [];
 let words = [];
+let wordsVersion = null; // `version` of the loaded words, for /words?since=
 let deleteMode = null; // 'dict' or 'word'
 let deleteTargetId = null;
+const WORD_PAGE_SIZE = 5000; // words per /api/dict/<id>/words request
 
 document.addEventListener('DOMContentLoaded', async () => {
     // Check authentication first
@@ -132,8 +134,7 @@ async function checkAdminAccess() {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                uid: currentUid,
-                pwhash: currentPwHash
+                uid: currentUid
             })
         });
         
@@ -155,7 +156,7 @@ async function loadUsers() {
         showLoading('usersTableBody');
         
         const response = await fetch(
-            `/api/admin/users?uid=${currentUid}&pwhash=${currentPwHash}&include_deleted=${showDeleted}`,
+            `/api/admin/users?include_deleted=${showDeleted}`,
             {
                 method: 'GET'
             }
@@ -296,7 +297,6 @@ async function handleResetPassword(e) {
             },
             body: JSON.stringify({
                 uid: currentUid,
-                pwhash: currentPwHash,
                 new_password: newPassword
             })
         });
@@ -373,8 +373,7 @@ async function handleConfirmAction() {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
-                    uid: currentUid,
-                    pwhash: currentPwHash
+                    uid: currentUid
                 })
             }
         );
@@ -409,7 +408,7 @@ async function handleConfirmAction() {
 // Load dictionaries
 async function loadDicts() {
     try {
-        const response = await fetch(`/api/dicts?uid=${currentUid}&pwhash=${currentPwHash}`);
+        const response = await fetch(`/api/dicts`);
         const data = await response.json();
 
         if (!data.success) {
@@ -500,7 +499,6 @@ async function saveDict() {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 uid: currentUid,
-                pwhash: currentPwHash,
                 dictname: dictName
             })
         });
@@ -523,20 +521,37 @@ async function saveDict() {
     }
 }
 
+// Fetch every page of /api/dict/<id>/words for `query`; null on failure
+async function fetchWordPages(query) {
+    let fetched = [];
+    let version = null;
+    let after = 0;
+    do {
+        const response = await fetch(`/api/dict/${currentDictId}/words?${query}&after=${after}`);
+        const data = await response.json();
+        if (!data.success) return null;
+        fetched = fetched.concat(data.words || []);
+        // Changes made while paging have a higher version and arrive with the next sync
+        if (version === null) version = data.version;
+        after = data.next_cursor;
+    } while (after);
+    return { words: fetched, version: version };
+}
+
 // Load words
 async function loadWords() {
     if (!currentDictId) return;
 
     try {
-        const response = await fetch(`/api/dict/${currentDictId}/words?uid=${currentUid}&pwhash=${currentPwHash}`);
-        const data = await response.json();
+        const result = await fetchWordPages(`limit=${WORD_PAGE_SIZE}`);
 
-        if (!data.success) {
+        if (!result) {
             showAlert('加载单词失败', 'danger');
             return;
         }
 
-        words = data.words || [];
+        words = result.words;
+        wordsVersion = result.version;
         renderWordTable();
     } catch (error) {
         console.error('Load words error:', error);
@@ -544,6 +559,27 @@ async function loadWords() {
     }
 }
 
+// Apply the words changed since the last load (after an edit, import or delete)
+async function syncWords() {
+    if (!currentDictId) return;
+    if (wordsVersion === null) return loadWords();
+
+    try {
+        const result = await fetchWordPages(`since=${wordsVersion}&limit=${WORD_PAGE_SIZE}`);
+        if (!result) return loadWords();
+
+        const changed = new Map(result.words.map(word => [word.id, word]));
+        words = words.filter(word => !changed.has(word.id))
+            .concat(result.words.filter(word => !word.deleted))
+            .sort((a, b) => a.id - b.id);
+        wordsVersion = result.version;
+        renderWordTable();
+    } catch (error) {
+        console.error('Sync words error:', error);
+        await loadWords();
+    }
+}
+
 // Render words table
 function renderWordTable() {
     const tbody = document.getElementById('wordsTableBody');
@@ -631,7 +667,6 @@ async function handleSaveWord() {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 uid: currentUid,
-                pwhash: currentPwHash,
                 english: english,
                 chinese: chinese
             })
@@ -642,7 +677,7 @@ async function handleSaveWord() {
         if (data.success) {
             showAlert(currentWordId ? '单词已更新' : '单词已添加', 'success');
             closeWordModal();
-            await loadWords();
+            await syncWords();
         } else {
             showError('wordModalError', data.message || '保存失败');
         }
@@ -659,26 +694,15 @@ async function downloadCsv() {
         return;
     }
 
-    try {
-        const response = await fetch(`/api/dict/${currentDictId}/export-csv?uid=${currentUid}&pwhash=${currentPwHash}`);
-        const data = await response.json();
-
-        if (data.success) {
-            const element = document.createElement('a');
-            element.setAttribute('href', 'data:text/csv;charset=utf-8,' + encodeURIComponent(data.content));
-            element.setAttribute('download', data.filename);
-            element.style.display = 'none';
-            document.body.appendChild(element);
-            element.click();
-            document.body.removeChild(element);
-            showAlert('CSV已下载', 'success');
-        } else {
-            showAlert(data.message || '导出失败', 'danger');
-        }
-    } catch (error) {
-        console.error('Download CSV error:', error);
-        showAlert('导出失败，请重试', 'danger');
-    }
+    // The server streams the CSV as a file download
+    const element = document.createElement('a');
+    element.setAttribute('href', `/api/dict/${currentDictId}/export-csv`);
+    element.setAttribute('download', '');
+    element.style.display = 'none';
+    document.body.appendChild(element);
+    element.click();
+    document.body.removeChild(element);
+    showAlert('CSV已下载', 'success');
 }
 
 // Handle CSV file select
@@ -712,7 +736,6 @@ async function importCsvText() {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 uid: currentUid,
-                pwhash: currentPwHash,
                 csv: csvContent
             })
         });
@@ -720,9 +743,17 @@ async function importCsvText() {
         const data = await response.json();
 
         if (data.success) {
-            showAlert(`成功导入 ${data.count} 个单词`, 'success');
+            let message = `成功导入 ${data.count} 个单词`;
+            if (data.skipped) {
+                message += `，跳过 ${data.skipped} 个重复单词`;
+            }
+            if (data.error_count) {
+                const lines = (data.errors || []).map(err => err.line).join(', ');
+                message += `，${data.error_count} 行格式错误（第 ${lines} 行）`;
+            }
+            showAlert(message, 'success');
             document.getElementById('csvTextarea').value = '';
-            await loadWords();
+            await syncWords();
         } else {
             showAlert(data.message || '导入失败', 'danger');
         }
@@ -768,8 +799,7 @@ async function handleConfirmDelete() {
             method: 'DELETE',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                uid: currentUid,
-                pwhash: currentPwHash
+                uid: currentUid
             })
         });
 
@@ -783,7 +813,7 @@ async function handleConfirmDelete() {
                 await loadDicts();
                 closeDictEditSection();
             } else {
-                await loadWords();
+                await syncWords();
             }
         } else {
             showAlert(data.message || '删除失败', 'danger');
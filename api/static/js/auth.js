@@ -115,7 +115,7 @@ function clearAuthCookies() {
     document.cookie = 'pwhash=;expires=Thu, 01 Jan 1970 00:00:00 UTC;path=/;';
 }
 
-// Verify if user is authenticated
+// Verify if user is authenticated (null if the server could not tell)
 async function verifyAuth() {
     const auth = getAuthCookies();
     
@@ -130,11 +130,14 @@ async function verifyAuth() {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                uid: parseInt(auth.uid),
-                pwhash: auth.pwhash
+                uid: parseInt(auth.uid)
             })
         });
         
+        // 503: the server was too busy to check the password, which is not a rejection
+        if (response.status === 503) {
+            return null;
+        }
         const data = await response.json();
         return data.success === true;
     } catch (error) {
@@ -147,7 +150,7 @@ async function verifyAuth() {
 async function requireAuth() {
     const isAuthenticated = await verifyAuth();
     
-    if (!isAuthenticated) {
+    if (isAuthenticated === false) {
         window.location.href = '/login/';
         return false;
     }
@@ -212,7 +215,12 @@ async function register(username, password, introduction) {
 }
 
 // Logout function
-function logout() {
+async function logout() {
+    try {
+        await fetch('/api/logout', { method: 'POST' });
+    } catch (e) {
+        console.error('Logout error:', e);
+    }
     clearAuthCookies();
     window.location.href = '/login/';
 }
@@ -76,8 +76,7 @@ document.addEventListener('DOMContentLoaded', async () => {
                 body: JSON.stringify({
                     current_password: currentPassword || null,
                     new_password: newPassword || null,
-                    introduction: introduction,
-                    pwhash: pwHash
+                    introduction: introduction
                 })
             });
             
@@ -23,7 +23,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
 async function loadGameDetail(gameId) {
     try {
-        const response = await fetch(`/api/game/${gameId}?uid=${AUTH_DATA.uid}&pwhash=${AUTH_DATA.pwhash}`);
+        const response = await fetch(`/api/game/${gameId}`);
         if (!response.ok) {
             console.error('Failed to load game:', response.status);
             showError('无法加载对局信息');
@@ -27,7 +27,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
 async function loadGameAndStart() {
     try {
-        const response = await fetch(`/api/game/${gameId}?uid=${AUTH_DATA.uid}&pwhash=${AUTH_DATA.pwhash}`);
+        const response = await fetch(`/api/game/${gameId}`);
         if (!response.ok) {
             showError('无法加载对局信息');
             return;
@@ -41,7 +41,11 @@ async function loadGameAndStart() {
                 initializeScores();
                 displayCurrentWord();
             updateParticipantsList();
-            autoRefresh();
+            if (window.EventSource) {
+                subscribeGameEvents();
+            } else {
+                autoRefresh();
+            }
         } else {
             showError(data.message || '加载对局失败');
         }
@@ -143,13 +147,19 @@ async function submitAnswer(event) {
             headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
                 uid: AUTH_DATA.uid,
-                pwhash: AUTH_DATA.pwhash,
                 word_id: expectedWordId,
                 answer: answer
             })
         });
 
         const data = await response.json();
+        if (response.status === 409) {
+            // Someone else answered this turn first; resync instead of erroring
+            await refreshGameOnce();
+            displayCurrentWord();
+            submitBtn.disabled = false;
+            return;
+        }
         if (data.success) {
             // Record the answer
             userAnswers.push({
@@ -271,8 +281,7 @@ async function endGame() {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                uid: AUTH_DATA.uid,
-                pwhash: AUTH_DATA.pwhash
+                uid: AUTH_DATA.uid
             })
         });
 
@@ -291,9 +300,9 @@ async function endGame() {
 
 function autoRefresh() {
     // Refresh game data every 5 seconds to sync with other players
-    setInterval(async () => {
+    return setInterval(async () => {
         try {
-            const response = await fetch(`/api/game/${gameId}?uid=${AUTH_DATA.uid}&pwhash=${AUTH_DATA.pwhash}`);
+            const response = await fetch(`/api/game/${gameId}`);
             if (!response.ok) return;
 
             const data = await response.json();
@@ -315,9 +324,72 @@ function autoRefresh() {
     }, 5000);
 }
 
+// Receive game deltas pushed by the server instead of polling
+function subscribeGameEvents() {
+    const source = new EventSource(`/api/game/${gameId}/events`);
+    let connectedOnce = false;
+    // Keep polling unless the server's broker also streams changes made on other instances
+    let fallbackPoll = autoRefresh();
+
+    source.addEventListener('hello', (e) => {
+        if (JSON.parse(e.data).shared && fallbackPoll) {
+            clearInterval(fallbackPoll);
+            fallbackPoll = null;
+        }
+    });
+
+    source.addEventListener('error', () => {
+        if (source.readyState === EventSource.CLOSED && !fallbackPoll) {
+            fallbackPoll = autoRefresh();
+        }
+    });
+
+    source.addEventListener('open', async () => {
+        // Events sent while disconnected are lost; resync after a reconnect
+        if (connectedOnce) {
+            await refreshGameOnce();
+            displayCurrentWord();
+        }
+        connectedOnce = true;
+    });
+
+    source.addEventListener('answer', (e) => {
+        const event = JSON.parse(e.data);
+        const results = currentGameData.result || [];
+        if (event.index !== results.length) {
+            // Missed or duplicate delta: fall back to a full refresh
+            refreshGameOnce().then(displayCurrentWord);
+            return;
+        }
+        results.push(event.entry);
+        currentGameData.result = results;
+        currentGameData.next_turn = event.next_turn;
+        currentGameData.next_word = event.next_word;
+        currentGameData.current_index = results.length;
+        currentWordIndex = results.length;
+        initializeScores();
+        updateParticipantsList();
+        displayCurrentWord();
+    });
+
+    source.addEventListener('users', () => {
+        refreshGameOnce().then(displayCurrentWord);
+    });
+
+    source.addEventListener('status', (e) => {
+        const event = JSON.parse(e.data);
+        currentGameData.status = event.status;
+        if (event.status === 1) {
+            source.close();
+            clearInterval(fallbackPoll);
+            window.location.href = `/game/${gameId}/detail/`;
+        }
+    });
+}
+
 async function refreshGameOnce() {
     try {
-        const response = await fetch(`/api/game/${gameId}?uid=${AUTH_DATA.uid}&pwhash=${AUTH_DATA.pwhash}`);
+        const response = await fetch(`/api/game/${gameId}`);
         if (!response.ok) return;
         const data = await response.json();
         if (data.success) {
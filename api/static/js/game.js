@@ -3,8 +3,16 @@
 // Game status tracking
 let currentGameTab = 'pending'; // pending, running, finished
 let allGames = [];
+let activeGames = [];   // pending + running games, polled
+let finishedGames = []; // most recent finished games, loaded when the tab is shown
+let listEtags = {};     // ETag of the last response per list URL
 let AUTH_DATA = {};
 
+const FINISHED_PAGE_SIZE = 50;
+// Polling interval next to the event stream when the server's broker is not
+// shared between instances (changes made on other instances are not streamed)
+const FALLBACK_POLL_MS = 5000;
+
 // Initialize game page
 document.addEventListener('DOMContentLoaded', async () => {
     // Get auth from cookies
@@ -18,8 +26,26 @@ document.addEventListener('DOMContentLoaded', async () => {
     loadGames();
     setupEventListeners();
 
-    // Auto-refresh games every 2 seconds
-    setInterval(loadGames, 2000);
+    // Reload the list when the server reports a game change; poll when SSE is unavailable
+    if (window.EventSource) {
+        const source = new EventSource(`/api/game/events`);
+        let fallbackPoll = setInterval(loadGames, FALLBACK_POLL_MS);
+        source.addEventListener('hello', (e) => {
+            if (JSON.parse(e.data).shared && fallbackPoll) {
+                clearInterval(fallbackPoll);
+                fallbackPoll = null;
+            }
+        });
+        source.addEventListener('error', () => {
+            if (source.readyState === EventSource.CLOSED && !fallbackPoll) {
+                fallbackPoll = setInterval(loadGames, FALLBACK_POLL_MS);
+            }
+        });
+        source.addEventListener('game_changed', loadGames);
+        source.addEventListener('open', loadGames);
+    } else {
+        setInterval(loadGames, 2000);
+    }
 });
 
 function setupEventListeners() {
@@ -30,6 +56,9 @@ function setupEventListeners() {
             tabButtons.forEach(b => b.classList.remove('active'));
             btn.classList.add('active');
             currentGameTab = btn.dataset.tab;
+            if (currentGameTab === 'finished') {
+                loadGames();
+            }
             renderGames();
         });
     });
@@ -41,34 +70,72 @@ function setupEventListeners() {
     }
 }
 
+// Fetch a game list URL, sending the last ETag. Returns null when unchanged (304).
+async function fetchGameList(url) {
+    const headers = {};
+    if (listEtags[url]) {
+        headers['If-None-Match'] = listEtags[url];
+    }
+
+    const response = await fetch(url, { headers, cache: 'no-store' });
+    if (response.status === 304) {
+        return null;
+    }
+    if (!response.ok) {
+        console.error('Failed to load games:', response.status);
+        return null;
+    }
+
+    const data = await response.json();
+    if (!data.success) {
+        return null;
+    }
+    const etag = response.headers.get('ETag');
+    if (etag) {
+        listEtags[url] = etag;
+    }
+    return data.games;
+}
+
 async function loadGames() {
     try {
-        const response = await fetch(`/api/game/list?uid=${AUTH_DATA.uid}&pwhash=${AUTH_DATA.pwhash}`);
-        if (!response.ok) {
-            console.error('Failed to load games:', response.status);
-            return;
+        const baseUrl = `/api/game/list`;
+        let changed = false;
+
+        const active = await fetchGameList(`${baseUrl}?status=-1,0&limit=200`);
+        if (active) {
+            activeGames = active;
+            changed = true;
         }
 
-        const data = await response.json();
-        if (data.success) {
-            allGames = data.games;
+        if (currentGameTab === 'finished') {
+            const finished = await fetchGameList(`${baseUrl}?status=1&limit=${FINISHED_PAGE_SIZE}`);
+            if (finished) {
+                finishedGames = finished;
+                changed = true;
+            }
+        }
 
-            // If any joined game has just started, redirect the joined users immediately (only from homepage)
-            try {
-                const locationPath = window.location.pathname;
-                if (locationPath === '/') {
-                    const myRunning = allGames.find(g => g.is_joined && g.status === 0);
-                    if (myRunning) {
-                        window.location.href = `/game/${myRunning.id}/`;
-                        return;
-                    }
+        if (!changed) {
+            return;
+        }
+        allGames = activeGames.concat(finishedGames);
+
+        // If any joined game has just started, redirect the joined users immediately (only from homepage)
+        try {
+            const locationPath = window.location.pathname;
+            if (locationPath === '/') {
+                const myRunning = allGames.find(g => g.is_joined && g.status === 0);
+                if (myRunning) {
+                    window.location.href = `/game/${myRunning.id}/`;
+                    return;
                 }
-            } catch (e) {
-                // ignore and continue
             }
-
-            renderGames();
+        } catch (e) {
+            // ignore and continue
         }
+
+        renderGames();
     } catch (error) {
         console.error('Error loading games:', error);
     }
@@ -209,8 +276,7 @@ async function joinGame(gameId) {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                uid: AUTH_DATA.uid,
-                pwhash: AUTH_DATA.pwhash
+                uid: AUTH_DATA.uid
             })
         });
 
@@ -235,8 +301,7 @@ async function leaveGame(gameId) {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                uid: AUTH_DATA.uid,
-                pwhash: AUTH_DATA.pwhash
+                uid: AUTH_DATA.uid
             })
         });
 
@@ -261,8 +326,7 @@ async function startGame(gameId) {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                uid: AUTH_DATA.uid,
-                pwhash: AUTH_DATA.pwhash
+                uid: AUTH_DATA.uid
             })
         });
 
@@ -325,7 +389,6 @@ function showCreateGameModal() {
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({
                         uid: AUTH_DATA.uid,
-                        pwhash: AUTH_DATA.pwhash,
                         dict_id: dictId
                     })
                 });
@@ -350,7 +413,7 @@ function showCreateGameModal() {
 
 async function fetchDictionaries() {
     try {
-        const response = await fetch(`/api/dicts?uid=${AUTH_DATA.uid}&pwhash=${AUTH_DATA.pwhash}`);
+        const response = await fetch(`/api/dicts`);
         if (!response.ok) return [];
 
         const data = await response.json();
@@ -399,7 +462,7 @@ function closeModal(id) {
 // Fetch user names for display
 async function fetchUserName(userId) {
     try {
-        const response = await fetch(`/api/user/${userId}?uid=${AUTH_DATA.uid}&pwhash=${AUTH_DATA.pwhash}`);
+        const response = await fetch(`/api/user/${userId}`);
         if (!response.ok) return `User ${userId}`;
 
         const data = await response.json();
@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pytest
+
+# The app imports its modules flat from api/ (as on Vercel)
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api')
+sys.path.insert(0, API_DIR)
+
+# Database tests run against TEST_DATABASE_URL, a disposable database: the
+# schema is migrated and every table is emptied before each test.
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+if TEST_DATABASE_URL:
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+os.environ.setdefault('SESSION_SECRET', 'test-secret')
+# Fast hashes keep the fixtures quick; scrypt itself is not under test here
+os.environ.setdefault('PASSWORD_HASHER', 'sha256')
+
+requires_db = pytest.mark.skipif(not TEST_DATABASE_URL, reason='TEST_DATABASE_URL is not set')
+
+TABLES = ['game_answer', 'session_revocation', 'game', 'word', 'dict', '"user"']
+
+
+@pytest.fixture(scope='session')
+def migrated():
+    import migrate
+    migrate.up(None)
+
+
+@pytest.fixture
+def database(migrated):
+    import db
+    db.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE")
+    return db
+
+
+@pytest.fixture
+def app(database):
+    import app as app_module
+    app_module.app.config['TESTING'] = True
+    for cache in (app_module.auth_cache, app_module.leaderboard_cache, app_module.word_cache):
+        cache.clear()
+    return app_module
+
+
+@pytest.fixture
+def make_user(app):
+    def make(username, password='secret123'):
+        pwhash = app.hash_password(password)
+        uid = app.db.insert_returning_id(
+            'INSERT INTO "user" (username, pwhash, introduction, rating, type, deleted) '
+            'VALUES (:username, :pwhash, \'\', 0, 0, false) RETURNING id',
+            {'username': username, 'pwhash': app.passwords.make_hash(pwhash)}
+        )
+        return {'id': uid, 'pwhash': pwhash}
+    return make
+
+
+def login(client, user):
+    import sessions
+    # The session cookie issued to the previous user would take precedence
+    client.delete_cookie(sessions.COOKIE_NAME)
+    client.set_cookie('uid', str(user['id']))
+    client.set_cookie('pwhash', user['pwhash'])
+    return client
+
+
+@pytest.fixture
+def make_dict(app):
+    def make(words, dictname='test'):
+        with app.db.transaction() as tx:
+            dict_id = tx.insert_returning_id(
+                'INSERT INTO "dict" (dictname, word_count) VALUES (:dictname, :count) RETURNING id',
+                {'dictname': dictname, 'count': len(words)}
+            )
+            tx.insert_values('INSERT INTO "word" (dictid, english, chinese) VALUES %s',
+                             [(dict_id, english, chinese) for english, chinese in words])
+        return dict_id
+    return make
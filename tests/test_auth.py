@@ -0,0 +1,53 @@
+from conftest import login, requires_db
+
+pytestmark = requires_db
+
+
+def test_busy_password_check_is_not_an_authentication_failure(app, make_user, monkeypatch):
+    user = make_user('busy')
+
+    def verify(*args):
+        raise app.passwords.Busy()
+
+    monkeypatch.setattr(app.passwords, 'verify', verify)
+    client = login(app.app.test_client(), user)
+
+    response = client.post('/api/verify')
+    assert response.status_code == 503
+    assert response.get_json() == {'success': False, 'message': 'Server busy, please retry'}
+    assert client.get('/admin/').status_code == 503
+
+    monkeypatch.undo()
+    assert client.post('/api/verify').status_code == 200
+
+
+def test_wrong_password_is_still_rejected(app, make_user):
+    user = make_user('wrong')
+    client = login(app.app.test_client(), dict(user, pwhash='0' * 64))
+    assert client.post('/api/verify').status_code == 401
+    assert client.get('/admin/').status_code == 302
+
+
+def test_busy_password_change_answers_503(app, make_user, database, monkeypatch):
+    user = make_user('changer')
+    root = make_user('root')
+    target = make_user('target')
+    database.execute("""UPDATE "user" SET type = 'root' WHERE id = :id""", {'id': root['id']})
+    client = app.app.test_client()
+
+    def busy(*args):
+        raise app.passwords.Busy()
+
+    # The session check itself is not what is busy here
+    login(client, user)
+    assert client.post('/api/verify').status_code == 200
+    monkeypatch.setattr(app.passwords, 'verify', busy)
+    response = client.post(f"/api/user/{user['id']}/update", json={'current_password': 'secret123', 'new_password': 'secret456'})
+    assert response.status_code == 503
+
+    monkeypatch.undo()
+    login(client, root)
+    assert client.post('/api/verify').status_code == 200
+    monkeypatch.setattr(app.passwords, 'make_hash', busy)
+    response = client.post(f"/api/admin/user/{target['id']}/reset-password", json={'new_password': 'secret456'})
+    assert response.status_code == 503
@@ -0,0 +1,31 @@
+import threading
+import time
+
+import pytest
+
+from conftest import requires_db
+
+pytestmark = requires_db
+
+
+def test_only_checkouts_from_an_exhausted_pool_count_as_waits(database):
+    if database.POOL_MODE == 'null':
+        pytest.skip('no client-side pool')
+    before = database.pool_stats()
+    database.fetchone('SELECT 1 AS ok')
+    assert database.pool_stats()['waits'] == before['waits']
+
+    held = [database.engine.connect() for _ in range(database.POOL_SIZE + database.MAX_OVERFLOW)]
+    try:
+        waiter = threading.Thread(target=database.fetchone, args=('SELECT 1 AS ok',))
+        waiter.start()
+        time.sleep(0.1)
+        assert waiter.is_alive()
+    finally:
+        for conn in held:
+            conn.close()
+    waiter.join()
+
+    stats = database.pool_stats()
+    assert stats['waits'] == before['waits'] + 1
+    assert stats['checkouts'] == before['checkouts'] + 2
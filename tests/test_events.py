@@ -0,0 +1,100 @@
+import queue
+import threading
+
+import events
+from conftest import TEST_DATABASE_URL, requires_db
+
+
+def test_local_broker_delivers_to_channel_subscribers_only():
+    broker = events.LocalBroker()
+    game = broker.subscribe(events.game_channel(1))
+    other = broker.subscribe(events.game_channel(2))
+
+    broker.publish(events.game_channel(1), {'type': 'answer', 'index': 0})
+
+    assert game.get_nowait() == {'type': 'answer', 'index': 0}
+    assert other.empty()
+
+
+def test_local_broker_fans_out_in_order():
+    broker = events.LocalBroker()
+    subscribers = [broker.subscribe(events.LOBBY_CHANNEL) for _ in range(3)]
+
+    for i in range(5):
+        broker.publish(events.LOBBY_CHANNEL, {'type': 'game_changed', 'game_id': i})
+
+    for q in subscribers:
+        assert [q.get_nowait()['game_id'] for _ in range(5)] == list(range(5))
+
+
+def test_local_broker_unsubscribe_stops_delivery():
+    broker = events.LocalBroker()
+    q = broker.subscribe(events.LOBBY_CHANNEL)
+    broker.unsubscribe(events.LOBBY_CHANNEL, q)
+
+    broker.publish(events.LOBBY_CHANNEL, {'type': 'game_changed'})
+
+    assert q.empty()
+
+
+def test_local_broker_drops_events_for_slow_subscribers():
+    broker = events.LocalBroker()
+    slow = broker.subscribe(events.LOBBY_CHANNEL)
+
+    for i in range(events.SUBSCRIBER_QUEUE_SIZE + 10):
+        broker.publish(events.LOBBY_CHANNEL, {'i': i})
+
+    assert slow.qsize() == events.SUBSCRIBER_QUEUE_SIZE
+    assert slow.get_nowait() == {'i': 0}
+
+
+def test_local_broker_wakes_a_waiting_subscriber():
+    broker = events.LocalBroker()
+    q = broker.subscribe(events.game_channel(7))
+    received = []
+
+    def wait():
+        try:
+            received.append(q.get(timeout=2))
+        except queue.Empty:
+            pass
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    broker.publish(events.game_channel(7), {'type': 'status', 'status': 0})
+    waiter.join()
+
+    assert received == [{'type': 'status', 'status': 0}]
+
+
+def test_only_the_postgres_broker_is_shared():
+    assert events.LocalBroker.shared is False
+    assert events.LocalBroker().shared is False
+
+
+@requires_db
+def test_postgres_broker_listens_outside_the_pool(database):
+    broker = events.PostgresBroker(TEST_DATABASE_URL)
+    checked_out = database.engine.pool.checkedout()
+    q = broker.subscribe(events.game_channel(3))
+    assert broker.shared is True
+    assert database.engine.pool.checkedout() == checked_out
+
+    broker.publish(events.game_channel(3), {'type': 'answer', 'index': 1})
+    assert q.get(timeout=5) == {'type': 'answer', 'index': 1}
+    assert q.empty()
+
+
+@requires_db
+def test_postgres_broker_falls_back_to_local_delivery(database, monkeypatch):
+    def connect(dsn):
+        # e.g. LISTEN refused by a transaction-mode pooler
+        raise events.psycopg2.OperationalError('cannot listen')
+
+    monkeypatch.setattr(events.psycopg2, 'connect', connect)
+    broker = events.PostgresBroker(TEST_DATABASE_URL)
+    q = broker.subscribe(events.LOBBY_CHANNEL)
+    assert broker.shared is False
+
+    broker.publish(events.LOBBY_CHANNEL, {'type': 'game_changed', 'game_id': 1})
+    assert q.get_nowait() == {'type': 'game_changed', 'game_id': 1}
@@ -0,0 +1,208 @@
+import threading
+
+from sqlalchemy import event
+
+from conftest import login, requires_db
+
+pytestmark = requires_db
+
+
+class QueryCounter:
+    """Counts the statements sent through db.engine while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _before_cursor_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+def start_game(app, make_user, make_dict, players, words, name='game'):
+    users = [make_user(f'{name}-player{i}') for i in range(players)]
+    dict_id = make_dict([(f'word{i}', f'词{i}') for i in range(words)])
+    client = app.app.test_client()
+    login(client, users[0])
+    game_id = client.post('/api/game/create', json={'dict_id': dict_id}).get_json()['game_id']
+    for user in users[1:]:
+        assert login(client, user).post(f'/api/game/{game_id}/join').status_code == 200
+    assert login(client, users[0]).post(f'/api/game/{game_id}/start').status_code == 200
+    return client, users, game_id
+
+
+def answer_turns(client, users, game_id, turns):
+    for _ in range(turns):
+        game = client.get(f'/api/game/{game_id}').get_json()['game']
+        user = next(u for u in users if u['id'] == game['next_turn'])
+        response = login(client, user).post(f'/api/game/{game_id}/answer', json={
+            'word_id': game['next_word']['id'], 'answer': game['next_word']['english']
+        })
+        assert response.status_code == 200
+
+
+def count_game_get_queries(client, database, game_id):
+    with QueryCounter(database.engine) as counter:
+        response = client.get(f'/api/game/{game_id}')
+    assert response.status_code == 200
+    return counter.count, response.get_json()['game']
+
+
+def test_game_get_query_count_does_not_grow_with_the_game(app, make_user, make_dict, database):
+    client, users, game_id = start_game(app, make_user, make_dict, players=2, words=5)
+    answer_turns(client, users, game_id, 2)
+    small, game = count_game_get_queries(client, database, game_id)
+    assert len(game['users']) == 2 and len(game['result']) == 2
+
+    client, users, game_id = start_game(app, make_user, make_dict, players=8, words=200, name='large')
+    answer_turns(client, users, game_id, 20)
+    large, game = count_game_get_queries(client, database, game_id)
+    assert len(game['users']) == 8 and len(game['result']) == 20
+
+    # One read for the game row (with dict and results) and one for its users;
+    # the words come from the dict cache filled by earlier requests
+    assert small == large
+    assert large <= 2
+
+
+def test_concurrent_answers_record_one_answer_per_turn(app, make_user, make_dict, database):
+    client, users, game_id = start_game(app, make_user, make_dict, players=3, words=4)
+    submits = 12
+    for turn in range(4):
+        game = client.get(f'/api/game/{game_id}').get_json()['game']
+        current = next(u for u in users if u['id'] == game['next_turn'])
+        # Most submits come from the player whose turn it is, the rest from the others
+        submitters = [current if i % 3 else users[i // 3 % len(users)] for i in range(submits)]
+        barrier = threading.Barrier(submits)
+        statuses = []
+
+        def submit(user):
+            own = login(app.app.test_client(), user)
+            barrier.wait()
+            response = own.post(f'/api/game/{game_id}/answer', json={
+                'word_id': game['next_word']['id'], 'answer': game['next_word']['english']
+            })
+            statuses.append(response.status_code)
+
+        threads = [threading.Thread(target=submit, args=(user,)) for user in submitters]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert statuses.count(200) == 1, statuses
+        assert set(statuses) <= {200, 400, 409}, statuses
+
+        row = database.fetchone("""
+            SELECT g.answer_count, count(a.seq) AS answers, count(DISTINCT a.seq) AS seqs
+            FROM "game" g LEFT JOIN game_answer a ON a.gameid = g.id
+            WHERE g.id = :id GROUP BY g.answer_count
+        """, {'id': game_id})
+        assert row == {'answer_count': turn + 1, 'answers': turn + 1, 'seqs': turn + 1}
+
+
+def test_game_list_etag_follows_the_filtered_games(app, make_user, make_dict, database):
+    client, users, game_id = start_game(app, make_user, make_dict, players=2, words=4)
+    reader = login(app.app.test_client(), users[0])
+    finished = reader.get('/api/game/list?status=1')
+    running = reader.get('/api/game/list?status=-1,0')
+
+    lobby = app.events.broker.subscribe(app.events.LOBBY_CHANNEL)
+    try:
+        answer_turns(client, users, game_id, 1)
+        assert lobby.empty()
+    finally:
+        app.events.broker.unsubscribe(app.events.LOBBY_CHANNEL, lobby)
+
+    # The answer changed a running game only
+    assert reader.get('/api/game/list?status=1', headers={'If-None-Match': finished.headers['ETag']}).status_code == 304
+    assert reader.get('/api/game/list?status=-1,0', headers={'If-None-Match': running.headers['ETag']}).status_code == 200
+
+    # Leaving the filter changes the ETag too
+    running = reader.get('/api/game/list?status=-1,0')
+    database.execute("""UPDATE "game" SET status = 1, version = nextval('game_version_seq') WHERE id = :id""", {'id': game_id})
+    assert reader.get('/api/game/list?status=-1,0', headers={'If-None-Match': running.headers['ETag']}).status_code == 200
+
+
+def test_game_end_marks_the_leaderboard_for_a_lazy_refresh(app, make_user, make_dict, database, monkeypatch):
+    client, users, game_id = start_game(app, make_user, make_dict, players=2, words=2)
+    answer_turns(client, users, game_id, 2)
+    database.execute('REFRESH MATERIALIZED VIEW leaderboard')
+    database.execute("UPDATE leaderboard_state SET dirty = false, refreshed_at = now()")
+
+    assert client.post(f'/api/game/{game_id}/end').status_code == 200
+    query = 'SELECT rating FROM leaderboard WHERE id = :id'
+    assert database.fetchone('SELECT dirty FROM leaderboard_state')['dirty']
+    assert database.fetchone(query, {'id': users[0]['id']})['rating'] == 0
+
+    # Refreshed at most once every LEADERBOARD_REFRESH_SECONDS
+    monkeypatch.setattr(app, '_leaderboard_checked', 0.0)
+    assert client.get('/leaderboard/').status_code == 200
+    assert database.fetchone(query, {'id': users[0]['id']})['rating'] == 0
+
+    monkeypatch.setattr(app, 'LEADERBOARD_REFRESH_SECONDS', 0.0)
+    assert client.get('/leaderboard/').status_code == 200
+    assert database.fetchone(query, {'id': users[0]['id']})['rating'] == 1
+    assert not database.fetchone('SELECT dirty FROM leaderboard_state')['dirty']
+
+
+def test_elo_ratings_are_stored_unrounded(app, make_user, make_dict, database, monkeypatch):
+    monkeypatch.setattr(app, 'rating_engine', app.rating.get_engine('elo'))
+    client, users, game_id = start_game(app, make_user, make_dict, players=3, words=3)
+    database.execute('UPDATE "user" SET rating = id * 10')
+    answer_turns(client, users, game_id, 1)
+    result = client.get(f'/api/game/{game_id}').get_json()['game']['result']
+    assert client.post(f'/api/game/{game_id}/end').status_code == 200
+
+    stored = {r['id']: r['rating'] for r in database.fetchall('SELECT id, rating FROM "user"')}
+    expected = app.rating.get_engine('elo').update(
+        {user['id']: app.rating.RatingState(user['id'] * 10) for user in users},
+        app.rating.game_performance([user['id'] for user in users], result)
+    )
+    assert stored == {user_id: state.rating for user_id, state in expected.items()}
+    assert any(rating != round(rating) for rating in stored.values())
+
+    # Shown rounded
+    shown = client.get(f"/api/user/{users[1]['id']}").get_json()
+    assert shown['user']['rating'] == round(stored[users[1]['id']])
+
+
+def test_game_words_written_behind_a_warm_cache(app, make_user, make_dict, database):
+    users = [make_user('cache-a'), make_user('cache-b')]
+    dict_id = make_dict([('apple', '苹果')])
+    app.get_dict_words(dict_id)
+
+    # Another instance adds a word and creates a game with it; this process's cache is not invalidated
+    word_id = database.insert_returning_id(
+        """INSERT INTO "word" (dictid, english, chinese) VALUES (:dictid, 'pear', '梨') RETURNING id""", {'dictid': dict_id})
+    game_id = database.insert_returning_id(
+        'INSERT INTO "game" (dictid, users, wordlist, status, ownerid) VALUES (:dictid, :users, :wordlist, 0, :owner) RETURNING id',
+        {'dictid': dict_id, 'users': database.encode_ids([u['id'] for u in users]),
+         'wordlist': database.encode_ids([word_id]), 'owner': users[0]['id']})
+
+    client = login(app.app.test_client(), users[0])
+    game = client.get(f'/api/game/{game_id}').get_json()['game']
+    assert [w['english'] for w in game['words']] == ['pear']
+    assert game['next_word'] == {'id': word_id, 'english': 'pear', 'chinese': '梨'}
+    response = client.post(f'/api/game/{game_id}/answer', json={'word_id': word_id, 'answer': 'pear'})
+    assert response.status_code == 200 and response.get_json()['correct']
+
+
+def test_game_list_etag_sees_a_write_that_commits_late(app, make_user, make_dict, database):
+    client, users, first = start_game(app, make_user, make_dict, players=2, words=2)
+    client, users, second = start_game(app, make_user, make_dict, players=2, words=2, name='other')
+    reader = login(app.app.test_client(), users[0])
+    bump = """UPDATE "game" SET version = nextval('game_version_seq') WHERE id = :id"""
+
+    with database.transaction() as tx:
+        # Takes a version first but commits after the write to the other game
+        tx.execute(bump, {'id': first})
+        database.execute(bump, {'id': second})
+        listed = reader.get('/api/game/list?status=-1,0')
+    assert reader.get('/api/game/list?status=-1,0', headers={'If-None-Match': listed.headers['ETag']}).status_code == 200
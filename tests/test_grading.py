@@ -0,0 +1,85 @@
+import itertools
+import random
+
+import pytest
+
+import grading
+
+
+def levenshtein(a, b):
+    row = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        prev, row[0] = row[0], i
+        for j, cb in enumerate(b, start=1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (ca != cb))
+    return row[-1]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Apple', 'apple'),
+    ("  Don't ", 'dont'),
+    ('DON’T', 'dont'),
+    ('café', 'cafe'),
+    ('Straße', 'strasse'),
+    ('ice-cream', 'ice cream'),
+    ('well...  done!', 'well done'),
+    ('ＡＢＣ', 'abc'),
+    ('?!', ''),
+])
+def test_normalize(text, expected):
+    assert grading.normalize(text) == expected
+
+
+def test_variants_split_alternatives_and_optional_parts():
+    assert grading.variants('yes, please') == {'yes please', 'yes', 'please'}
+    assert grading.variants('color/colour') == {'color colour', 'color', 'colour'}
+    assert grading.variants('big；large') == {'big large', 'big', 'large'}
+    assert grading.variants('(to) abandon') == {'to abandon', 'abandon'}
+    assert grading.variants('a | an') == {'a an', 'a', 'an'}
+
+
+def test_exact_grading_accepts_every_variant():
+    grader = grading.Grader(max_distance=0)
+    assert grader.grade('yes', 'yes, please')
+    assert grader.grade('Please', 'yes, please')
+    assert grader.grade('YES, please', 'yes, please')
+    assert grader.grade('abandon', '(to) abandon')
+    assert grader.grade('to abandon', '(to) abandon')
+    assert grader.grade("dont", "don't")
+    assert not grader.grade('yess', 'yes, please')
+    assert not grader.grade('', 'yes')
+    assert not grader.grade('   ', 'yes')
+
+
+def test_tolerance_scales_with_length():
+    grader = grading.Grader(max_distance=2, chars_per_edit=5)
+    # Under 5 characters: exact only
+    assert grader.grade('cat', 'cat')
+    assert not grader.grade('cut', 'cat')
+    # 5-9 characters: one edit
+    assert grader.grade('aple', 'apple')
+    assert not grader.grade('appel', 'apple')  # a transposition is two edits
+    assert not grader.grade('apxle2', 'apple')
+    # 10 or more characters: up to max_distance edits
+    assert grader.grade('enviroment', 'environment')
+    assert not grader.grade('enviromnet', 'environment')
+    assert grader.grade('envirnmant', 'environment')
+    # Capped at max_distance however long the word
+    assert not grader.grade('abcdefghijklmnopqrxxx', 'abcdefghijklmnopqrstu')
+
+
+def test_distance_cutoff_matches_levenshtein():
+    rng = random.Random(1)
+    words = [''.join(rng.choice('abc') for _ in range(rng.randint(0, 6))) for _ in range(60)]
+    for a, b in itertools.product(words[:30], words[30:]):
+        distance = levenshtein(a, b)
+        for k in range(4):
+            assert grading.within_distance(a, b, k) == (distance <= k), (a, b, k)
+
+
+def test_keys_are_cached():
+    grader = grading.Grader(max_distance=1, cache_size=2)
+    key = grader.key('apple/pear')
+    assert key.forms == {'apple pear', 'apple', 'pear'}
+    assert dict(key.tolerant) == {'apple pear': 1, 'apple': 1}
+    assert grader.key('apple/pear') is key
@@ -0,0 +1,24 @@
+import hashlib
+
+import passwords
+
+DIGEST = hashlib.sha256(b'secret123').hexdigest()
+
+
+def test_legacy_hashes_are_upgraded_to_the_slow_hasher(monkeypatch):
+    scrypt = passwords.ScryptHasher()
+    monkeypatch.setattr(passwords, 'hasher', scrypt)
+
+    assert passwords.needs_rehash(passwords.Sha256Hasher().hash(DIGEST))
+    assert not passwords.needs_rehash(scrypt.hash(DIGEST))
+
+    assert passwords.needs_rehash(passwords.ScryptHasher(n=scrypt.n // 2).hash(DIGEST))
+
+
+def test_slow_hashes_are_never_downgraded(monkeypatch):
+    monkeypatch.setattr(passwords, 'hasher', passwords.Sha256Hasher())
+
+    stored = passwords.ScryptHasher().hash(DIGEST)
+    assert passwords.verify(DIGEST, stored)
+    assert not passwords.needs_rehash(stored)
+    assert not passwords.needs_rehash(passwords.Sha256Hasher().hash(DIGEST))
@@ -0,0 +1,102 @@
+import pytest
+
+import search
+from conftest import requires_db
+
+WORDS = [
+    ('apple', '苹果'), ('Apple pie', '苹果派'), ('application', '应用'), ('pineapple', '菠萝'),
+    ('apply', '申请'), ('maple', '枫树'), ('grape', '葡萄'), ('banana', '香蕉'), ('appl', '缩写'),
+]
+QUERIES = [('prefix', 'app'), ('prefix', 'apple'), ('fuzzy', 'apple'), ('fuzzy', 'appel'),
+           ('fuzzy', 'ple'), ('fuzzy', '苹果'), ('fuzzy', '果'), ('fuzzy', 'a'), ('fuzzy', 'zzz')]
+
+
+def cached(words, dict_id=1):
+    active = [{'id': i, 'dictid': dict_id, 'english': english, 'chinese': chinese, 'deleted': False}
+              for i, (english, chinese) in enumerate(words, start=1) if english is not None]
+    return {'exists': True, 'words': {w['id']: w for w in active}, 'active': active}
+
+
+def english(backend, q, mode, limit=20, offset=0, dict_id=1):
+    page, has_more = backend.search(dict_id, q, mode, limit, offset)
+    return [w['english'] for w in page], has_more
+
+
+def test_prefix_is_ordered_by_lowercase_english():
+    backend = search.MemoryBackend(lambda dict_id: cached(WORDS))
+    assert english(backend, 'app', 'prefix') == (['appl', 'apple', 'Apple pie', 'application', 'apply'], False)
+    assert english(backend, 'app', 'prefix', limit=2) == (['appl', 'apple'], True)
+    assert english(backend, 'app', 'prefix', limit=2, offset=4) == (['apply'], False)
+
+
+def test_fuzzy_ranks_exact_prefix_substring_then_similar():
+    backend = search.MemoryBackend(lambda dict_id: cached(WORDS))
+    # Exact and prefix matches first, then substrings, then similar words
+    assert english(backend, 'apple', 'fuzzy')[0] == ['apple', 'Apple pie', 'pineapple', 'appl', 'apply']
+    assert english(backend, 'ple', 'fuzzy')[0] == ['apple', 'Apple pie', 'maple', 'pineapple']
+    assert english(backend, '果', 'fuzzy')[0] == ['apple', 'Apple pie']
+    # Below WORD_SEARCH_SIMILARITY nothing is returned
+    assert english(backend, 'zzz', 'fuzzy') == ([], False)
+
+
+def test_similar_words_are_ordered_by_similarity():
+    index = search.WordIndex(cached(WORDS)['active'])
+    similar = index.similar('appel', 0.0)
+    ranked = sorted(similar, key=lambda i: -similar[i])
+    assert index.words[ranked[0]][0]['english'] in ('appl', 'apple')
+    assert all(0 < similarity <= 1 for similarity in similar.values())
+    # pg_trgm: 'appel' and 'apple' share "  a", " ap", "app" of 9 distinct trigrams
+    assert similar[1] == pytest.approx(3 / 9)
+
+
+def test_updated_index_matches_a_rebuilt_one():
+    # Large enough for three changes to be updated in place
+    words = WORDS + [(f'filler{i}', '填充') for i in range(40)]
+    state = {'cached': cached(words)}
+    backend = search.MemoryBackend(lambda dict_id: state['cached'])
+    index = backend.index(1)
+
+    words[0] = ('appetite', '食欲')          # edited
+    words[3] = (None, None)                   # deleted
+    words.append(('grapefruit', '西柚'))      # added
+    state['cached'] = cached(words)
+
+    assert backend.index(1) is index
+    rebuilt = search.MemoryBackend(lambda dict_id: state['cached'])
+    for mode, q in QUERIES + [('fuzzy', 'grape'), ('fuzzy', 'appet'), ('fuzzy', '菠萝')]:
+        assert english(backend, q, mode) == english(rebuilt, q, mode), (mode, q)
+    assert index.keys == rebuilt.index(1).keys
+
+    # Too many changes: rebuilt rather than updated
+    state['cached'] = cached([(e and e.upper(), c) for e, c in words])
+    assert backend.index(1) is not index
+    assert backend.stats() == {'dicts': 1, 'words': len(words) - 1}
+
+
+def test_indexes_are_bounded_by_indexed_words():
+    dicts = {dict_id: cached(WORDS, dict_id) for dict_id in (1, 2, 3)}
+    backend = search.MemoryBackend(dicts.get, max_words=2 * len(WORDS))
+    first = backend.index(1)
+    backend.index(2)
+    backend.index(1)
+    backend.index(3)
+    # The least recently searched dict was dropped
+    assert backend.stats() == {'dicts': 2, 'words': 2 * len(WORDS)}
+    assert backend.index(1) is first
+
+    # A dict larger than the bound is still searched
+    small = search.MemoryBackend(dicts.get, max_words=1)
+    assert english(small, 'apple', 'prefix', dict_id=2)[0] == ['apple', 'Apple pie']
+    assert small.stats() == {'dicts': 1, 'words': len(WORDS)}
+
+
+@requires_db
+def test_memory_backend_matches_pg_trgm(app, make_dict, database):
+    if not database.fetchone("SELECT extname FROM pg_extension WHERE extname = 'pg_trgm'"):
+        pytest.skip('pg_trgm is not installed')
+    dict_id = make_dict(WORDS)
+    memory = search.MemoryBackend(app.get_dict_words)
+    postgres = search.PostgresBackend()
+    for mode, q in QUERIES:
+        for limit, offset in ((20, 0), (2, 1)):
+            assert english(memory, q, mode, limit, offset, dict_id) == english(postgres, q, mode, limit, offset, dict_id), (mode, q)
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+import sessions
+from conftest import login, requires_db
+
+USER = {'id': 7, 'username': 'alice', 'type': 'normal', 'token_version': 2}
+
+
+@pytest.fixture
+def revocations(monkeypatch):
+    # An in-memory list that is never refreshed from the database
+    revocations = sessions.RevocationList()
+    revocations._refreshed = time.monotonic()
+    monkeypatch.setattr(sessions, 'REVOCATION_REFRESH_SECONDS', float('inf'))
+    monkeypatch.setattr(sessions, 'revocations', revocations)
+    return revocations
+
+
+def test_issued_token_verifies(revocations):
+    assert sessions.verify(sessions.issue(USER)) == USER
+
+
+def test_tampered_token_is_rejected(revocations):
+    payload, signature = sessions.issue(USER).split('.')
+    forged = sessions.issue(dict(USER, type='root')).split('.')[0]
+    assert sessions.verify(f'{forged}.{signature}') is None
+    assert sessions.verify(f'{payload}.{signature[:-2]}AA') is None
+    assert sessions.verify(f'{payload}.') is None
+    assert sessions.verify(payload) is None
+    assert sessions.verify('') is None
+
+
+def test_expired_token_is_rejected(revocations, monkeypatch):
+    monkeypatch.setattr(sessions, 'TTL', -1)
+    assert sessions.verify(sessions.issue(USER)) is None
+
+
+def test_token_version_bump_revokes_older_tokens(revocations):
+    old = sessions.issue(USER)
+    revocations.add(USER['id'], 3)
+    assert sessions.verify(old) is None
+    assert sessions.verify(sessions.issue(dict(USER, token_version=3)))['token_version'] == 3
+    # Other users are unaffected
+    assert sessions.verify(sessions.issue(dict(USER, id=8))) is not None
+
+
+@requires_db
+def test_session_cookie_is_secure_behind_a_tls_proxy(app, make_user):
+    user = make_user('secure')
+    client = login(app.app.test_client(), user)
+    cookie = client.post('/api/verify', headers={'X-Forwarded-Proto': 'https'}).headers['Set-Cookie']
+    assert cookie.startswith(sessions.COOKIE_NAME + '=') and 'Secure' in cookie and 'HttpOnly' in cookie
+
+    client = login(app.app.test_client(), user)
+    assert 'Secure' not in client.post('/api/verify').headers['Set-Cookie']
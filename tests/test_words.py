@@ -0,0 +1,48 @@
+import threading
+import time
+
+from conftest import login, requires_db
+
+pytestmark = requires_db
+
+
+def words_since(client, dict_id, since):
+    data = client.get(f'/api/dict/{dict_id}/words?since={since}').get_json()
+    return {w['id']: w for w in data['words']}, data['version']
+
+
+def test_since_reads_writes_the_cache_has_not_seen(app, make_user, make_dict, database):
+    client = login(app.app.test_client(), make_user('reader'))
+    dict_id = make_dict([('apple', '苹果'), ('pear', '梨')])
+    words, version = words_since(client, dict_id, 0)
+    assert len(words) == 2
+    app.get_dict_words(dict_id)
+
+    # Written by another instance: this process's word cache is not invalidated
+    database.execute("""UPDATE "word" SET chinese = '苹', version = nextval('word_version_seq') WHERE english = 'apple'""")
+    words, latest = words_since(client, dict_id, version)
+    assert [w['chinese'] for w in words.values()] == ['苹'] and latest > version
+
+
+def test_since_does_not_skip_a_write_that_commits_late(app, make_user, make_dict, database):
+    client = login(app.app.test_client(), make_user('reader'))
+    dict_id = make_dict([('apple', '苹果'), ('pear', '梨')])
+    words, version = words_since(client, dict_id, 0)
+    apple, pear = sorted(words)
+
+    with database.transaction() as tx:
+        # Takes a version first but commits after the edit below
+        app.lock_dict(tx, dict_id)
+        tx.execute("""UPDATE "word" SET chinese = '苹', version = nextval('word_version_seq') WHERE id = :id""", {'id': apple})
+
+        edit = threading.Thread(target=lambda: login(app.app.test_client(), make_user('editor')).put(
+            f'/api/word/{pear}', json={'english': 'pear', 'chinese': '梨子'}))
+        edit.start()
+        time.sleep(0.2)
+        assert edit.is_alive()
+        assert words_since(client, dict_id, version) == ({}, version)
+    edit.join()
+
+    words, latest = words_since(client, dict_id, version)
+    assert {w['chinese'] for w in words.values()} == {'苹', '梨子'}
+    assert words_since(client, dict_id, latest) == ({}, latest)